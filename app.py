@@ -2,28 +2,103 @@ import os
 import time
 import json
 import io
+import csv
+import datetime
+import tempfile
 import sqlite3
-from flask import Flask, render_template_string, request, jsonify, make_response, session, redirect, url_for
+import re
+import hashlib
+import hmac
+import base64
+import gzip
+import queue
+import threading
+import zlib
+from concurrent.futures import Future
+from flask import Flask, request, jsonify, make_response, session, redirect, url_for, g, Response, stream_with_context, has_app_context
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.security import generate_password_hash, check_password_hash
 import openpyxl
-from collections import defaultdict
+from collections import Counter, defaultdict, OrderedDict
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# ضغط brotli اختياري؛ يُكتفى بـ gzip إذا لم تكن المكتبة مثبتة
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# مخزن redis اختياري لمشاركة ذاكرة الشحنات المؤقتة بين العمليات العاملة
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# ترميز JSON السريع اختياري؛ يُستخدم ترميز المكتبة القياسية إذا لم تكن مثبتة
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class CompactJSONProvider(DefaultJSONProvider):
+    """
+    ترميز JSON مضغوط بلا مسافات ولا ترتيب للمفاتيح، ويُبقي النص العربي كما هو بدل \\uXXXX.
+    يستخدم orjson عند توفره لترميز الاستجابات وقراءة الطلبات.
+    """
+
+    ensure_ascii = False
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 # تهيئة تطبيق فلاسك
 app = Flask(__name__)
+app.json = CompactJSONProvider(app)
 # مفتاح سري ضروري لإدارة الجلسات
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a_very_secret_key_for_brako_app')
 
 # اسم ملف قاعدة البيانات
-DATABASE_FILE = 'database.db'
+DATABASE_FILE = os.environ.get('DATABASE_FILE', 'database.db')
+# عدد الاتصالات الخاملة التي يحتفظ بها المجمع لإعادة استخدامها
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+# مدة انتظار قفل الكتابة بالمللي ثانية قبل الإبلاغ عن "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+# الحد الأقصى لعدد عمليات الكتابة التي يجمعها خيط الكتابة في معاملة واحدة
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 100))
+# أوامر PRAGMA التي تُنفذ مرة واحدة عند فتح كل اتصال جديد
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}',
+    'PRAGMA synchronous = NORMAL',
+    f"PRAGMA mmap_size = {int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))}",
+    f"PRAGMA cache_size = {int(os.environ.get('DB_CACHE_SIZE', -64000))}",
+    'PRAGMA foreign_keys = ON',
+)
 # بيانات اعتماد المسؤول مع كلمة مرور مشفرة
 ADMIN_CREDENTIALS = {'username': 'brako', 'password_hash': generate_password_hash('1988')}
 
-def setup_database():
+def setup_database(database_file=None):
     """
     تقوم بتهيئة قاعدة البيانات وإنشاء الجداول اللازمة إذا لم تكن موجودة بالفعل.
     هذا يضمن عدم فقدان البيانات عند إعادة تشغيل التطبيق.
     """
-    conn = sqlite3.connect(DATABASE_FILE)
+    conn = sqlite3.connect(database_file or DATABASE_FILE)
     c = conn.cursor()
     
     # إنشاء جدول جهات الاتصال (للمرسلين والمستلمين)
@@ -84,14 +159,1608 @@ def setup_database():
     ''')
 
     conn.commit()
+    run_migrations(conn)
     conn.close()
 
-def get_db_connection():
-    """ينشئ اتصالاً بقاعدة البيانات ويعيده."""
-    conn = sqlite3.connect(DATABASE_FILE)
+# توحيد الحروف العربية المتشابهة وحذف التشكيل والتطويل قبل الفهرسة والبحث
+ARABIC_NORMALIZATION = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي',
+    'ة': 'ه',
+    **{chr(code): '' for code in range(0x064B, 0x0653)},
+    '\u0670': '', 'ـ': '',
+}
+ARABIC_NORMALIZATION_TABLE = str.maketrans(ARABIC_NORMALIZATION)
+
+def normalize_arabic(text):
+    """يطبق توحيد الحروف العربية على نص البحث بنفس طريقة الفهرس."""
+    return (text or '').translate(ARABIC_NORMALIZATION_TABLE)
+
+def normalize_arabic_sql(expression):
+    """يعيد تعبير SQL يطبق توحيد الحروف العربية نفسه باستخدام replace() المتداخلة."""
+    expression = f"coalesce({expression}, '')"
+    for source, target in ARABIC_NORMALIZATION.items():
+        expression = f"replace({expression}, '{source}', '{target}')"
+    return expression
+
+# أعمدة فهرس البحث النصي وأوزانها في ترتيب النتائج (bm25)
+SEARCH_COLUMNS = (
+    ('shipmentNumber', 's.shipmentNumber', 10.0),
+    ('invoiceNumber', 's.invoiceNumber', 10.0),
+    ('trackingCode', 's.trackingCode', 10.0),
+    ('sender_name', 'sender.name', 3.0),
+    ('sender_phone', "sender.phone || ' ' || replace(sender.phone, ' ', '')", 5.0),
+    ('sender_city', 'sender.city', 1.0),
+    ('receiver_name', 'receiver.name', 3.0),
+    ('receiver_phone', "receiver.phone || ' ' || replace(receiver.phone, ' ', '')", 5.0),
+    ('receiver_city', 'receiver.city', 1.0),
+    ('contents', 's.contents', 1.0),
+)
+
+# الحد الافتراضي والأقصى لعدد نتائج البحث
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 200
+
+def _search_index_insert(source_where):
+    """يبني جملة إدراج صفوف الشحنات المطابقة للشرط في فهرس البحث النصي."""
+    return f'''
+        INSERT INTO shipments_fts (rowid, {', '.join(name for name, _, _ in SEARCH_COLUMNS)})
+        SELECT s.id, {', '.join(normalize_arabic_sql(expression) for _, expression, _ in SEARCH_COLUMNS)}
+        FROM shipments s
+        LEFT JOIN contacts sender ON sender.id = s.sender_id
+        LEFT JOIN contacts receiver ON receiver.id = s.receiver_id
+        {source_where};
+    '''
+
+# أبعاد جدول الإحصاءات التراكمية؛ كل صف يجمع عدد الشحنات وإيراداتها لتركيبة واحدة من هذه القيم
+STATS_DIMENSIONS = ('branch', 'currency', 'status', 'date')
+# حالة الشحنة التي تُحتسب في لوحة المعلومات كشحنة جاهزة للاستلام
+DELIVERED_STATUS = 'ready_pickup'
+
+# الإيراد في جدول الإحصاءات: (عمود الإيراد، عمود الشحنة الذي يُجمع، تعبير قيمته).
+# الترحيل 3 جمع السعر النهائي REAL، ثم صار الإيراد يُجمع من السعر النهائي بالوحدات الصغرى الصحيحة
+_REAL_REVENUE = ('revenue', 'finalPrice', 'coalesce(CAST({row}.finalPrice AS REAL), 0)')
+_MINOR_REVENUE = ('revenueMinor', 'finalPriceMinor', '{row}.finalPriceMinor')
+
+def _stats_add(row, sign, revenue=_MINOR_REVENUE):
+    """يبني جملة تضيف صف الشحنة (new أو old) إلى جدول الإحصاءات أو تطرحه منه."""
+    column, _, amount = revenue
+    keys = ', '.join(f"coalesce({row}.{dimension}, '')" for dimension in STATS_DIMENSIONS)
+    return f'''
+        INSERT INTO shipment_stats ({', '.join(STATS_DIMENSIONS)}, shipments, {column})
+        VALUES ({keys}, {sign}1, {sign}{amount.format(row=row)})
+        ON CONFLICT ({', '.join(STATS_DIMENSIONS)}) DO UPDATE SET
+            shipments = shipments + excluded.shipments,
+            {column} = {column} + excluded.{column};
+    '''
+
+_STATS_CLEANUP = 'DELETE FROM shipment_stats WHERE shipments <= 0;'
+
+# بادئة كود التتبع لكل فرع؛ لكل بادئة تسلسل مستقل في جدول tracking_sequences
+TRACKING_PREFIXES = {'topeka': 'TOP'}
+DEFAULT_TRACKING_PREFIX = 'BRA'
+TRACKING_SEQUENCE_DIGITS = 8
+
+def tracking_check_digit(digits):
+    """يحسب خانة التحقق (Luhn) لسلسلة أرقام، فتُكتشف أخطاء إدخال رقم واحد أو تبديل رقمين متجاورين."""
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+def allocate_tracking_codes(c, branch, count):
+    """
+    يحجز count رقمًا متتاليًا من تسلسل فرع الشحنة ويعيد أكواد التتبع: البادئة + 8 أرقام + خانة تحقق.
+    يجب استدعاؤها داخل معاملة الكتابة، فقفل الكتابة في SQLite يضمن عدم تكرار الرقم حتى بين عدة عمليات.
+    """
+    prefix = TRACKING_PREFIXES.get(branch, DEFAULT_TRACKING_PREFIX)
+    last_value = c.execute('''
+        INSERT INTO tracking_sequences (prefix, last_value) VALUES (?, ?)
+        ON CONFLICT (prefix) DO UPDATE SET last_value = last_value + excluded.last_value
+        RETURNING last_value
+    ''', (prefix, count)).fetchone()[0]
+    codes = []
+    for sequence in range(last_value - count + 1, last_value + 1):
+        digits = f'{sequence:0{TRACKING_SEQUENCE_DIGITS}d}'
+        codes.append(prefix + digits + tracking_check_digit(digits))
+    return codes
+
+def allocate_tracking_code(c, branch):
+    """يحجز كود تتبع واحدًا من تسلسل فرع الشحنة."""
+    return allocate_tracking_codes(c, branch, 1)[0]
+
+# كود بصيغة المولّد نفسها (البادئة + 8 أرقام + خانة تحقق)
+TRACKING_CODE_PATTERN = re.compile(
+    '(' + '|'.join(map(re.escape, {*TRACKING_PREFIXES.values(), DEFAULT_TRACKING_PREFIX})) + ')'
+    + rf'(\d{{{TRACKING_SEQUENCE_DIGITS}}})(\d)'
+)
+
+def reserve_tracking_codes(c, codes):
+    """
+    يقدّم تسلسل كل بادئة إلى ما بعد الأكواد المعطاة التي يمكن للمولّد إنتاجها، فلا يعيد توليدها لاحقًا.
+    يجب استدعاؤها داخل عملية الكتابة التي تدرج هذه الأكواد.
+    """
+    last_values = {}
+    for code in codes:
+        match = TRACKING_CODE_PATTERN.fullmatch(code)
+        if match and tracking_check_digit(match.group(2)) == match.group(3):
+            prefix, sequence = match.group(1), int(match.group(2))
+            last_values[prefix] = max(last_values.get(prefix, 0), sequence)
+    c.executemany('''
+        INSERT INTO tracking_sequences (prefix, last_value) VALUES (?, ?)
+        ON CONFLICT (prefix) DO UPDATE SET last_value = MAX(last_value, excluded.last_value)
+    ''', last_values.items())
+
+def _reassign_duplicate_tracking_codes(conn):
+    """يمنح كل شحنة يتكرر كود تتبعها (عدا أقدمها) كودًا جديدًا من التسلسل قبل إنشاء الفهرس الفريد."""
+    duplicates = conn.execute('''
+        SELECT id, branch FROM shipments
+        WHERE trackingCode IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM shipments WHERE trackingCode IS NOT NULL GROUP BY trackingCode
+        )
+        ORDER BY id
+    ''').fetchall()
+    c = conn.cursor()
+    for shipment_id, branch in duplicates:
+        c.execute('UPDATE shipments SET trackingCode = ? WHERE id = ?',
+                  (allocate_tracking_code(c, branch), shipment_id))
+
+# الحد الأدنى للوزن المحتسب في السعر الأساسي (كغ)
+MIN_BILLABLE_WEIGHT = Decimal(10)
+# عدد الوحدات الصغرى في وحدة العملة؛ تُحسب الأسعار وتُخزن كأعداد صحيحة منها لتفادي أخطاء التقريب
+MINOR_UNITS = 100
+# أعمدة الأسعار المحسوبة بالوحدات الصغرى؛ السعر النهائي مجموع ما قبله دائمًا، وpriceAdjustmentMinor
+# فرق السعر المدفوع فعلًا عن السعر المحسوب للشحنات القديمة (صفر للشحنات المسعّرة بالقواعد الحالية)
+PRICE_COLUMNS = ('basePriceMinor', 'insuranceCostMinor', 'packagingCostMinor', 'priceAdjustmentMinor', 'finalPriceMinor')
+# أعمدة الأسعار التي أضافها الترحيل 6 وملأها _backfill_prices، قبل إضافة priceAdjustmentMinor
+_BACKFILLED_PRICE_COLUMNS = ('basePriceMinor', 'insuranceCostMinor', 'packagingCostMinor', 'finalPriceMinor')
+# الأعمدة التي يعيدها price_shipment بترتيبها
+PRICED_COLUMNS = ('quantity', 'weight', 'unitPrice', 'insuranceCost', 'packagingCost', 'finalPrice') + PRICE_COLUMNS
+
+def _to_decimal(value):
+    """يحول القيمة إلى Decimal، ويعيد None للقيم الفارغة أو غير الصالحة."""
+    if value is None or isinstance(value, bool) or str(value).strip() == '':
+        return None
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+def to_minor_units(amount):
+    """يحول مبلغًا إلى عدد صحيح من الوحدات الصغرى مع التقريب إلى الأقرب."""
+    return int((amount * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def format_minor_units(minor):
+    """ينسق مبلغًا بالوحدات الصغرى كنص بخانتين عشريتين (مثل 55.00)."""
+    return f'{Decimal(minor or 0) / MINOR_UNITS:.2f}'
+
+def price_shipment(shipment, charged=None):
+    """
+    يحسب أسعار الشحنة عند الكتابة ويعيد قيم الأعمدة المخزنة: العدد والوزن وسعر الوحدة كأرقام،
+    والسعر الأساسي وتكلفة التأمين والتغليف والسعر النهائي بالوحدات الصغرى وبالعملة.
+    القيم الفارغة أو غير الصالحة تُحتسب صفرًا في الأسعار. إذا مُرر charged (السعر المدفوع فعلًا لشحنة
+    مستوردة) يبقى هو السعر النهائي، ويُسجل فرقه عن السعر المحسوب في priceAdjustmentMinor.
+    """
+    quantity = _to_decimal(shipment.get('quantity'))
+    weight = _to_decimal(shipment.get('weight'))
+    unit_price = _to_decimal(shipment.get('unitPrice'))
+
+    # السعر الأساسي حسب الوزن مع فرض 10 كغ كحد أدنى، ولا سعر أساسي بدون وزن
+    base_price = 0
+    if weight and weight > 0:
+        base_price = to_minor_units(max(weight, MIN_BILLABLE_WEIGHT) * (unit_price or 0))
+    insurance_cost = to_minor_units(_to_decimal(shipment.get('insuranceCost')) or Decimal(0))
+    packaging_cost = to_minor_units(_to_decimal(shipment.get('packagingCost')) or Decimal(0))
+    final_price = base_price + insurance_cost + packaging_cost
+    adjustment = 0
+    charged = _to_decimal(charged)
+    if charged is not None:
+        adjustment = to_minor_units(charged) - final_price
+        final_price += adjustment
+
+    return {
+        'quantity': int(quantity) if quantity is not None else None,
+        'weight': float(weight) if weight is not None else None,
+        'unitPrice': float(unit_price) if unit_price is not None else None,
+        'insuranceCost': insurance_cost / MINOR_UNITS,
+        'packagingCost': packaging_cost / MINOR_UNITS,
+        'finalPrice': final_price / MINOR_UNITS,
+        'basePriceMinor': base_price,
+        'insuranceCostMinor': insurance_cost,
+        'packagingCostMinor': packaging_cost,
+        'priceAdjustmentMinor': adjustment,
+        'finalPriceMinor': final_price,
+    }
+
+def _backfill_prices(conn):
+    """
+    يحول الأعداد المخزنة كنصوص إلى أنواعها ويملأ أعمدة الأسعار بالوحدات الصغرى للشحنات الموجودة.
+    المبالغ المخزنة (ومنها السعر النهائي الذي دُفع فعلًا) تبقى بقيمتها ولا يُعاد حسابها بقواعد التسعير الحالية،
+    فلا تتغير الإيرادات السابقة؛ finalPriceMinor يُؤخذ من السعر النهائي المخزن، ويسجل الترحيل 9 فرقه
+    عن مجموع المكونات في priceAdjustmentMinor.
+    """
+    inputs = ('quantity', 'weight', 'unitPrice', 'insuranceCost', 'packagingCost')
+    amounts = ('insuranceCost', 'packagingCost', 'finalPrice')
+    columns = inputs + ('finalPrice',) + _BACKFILLED_PRICE_COLUMNS
+    rows = conn.execute(f"SELECT id, {', '.join(inputs)}, finalPrice FROM shipments").fetchall()
+    updates = []
+    for row in rows:
+        prices = price_shipment(dict(zip(inputs, row[1:])))
+        stored = dict(zip(inputs + ('finalPrice',), row[1:]))
+        for column in amounts:
+            amount = _to_decimal(stored[column])
+            prices[column] = float(amount) if amount is not None else stored[column]
+        prices['finalPriceMinor'] = to_minor_units(_to_decimal(stored['finalPrice']) or Decimal(0))
+        updates.append(tuple(prices[column] for column in columns) + (row[0],))
+    conn.executemany(
+        f"UPDATE shipments SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?", updates)
+
+def _stats_triggers(revenue=_MINOR_REVENUE):
+    """يبني مشغلات تبقي جدول الإحصاءات متزامنًا مع كل إدراج وتعديل وحذف للشحنات."""
+    return (
+        f'''CREATE TRIGGER IF NOT EXISTS shipment_stats_insert AFTER INSERT ON shipments BEGIN
+            {_stats_add('new', '+', revenue)}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS shipment_stats_update
+        AFTER UPDATE OF {', '.join(STATS_DIMENSIONS)}, {revenue[1]} ON shipments BEGIN
+            {_stats_add('old', '-', revenue)}
+            {_stats_add('new', '+', revenue)}
+            {_STATS_CLEANUP}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS shipment_stats_delete AFTER DELETE ON shipments BEGIN
+            {_stats_add('old', '-', revenue)}
+            {_STATS_CLEANUP}
+        END''',
+    )
+
+# عدد سجلات التغيير التي يُحتفظ بها؛ العميل الأقدم منها يحصل على 410 ويعيد تحميل الشحنات كاملة
+CHANGE_LOG_RETENTION = 1000000
+# يُحذف ما تجاوز حد الاحتفاظ مرة كل هذا العدد من السجلات
+CHANGE_LOG_PRUNE_EVERY = 10000
+
+def _log_change(shipment_id, kind):
+    """يبني جملة تسجل تغيير شحنة في سجل التغييرات (upsert أو delete)."""
+    return f"INSERT INTO shipment_changes (shipment_id, kind) VALUES ({shipment_id}, '{kind}');"
+
+# مشغلات تسجل كل تغيير في الشحنات أو سجل حالاتها أو جهات اتصالها في سجل التغييرات،
+# ضمن معاملة الكتابة نفسها فلا يُفقد تغيير ولا يُسجل تغيير لم يُثبت
+_CHANGE_LOG_TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS shipment_changes_insert AFTER INSERT ON shipments BEGIN
+        {_log_change('new.id', 'upsert')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS shipment_changes_update AFTER UPDATE ON shipments BEGIN
+        {_log_change('new.id', 'upsert')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS shipment_changes_delete AFTER DELETE ON shipments BEGIN
+        {_log_change('old.id', 'delete')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS shipment_changes_status AFTER INSERT ON status_updates BEGIN
+        {_log_change('new.shipment_id', 'upsert')}
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS shipment_changes_contact
+    AFTER UPDATE OF name, phone, country, city, address ON contacts BEGIN
+        INSERT INTO shipment_changes (shipment_id, kind)
+        SELECT id, 'upsert' FROM shipments WHERE sender_id = new.id
+        UNION SELECT id, 'upsert' FROM shipments WHERE receiver_id = new.id;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS shipment_changes_prune
+    AFTER INSERT ON shipment_changes WHEN new.seq % {CHANGE_LOG_PRUNE_EVERY} = 0 BEGIN
+        DELETE FROM shipment_changes WHERE seq <= new.seq - {CHANGE_LOG_RETENTION};
+    END''',
+)
+
+def normalize_phone(phone):
+    """يعيد مفتاح جهة الاتصال من رقم الهاتف: الأرقام فقط دون بادئة 00 الدولية، أو None إذا لم يكن فيه أرقام."""
+    digits = re.sub(r'\D', '', str(phone or ''))
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return digits or None
+
+# يُحدِّث جهة الاتصال ذات المفتاح نفسه فقط إذا تغيرت بياناتها، فلا يُعاد فهرسة شحناتها دون داعٍ
+CONTACT_UPSERT = '''
+    INSERT INTO contacts (name, phone, country, city, address, phone_key) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (phone_key) DO UPDATE SET
+        name = excluded.name, phone = excluded.phone, country = excluded.country,
+        city = excluded.city, address = excluded.address
+    WHERE name IS NOT excluded.name OR phone IS NOT excluded.phone OR country IS NOT excluded.country
+        OR city IS NOT excluded.city OR address IS NOT excluded.address
+'''
+
+def upsert_contact(c, contact):
+    """
+    يعيد معرّف جهة الاتصال ذات رقم الهاتف نفسه بعد تحديثها بآخر البيانات، أو ينشئها إذا لم تكن موجودة.
+    جهة الاتصال بدون رقم هاتف تُنشأ دائمًا كصف جديد.
+    """
+    values = tuple(contact.get(field) for field in CONTACT_FIELDS)
+    phone_key = normalize_phone(contact.get('phone'))
+    if phone_key is None:
+        c.execute('INSERT INTO contacts (name, phone, country, city, address) VALUES (?, ?, ?, ?, ?)', values)
+        return c.lastrowid
+    row = c.execute(CONTACT_UPSERT + ' RETURNING id', values + (phone_key,)).fetchone()
+    if row is None:
+        # لم تتغير بيانات جهة الاتصال فلم يُنفذ التحديث ولم يُعد معرّفها
+        row = c.execute('SELECT id FROM contacts WHERE phone_key = ?', (phone_key,)).fetchone()
+        return row[0]
+    # أُنشئت جهة الاتصال أو تغيرت بياناتها: تُبطل الشحنات المخزنة التي تعرضها
+    c.execute('SELECT id FROM shipments WHERE sender_id = ? UNION SELECT id FROM shipments WHERE receiver_id = ?',
+              (row[0], row[0]))
+    invalidate_cached_shipments(shipment_row[0] for shipment_row in c.fetchall())
+    return row[0]
+
+def delete_orphan_contacts(c, contact_ids):
+    """يحذف جهات الاتصال المحددة التي لم تعد أي شحنة تشير إليها."""
+    c.execute('''
+        DELETE FROM contacts
+        WHERE id IN (SELECT value FROM json_each(?))
+          AND NOT EXISTS (SELECT 1 FROM shipments WHERE sender_id = contacts.id)
+          AND NOT EXISTS (SELECT 1 FROM shipments WHERE receiver_id = contacts.id)
+    ''', (json.dumps(list(contact_ids)),))
+
+def compact_contacts(conn):
+    """
+    يملأ مفتاح الهاتف لكل جهات الاتصال ثم يدمج المكررة في أحدثها: تُعاد كتابة sender_id و receiver_id
+    في الشحنات إلى جهة الاتصال المحتفظ بها، وتُحذف المكررة وجهات الاتصال التي لا تشير إليها أي شحنة.
+    """
+    c = conn.cursor()
+    contacts = [(contact_id, normalize_phone(phone))
+                for contact_id, phone in c.execute('SELECT id, phone FROM contacts ORDER BY id').fetchall()]
+    c.executemany('UPDATE contacts SET phone_key = ? WHERE id = ?',
+                  [(phone_key, contact_id) for contact_id, phone_key in contacts])
+
+    # الصفوف مرتبة حسب المعرّف، فآخر معرّف لكل مفتاح هو الأحدث
+    latest_ids = {phone_key: contact_id for contact_id, phone_key in contacts if phone_key}
+    merges = [(contact_id, latest_ids[phone_key]) for contact_id, phone_key in contacts
+              if phone_key and contact_id != latest_ids[phone_key]]
+    for role in ('sender', 'receiver'):
+        c.executemany(f'UPDATE shipments SET {role}_id = ? WHERE {role}_id = ?',
+                      [(keep_id, duplicate_id) for duplicate_id, keep_id in merges])
+    c.execute('''
+        DELETE FROM contacts
+        WHERE id NOT IN (SELECT sender_id FROM shipments WHERE sender_id IS NOT NULL)
+          AND id NOT IN (SELECT receiver_id FROM shipments WHERE receiver_id IS NOT NULL)
+    ''')
+
+# ترحيلات المخطط مرتبة حسب الإصدار؛ كل عنصر قائمة خطوات (جملة SQL أو دالة تستقبل الاتصال).
+# يُخزَّن آخر إصدار مطبق في PRAGMA user_version، لذا يجب إضافة الترحيلات الجديدة في نهاية القائمة فقط.
+MIGRATIONS = [
+    # 1: فهارس البحث وربط سجل الحالات بالشحنات
+    [
+        'CREATE INDEX IF NOT EXISTS idx_status_updates_shipment_id ON status_updates (shipment_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_tracking_code ON shipments (trackingCode)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_shipment_number ON shipments (shipmentNumber)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_invoice_number ON shipments (invoiceNumber)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_status ON shipments (status)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_date ON shipments (date)',
+    ],
+    # 2: فهرس البحث النصي FTS5 مع مشغلات تبقيه متزامنًا مع الشحنات وجهات الاتصال
+    [
+        'CREATE INDEX IF NOT EXISTS idx_shipments_sender_id ON shipments (sender_id)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_receiver_id ON shipments (receiver_id)',
+        f'''CREATE VIRTUAL TABLE IF NOT EXISTS shipments_fts USING fts5(
+            {', '.join(name for name, _, _ in SEARCH_COLUMNS)},
+            tokenize = 'unicode61 remove_diacritics 2'
+        )''',
+        f'''CREATE TRIGGER IF NOT EXISTS shipments_fts_insert AFTER INSERT ON shipments BEGIN
+            {_search_index_insert('WHERE s.id = new.id')}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS shipments_fts_update
+        AFTER UPDATE OF shipmentNumber, invoiceNumber, trackingCode, sender_id, receiver_id, contents ON shipments BEGIN
+            DELETE FROM shipments_fts WHERE rowid = old.id;
+            {_search_index_insert('WHERE s.id = new.id')}
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS shipments_fts_delete AFTER DELETE ON shipments BEGIN
+            DELETE FROM shipments_fts WHERE rowid = old.id;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN
+            DELETE FROM shipments_fts WHERE rowid IN (
+                SELECT id FROM shipments WHERE sender_id = new.id OR receiver_id = new.id
+            );
+            {_search_index_insert('WHERE s.sender_id = new.id OR s.receiver_id = new.id')}
+        END''',
+        'DELETE FROM shipments_fts',
+        _search_index_insert(''),
+    ],
+    # 3: جدول إحصاءات تراكمية تحدّثه المشغلات، لتُحسب لوحة المعلومات دون المرور على كل الشحنات
+    [
+        f'''CREATE TABLE IF NOT EXISTS shipment_stats (
+            {' TEXT NOT NULL, '.join(STATS_DIMENSIONS)} TEXT NOT NULL,
+            shipments INTEGER NOT NULL,
+            revenue REAL NOT NULL,
+            PRIMARY KEY ({', '.join(STATS_DIMENSIONS)})
+        )''',
+        *_stats_triggers(_REAL_REVENUE),
+        'DELETE FROM shipment_stats',
+        f'''INSERT INTO shipment_stats ({', '.join(STATS_DIMENSIONS)}, shipments, revenue)
+            SELECT {', '.join(f"coalesce({dimension}, '')" for dimension in STATS_DIMENSIONS)},
+                   COUNT(*), TOTAL(CAST(finalPrice AS REAL))
+            FROM shipments
+            GROUP BY {', '.join(str(position) for position in range(1, len(STATS_DIMENSIONS) + 1))}''',
+    ],
+    # 4: تسلسل أكواد التتبع لكل فرع وفهرس فريد يمنع تكرار الكود
+    [
+        '''CREATE TABLE IF NOT EXISTS tracking_sequences (
+            prefix TEXT PRIMARY KEY,
+            last_value INTEGER NOT NULL
+        )''',
+        _reassign_duplicate_tracking_codes,
+        'DROP INDEX IF EXISTS idx_shipments_tracking_code',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_shipments_tracking_code ON shipments (trackingCode)',
+    ],
+    # 5: جهات اتصال فريدة حسب رقم الهاتف الموحد، ودمج المكرر منها
+    [
+        'ALTER TABLE contacts ADD COLUMN phone_key TEXT',
+        # يُعاد فهرسة شحنات جهة الاتصال فقط عند تغير حقولها المفهرسة، لا عند ملء phone_key
+        'DROP TRIGGER IF EXISTS contacts_fts_update',
+        f'''CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE OF name, phone, city ON contacts BEGIN
+            DELETE FROM shipments_fts WHERE rowid IN (
+                SELECT id FROM shipments WHERE sender_id = new.id OR receiver_id = new.id
+            );
+            {_search_index_insert('WHERE s.sender_id = new.id OR s.receiver_id = new.id')}
+        END''',
+        compact_contacts,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_phone_key ON contacts (phone_key)',
+    ],
+    # 6: أسعار محسوبة على الخادم ومخزنة بالوحدات الصغرى للعملة
+    [
+        *(f'ALTER TABLE shipments ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0' for column in _BACKFILLED_PRICE_COLUMNS),
+        _backfill_prices,
+    ],
+    # 7: فهارس لتصفية قائمة الشحنات حسب الفرع أو الحالة مع ترتيبها بالتاريخ، وللترتيب بالسعر
+    [
+        'DROP INDEX IF EXISTS idx_shipments_status',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_status_date ON shipments (status, date)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_branch_date ON shipments (branch, date)',
+        'CREATE INDEX IF NOT EXISTS idx_shipments_final_price ON shipments (finalPriceMinor)',
+        'ANALYZE',
+    ],
+    # 8: سجل تغييرات الشحنات لخلاصة التغييرات (/api/changes)؛ AUTOINCREMENT يمنع إعادة استخدام أرقام محذوفة
+    [
+        '''CREATE TABLE IF NOT EXISTS shipment_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            shipment_id INTEGER NOT NULL,
+            kind TEXT NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_shipment_changes_shipment ON shipment_changes (shipment_id, seq)',
+        *_CHANGE_LOG_TRIGGERS,
+    ],
+    # 9: فرق السعر النهائي المخزن للشحنات القديمة عن مجموع مكوناته المحسوبة، فتتطابق المكونات مع ما دُفع
+    [
+        'ALTER TABLE shipments ADD COLUMN priceAdjustmentMinor INTEGER NOT NULL DEFAULT 0',
+        '''UPDATE shipments
+           SET priceAdjustmentMinor = finalPriceMinor - basePriceMinor - insuranceCostMinor - packagingCostMinor''',
+    ],
+    # 10: الإيراد في جدول الإحصاءات بالوحدات الصغرى الصحيحة من finalPriceMinor بدل جمع finalPrice العشري
+    [
+        'DROP TRIGGER IF EXISTS shipment_stats_insert',
+        'DROP TRIGGER IF EXISTS shipment_stats_update',
+        'DROP TRIGGER IF EXISTS shipment_stats_delete',
+        'DROP TABLE IF EXISTS shipment_stats',
+        f'''CREATE TABLE shipment_stats (
+            {' TEXT NOT NULL, '.join(STATS_DIMENSIONS)} TEXT NOT NULL,
+            shipments INTEGER NOT NULL,
+            revenueMinor INTEGER NOT NULL,
+            PRIMARY KEY ({', '.join(STATS_DIMENSIONS)})
+        )''',
+        *_stats_triggers(),
+        f'''INSERT INTO shipment_stats ({', '.join(STATS_DIMENSIONS)}, shipments, revenueMinor)
+            SELECT {', '.join(f"coalesce({dimension}, '')" for dimension in STATS_DIMENSIONS)},
+                   COUNT(*), SUM(finalPriceMinor)
+            FROM shipments
+            GROUP BY {', '.join(str(position) for position in range(1, len(STATS_DIMENSIONS) + 1))}''',
+    ],
+]
+
+def run_migrations(conn):
+    """يطبق ترحيلات المخطط التي لم تُطبق بعد، كل ترحيل في معاملة مستقلة."""
+    for version, steps in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE يمنع عمليتين من تطبيق الترحيل نفسه في الوقت ذاته
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _request_stats():
+    """يعيد عدادات الطلب الحالي، أو None خارج سياق الطلب (مثل خيط الكتابة)."""
+    return g.get('request_stats') if has_app_context() else None
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """مؤشر يسجل عدد جمل SQL وزمنها وعدد الصفوف المعادة في عدادات الطلب الحالي."""
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            stats = _request_stats()
+            if stats is not None:
+                stats['sql_statements'] += 1
+                stats['sql_seconds'] += time.perf_counter() - started
+
+    def _count_rows(self, count):
+        stats = _request_stats()
+        if stats is not None:
+            stats['rows'] += count
+
+    def execute(self, sql, parameters=()):
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self._timed(sqlite3.Cursor.executemany, sql, parameters)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count_rows(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._count_rows(1)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    """اتصال تُنشئ كل مؤشراته (بما فيها مؤشرات conn.execute) كـ InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+def open_connection(database_file):
+    """يفتح اتصالاً جديدًا بقاعدة البيانات ويهيئه بأوامر PRAGMA."""
+    conn = sqlite3.connect(database_file, check_same_thread=False, factory=InstrumentedConnection)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+class ConnectionPool:
+    """مجمع اتصالات SQLite يعيد استخدام الاتصالات المفتوحة بين الطلبات بدل فتح اتصال جديد لكل طلب."""
+
+    def __init__(self, database_file, size):
+        self.database_file = database_file
+        self.size = size
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.closed = 0
+
+    def acquire(self):
+        """يعيد اتصالاً خاملاً من المجمع أو يفتح اتصالاً جديدًا إذا كان المجمع فارغًا."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = open_connection(self.database_file)
+            with self._lock:
+                self.opened += 1
+            return conn
+        with self._lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn):
+        """يعيد الاتصال إلى المجمع بعد التراجع عن أي معاملة لم تكتمل، أو يغلقه إذا امتلأ المجمع."""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+            return
+        conn.close()
+        with self._lock:
+            self.closed += 1
+
+    def stats(self):
+        """يعيد عدادات المجمع لأغراض المراقبة."""
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': self._idle.qsize(),
+                'opened': self.opened,
+                'reused': self.reused,
+                'closed': self.closed,
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """ينشئ مجمع الاتصالات عند أول استخدام ويعيده، ومن جديد في كل عملية ناتجة عن fork."""
+    global _pool
+    with _pool_lock:
+        # اتصالات SQLite الموروثة من العملية الأم لا يجوز استخدامها بعد fork
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(DATABASE_FILE, DB_POOL_SIZE)
+        return _pool
+
+class WriteQueue:
+    """
+    خيط كتابة واحد لكل عملية يجمع عمليات الكتابة القادمة من عدة طلبات وينفذها في معاملة واحدة.
+    كل عملية تُنفذ داخل SAVEPOINT خاص بها، فلا يُلغي فشل إحداها بقية الدفعة.
+    """
+
+    def __init__(self, database_file, batch_size):
+        self.database_file = database_file
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._jobs = None
+        self._callbacks = None
+        self.batches = 0
+        self.jobs = 0
+
+    def _ensure_started(self):
+        """يبدأ خيط الكتابة عند أول استخدام، ومن جديد في كل عملية ناتجة عن fork."""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._jobs = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, job):
+        """ينفذ job(cursor) في معاملة خيط الكتابة وينتظر نتيجتها؛ أي استثناء من job يُرفع في خيط الطلب."""
+        self._ensure_started()
+        future = Future()
+        started = time.perf_counter()
+        self._jobs.put((job, future))
+        try:
+            return future.result()
+        finally:
+            stats = _request_stats()
+            if stats is not None:
+                stats['write_wait_seconds'] += time.perf_counter() - started
+
+    def after_commit(self, callback):
+        """
+        يسجل دالة تُنفذ بعد تثبيت معاملة عملية الكتابة الحالية وقبل إبلاغ الطلب بنتيجتها؛
+        تُهمل إذا فشلت العملية. تُستدعى من داخل عمليات الكتابة فقط.
+        """
+        self._callbacks.append(callback)
+
+    def _run(self):
+        conn = open_connection(self.database_file)
+        jobs = self._jobs
+        while True:
+            batch = [jobs.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute(conn, batch)
+
+    def _execute(self, conn, batch):
+        """ينفذ دفعة من عمليات الكتابة ثم يثبتها مرة واحدة قبل إبلاغ الطلبات بالنتائج."""
+        outcomes = []
+        callbacks = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            c = conn.cursor()
+            for job, future in batch:
+                self._callbacks = []
+                c.execute('SAVEPOINT write_job')
+                try:
+                    outcomes.append((future, job(c), None))
+                    c.execute('RELEASE write_job')
+                    callbacks += self._callbacks
+                except Exception as e:
+                    c.execute('ROLLBACK TO write_job')
+                    c.execute('RELEASE write_job')
+                    outcomes.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._callbacks = None
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                app.logger.exception('after-commit callback failed')
+        # يقرأ موزع الأحداث التغييرات الجديدة فورًا بدل انتظار دورة الاستطلاع التالية
+        if _event_broker is not None:
+            _event_broker.wake()
+
+        with self._lock:
+            self.batches += 1
+            self.jobs += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        """يعيد عدادات خيط الكتابة لأغراض المراقبة."""
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'jobs': self.jobs,
+                'pending': self._jobs.qsize() if self._jobs else 0,
+            }
+
+_writer = None
+
+def get_writer():
+    """ينشئ طابور الكتابة عند أول استخدام ويعيده."""
+    global _writer
+    with _pool_lock:
+        if _writer is None:
+            _writer = WriteQueue(DATABASE_FILE, WRITE_BATCH_SIZE)
+        return _writer
+
+# عدد الشحنات التي تحتفظ بها الذاكرة المؤقتة لكل عملية؛ 0 يعطلها
+SHIPMENT_CACHE_SIZE = int(os.environ.get('SHIPMENT_CACHE_SIZE', 1024))
+# مدة صلاحية الشحنة في الذاكرة المؤقتة بالثواني؛ تحد من تقادمها إذا فات إبطالها (مثل تعديل القاعدة يدويًا)
+SHIPMENT_CACHE_TTL = float(os.environ.get('SHIPMENT_CACHE_TTL', 300))
+# عنوان redis (مثل redis://localhost:6379/0) لمشاركة الذاكرة المؤقتة بين العمليات العاملة
+SHIPMENT_CACHE_URL = os.environ.get('SHIPMENT_CACHE_URL')
+
+class ShipmentCache:
+    """
+    ذاكرة مؤقتة LRU داخل العملية لكائنات الشحنات الكاملة حسب المعرّف، محدودة بالعدد ومدة الصلاحية.
+    كل إبطال يزيد رقم الجيل، ولا تُخزن نتيجة قراءة بدأت قبل إبطال لاحق لها حتى لا تعود بيانات قديمة.
+    الكتابات في العمليات العاملة الأخرى تُبطل عبر سجل التغييرات الذي يقرؤه موزع الأحداث في كل عملية.
+    """
+
+    # ذاكرة خاصة بالعملية تحتاج إبطال كتابات العمليات الأخرى من سجل التغييرات
+    process_local = True
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, shipment_id):
+        """يعيد الشحنة المخزنة أو None إذا لم تكن موجودة أو انتهت صلاحيتها."""
+        with self._lock:
+            entry = self._entries.get(shipment_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[shipment_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(shipment_id)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self):
+        """يعيد رقم الجيل الحالي؛ يُقرأ قبل جلب الشحنة من قاعدة البيانات ويُمرر إلى put."""
+        with self._lock:
+            return self._generation
+
+    def put(self, shipment_id, shipment, generation):
+        """يخزن الشحنة ما لم يحدث إبطال منذ قراءة رقم الجيل، ويحذف الأقدم استخدامًا عند امتلاء الذاكرة."""
+        with self._lock:
+            if generation != self._generation or not self.max_entries:
+                return
+            self._entries[shipment_id] = (time.monotonic() + self.ttl, shipment)
+            self._entries.move_to_end(shipment_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, shipment_ids):
+        """يحذف الشحنات المحددة من الذاكرة المؤقتة."""
+        with self._lock:
+            self._generation += 1
+            for shipment_id in shipment_ids:
+                if self._entries.pop(shipment_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        """يفرغ الذاكرة المؤقتة كلها."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """يعيد عدادات الذاكرة المؤقتة لأغراض المراقبة."""
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+class RedisShipmentCache(ShipmentCache):
+    """
+    ذاكرة مؤقتة للشحنات في redis تتشاركها كل العمليات العاملة، فيصل إبطال أي عملية إلى البقية.
+    الحذف عند الامتلاء يتولاه redis نفسه (maxmemory-policy)، لذا لا تُحتسب الإزالات هنا.
+    """
+
+    # كل عملية تبطل ما تكتبه بنفسها في redis المشترك، فلا حاجة لقراءة سجل التغييرات في كل عملية
+    process_local = False
+    KEY_PREFIX = 'brako:shipment:'
+    GENERATION_KEY = 'brako:shipment-cache:generation'
+
+    def __init__(self, url, ttl):
+        super().__init__(0, ttl)
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, shipment_id):
+        raw = self._client.get(self.KEY_PREFIX + str(shipment_id))
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return app.json.loads(raw)
+
+    def generation(self):
+        return int(self._client.get(self.GENERATION_KEY) or 0)
+
+    def put(self, shipment_id, shipment, generation):
+        # يُكتب المفتاح فقط إذا لم يتغير الجيل بين قراءته والكتابة (WATCH/MULTI)
+        with self._client.pipeline() as pipe:
+            try:
+                pipe.watch(self.GENERATION_KEY)
+                if int(pipe.get(self.GENERATION_KEY) or 0) != generation:
+                    return
+                pipe.multi()
+                pipe.setex(self.KEY_PREFIX + str(shipment_id), max(1, int(self.ttl)), app.json.dumps(shipment))
+                pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def invalidate(self, shipment_ids):
+        keys = [self.KEY_PREFIX + str(shipment_id) for shipment_id in shipment_ids]
+        with self._client.pipeline() as pipe:
+            pipe.incr(self.GENERATION_KEY)
+            if keys:
+                pipe.delete(*keys)
+            deleted = pipe.execute()[-1] if keys else 0
+        with self._lock:
+            self.invalidations += deleted
+
+    def clear(self):
+        self._client.incr(self.GENERATION_KEY)
+        keys = list(self._client.scan_iter(match=self.KEY_PREFIX + '*', count=1000))
+        for start in range(0, len(keys), 1000):
+            self._client.delete(*keys[start:start + 1000])
+        with self._lock:
+            self.invalidations += len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': 0,
+                'invalidations': self.invalidations,
+            }
+
+_shipment_cache = None
+
+def get_shipment_cache():
+    """ينشئ ذاكرة الشحنات المؤقتة عند أول استخدام، في redis إذا ضُبط SHIPMENT_CACHE_URL."""
+    global _shipment_cache
+    with _pool_lock:
+        if _shipment_cache is None:
+            if SHIPMENT_CACHE_URL:
+                if redis is None:
+                    raise RuntimeError('SHIPMENT_CACHE_URL is set but the redis package is not installed')
+                _shipment_cache = RedisShipmentCache(SHIPMENT_CACHE_URL, SHIPMENT_CACHE_TTL)
+            else:
+                _shipment_cache = ShipmentCache(SHIPMENT_CACHE_SIZE, SHIPMENT_CACHE_TTL)
+        cache = _shipment_cache
+    # الذاكرة داخل العملية لا ترى كتابات العمليات الأخرى؛ قارئ سجل التغييرات يبطلها (ويُعاد تشغيله بعد fork)
+    if cache.process_local:
+        get_event_broker().start()
+    return cache
+
+def invalidate_cached_shipments(shipment_ids):
+    """يبطل الشحنات المحددة في الذاكرة المؤقتة بعد تثبيت عملية الكتابة الحالية؛ يُستدعى من داخل عمليات الكتابة."""
+    shipment_ids = list(shipment_ids)
+    if shipment_ids:
+        get_writer().after_commit(lambda: get_shipment_cache().invalidate(shipment_ids))
+
+# أقصى مدة بالثواني بين قراءتين لسجل التغييرات؛ الكتابات في العملية نفسها توقظ الموزع فورًا،
+# وهذه المدة تحد تأخر الأحداث القادمة من العمليات العاملة الأخرى
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1.0))
+# فترة نبضة الإبقاء بالثواني؛ تمنع الوسطاء من إغلاق الاتصال الخامل وتكشف العملاء المنقطعين
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', 15))
+# أقصى عمر للاتصال بالثواني؛ يعيد EventSource الاتصال تلقائيًا ويتابع من Last-Event-ID
+EVENTS_MAX_AGE = float(os.environ.get('EVENTS_MAX_AGE', 600))
+# عدد الأحداث المنتظرة لكل مشترك؛ المشترك الأبطأ من ذلك يُفصل بحدث resync ليعيد التحميل
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 256))
+# أقصى عدد اتصالات المسؤولين في كل عملية؛ في gunicorn يشغل كل اتصال مفتوح خيطًا (انظر events_server.py)
+EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 1000))
+# أقصى عدد اتصالات صفحة التتبع العامة في كل عملية؛ حد مستقل فلا يحجب العملاء اتصالات المسؤولين
+EVENTS_MAX_PUBLIC_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_PUBLIC_SUBSCRIBERS', 10000))
+# أقصى عدد اتصالات صفحة التتبع العامة من عميل واحد (عنوان IP)؛ 0 دون حد
+EVENTS_MAX_PER_CLIENT = int(os.environ.get('EVENTS_MAX_PER_CLIENT', 4))
+# ترويسة عنوان العميل التي يضبطها الوكيل العكسي (مثل X-Real-IP)؛ دونها يُعد عنوان الاتصال نفسه هو العميل
+EVENTS_CLIENT_HEADER = os.environ.get('EVENTS_CLIENT_HEADER')
+# التغييرات الجماعية الأكبر من هذا العدد (تحديث حالة مئات الشحنات أو الاستيراد) تصل إلى المسؤولين
+# كحدث resync واحد بدل حدث لكل شحنة
+EVENTS_MAX_BATCH = int(os.environ.get('EVENTS_MAX_BATCH', 100))
+# المدة التي ينتظرها المتصفح قبل إعادة الاتصال (بالمللي ثانية)
+EVENTS_RETRY_MS = 3000
+# حقول الشحنة المرسلة إلى المسؤولين مع كل حدث (تطابق أعمدة جدول الشحنات في الواجهة)
+EVENT_SHIPMENT_FIELDS = {
+    'id', 'shipmentNumber', 'trackingCode', 'sender', 'receiver', 'quantity', 'weight',
+    'paymentMethod', 'finalPrice', 'currency', 'status'
+}
+
+def format_event(event, data, event_id=None):
+    """يرمّز حدثًا واحدًا بصيغة text/event-stream."""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {app.json.dumps(data)}']
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+class EventSubscription:
+    """اشتراك اتصال SSE واحد: طابور محدود بأحداث جاهزة للإرسال، وعلامة تُرفع إذا امتلأ."""
+
+    def __init__(self, shipment_id, start_seq, size, client=None):
+        self.shipment_id = shipment_id
+        self.start_seq = start_seq
+        self.client = client
+        self.events = queue.Queue(maxsize=size)
+        self.overflowed = False
+
+class EventBroker:
+    """
+    موزع أحداث الشحنات لكل عملية: خيط واحد يقرأ سجل التغييرات (shipment_changes) ويبني كل حدث
+    ويرمّزه مرة واحدة، ثم يضعه في طوابير المشتركين. المشتركون لا يلمسون قاعدة البيانات، فتكلفة
+    الاتصال الخامل طابور فارغ فقط. ولأن المصدر سجل التغييرات المشترك تصل الأحداث إلى كل العمليات
+    العاملة مهما كانت العملية التي نفذت الكتابة، ومعرّف كل حدث هو رقم التغيير (seq).
+    المسؤولون (shipment_id=None) يتلقون كل الشحنات؛ صفحة التتبع العامة تتلقى شحنتها فقط.
+    """
+
+    subscription_class = EventSubscription
+
+    def __init__(self, database_file, poll_interval, queue_size, max_batch, max_subscribers, max_public_subscribers,
+                 max_per_client=0):
+        self.database_file = database_file
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.max_subscribers = max_subscribers
+        self.max_public_subscribers = max_public_subscribers
+        self.max_per_client = max_per_client
+        self._clients = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._subscribers = defaultdict(set)
+        self.last_seq = 0
+        self.published = 0
+        self.overflows = 0
+
+    def _ensure_started(self):
+        """يبدأ خيط القراءة عند أول استخدام، ومن جديد في كل عملية ناتجة عن fork."""
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._subscribers = defaultdict(set)
+            self._clients = Counter()
+            conn = open_connection(self.database_file)
+            self.last_seq = current_change_seq(conn.cursor())
+            self._thread = threading.Thread(target=self._run, args=(conn,), name='event-broker', daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """يشغل قارئ سجل التغييرات في العملية الحالية إن لم يكن يعمل."""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            self._ensure_started()
+
+    def subscribe(self, shipment_id=None, client=None):
+        """
+        يسجل مشتركًا جديدًا ويعيده، أو None إذا بلغ عدد المشتركين من نوعه (مسؤول أو عام) حده الأقصى،
+        أو بلغ عدد اتصالات صفحة التتبع من العميل client حده.
+        """
+        with self._lock:
+            self._ensure_started()
+            admins, public = self._counts()
+            if shipment_id is None and admins >= self.max_subscribers:
+                return None
+            if shipment_id is not None:
+                if public >= self.max_public_subscribers:
+                    return None
+                if self.max_per_client and self._clients[client] >= self.max_per_client:
+                    return None
+                self._clients[client] += 1
+            subscription = self.subscription_class(shipment_id, self.last_seq, self.queue_size, client)
+            self._subscribers[shipment_id].add(subscription)
+            return subscription
+
+    def _counts(self):
+        """يعيد عدد مشتركي المسؤولين وعدد مشتركي صفحة التتبع؛ يُستدعى مع القفل."""
+        admins = len(self._subscribers.get(None, ()))
+        return admins, sum(len(subscribers) for subscribers in self._subscribers.values()) - admins
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.shipment_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.shipment_id]
+            if subscription.shipment_id is not None:
+                self._clients[subscription.client] -= 1
+                if not self._clients[subscription.client]:
+                    del self._clients[subscription.client]
+
+    def wake(self):
+        """يطلب قراءة سجل التغييرات الآن؛ يُستدعى بعد كل معاملة كتابة."""
+        self._wake.set()
+
+    def _run(self, conn):
+        c = conn.cursor()
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                c.execute('SELECT seq, shipment_id, kind FROM shipment_changes WHERE seq > ? ORDER BY seq',
+                          (self.last_seq,))
+                rows = c.fetchall()
+                if rows:
+                    # يبطل الشحنات المتغيرة في ذاكرة هذه العملية، أيًا كانت العملية التي كتبتها
+                    if _shipment_cache is not None and _shipment_cache.process_local:
+                        _shipment_cache.invalidate({row['shipment_id'] for row in rows})
+                    self._publish(c, rows)
+                    self.last_seq = rows[-1]['seq']
+            except Exception:
+                app.logger.exception('event broker failed to read the change log')
+
+    def _publish(self, c, rows):
+        """يبني أحداث دفعة التغييرات (آخر تغيير لكل شحنة) ويوزعها على المشتركين المعنيين."""
+        latest = {row['shipment_id']: row for row in rows}
+        with self._lock:
+            admins = set(self._subscribers.get(None, ()))
+            watched = {shipment_id: set(self._subscribers[shipment_id])
+                       for shipment_id in latest if shipment_id in self._subscribers}
+        if not admins and not watched:
+            return
+        if admins and len(latest) > self.max_batch:
+            self._deliver(admins, format_event('resync', {}, rows[-1]['seq']))
+            admins = set()
+
+        upserted = [shipment_id for shipment_id, row in latest.items() if row['kind'] == 'upsert']
+        shipments_by_id = {
+            shipment['id']: shipment for shipment in query_shipments(
+                c, 'WHERE s.id IN (SELECT value FROM json_each(?))', (json.dumps(upserted),),
+                fields=EVENT_SHIPMENT_FIELDS)
+        } if admins and upserted else {}
+
+        for shipment_id, row in sorted(latest.items(), key=lambda item: item[1]['seq']):
+            if admins:
+                shipment = shipments_by_id.get(shipment_id)
+                data = {'op': 'upsert', 'id': shipment_id, 'shipment': shipment} if shipment else {'op': 'delete', 'id': shipment_id}
+                self._deliver(admins, format_event('shipment', data, row['seq']))
+            if shipment_id in watched:
+                tracking = tracking_info(c, shipment_id) if row['kind'] == 'upsert' else None
+                data = {'op': 'upsert', 'tracking': tracking} if tracking else {'op': 'delete'}
+                self._deliver(watched[shipment_id], format_event('tracking', data, row['seq']))
+
+    def _deliver(self, subscribers, event):
+        for subscription in subscribers:
+            try:
+                subscription.events.put_nowait(event)
+                self.published += 1
+            except queue.Full:
+                # لا يُنتظر مشترك بطيء أبدًا: يُفصل ويعيد تحميل البيانات بعد إعادة الاتصال
+                if not subscription.overflowed:
+                    subscription.overflowed = True
+                    self.overflows += 1
+                    self.unsubscribe(subscription)
+
+    def stats(self):
+        """يعيد عدادات الموزع لأغراض المراقبة."""
+        with self._lock:
+            admins, public = self._counts()
+            return {
+                'subscribers': admins,
+                'public_subscribers': public,
+                'published': self.published,
+                'overflows': self.overflows,
+                'last_seq': self.last_seq,
+            }
+
+_event_broker = None
+
+def get_event_broker():
+    """ينشئ موزع أحداث الشحنات عند أول استخدام ويعيده."""
+    global _event_broker
+    with _pool_lock:
+        if _event_broker is None:
+            _event_broker = EventBroker(DATABASE_FILE, EVENTS_POLL_INTERVAL, EVENTS_QUEUE_SIZE,
+                                        EVENTS_MAX_BATCH, EVENTS_MAX_SUBSCRIBERS, EVENTS_MAX_PUBLIC_SUBSCRIBERS,
+                                        EVENTS_MAX_PER_CLIENT)
+        return _event_broker
+
+def get_db_connection():
+    """يعيد اتصال الطلب الحالي من المجمع؛ يُعاد الاتصال إلى المجمع تلقائيًا عند انتهاء الطلب."""
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().acquire()
+    return g.db_conn
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """يعيد اتصال الطلب إلى المجمع حتى في مسارات الخطأ."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+# حدود مدرجات زمن الاستجابة بالثواني
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# تُسجَّل الطلبات الأبطأ من هذا الحد (بالمللي ثانية) في السجل؛ 0 يعطل التسجيل
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+# رمز يرسله جامع المقاييس في ترويسة Authorization: Bearer؛ بدونه تبقى /metrics للمسؤول المسجل دخوله فقط
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# عدادات كل طلب التي تُجمع لكل مسار، مع وصفها في مخرجات /metrics
+REQUEST_TOTALS = {
+    'sql_statements': 'SQL statements executed',
+    'sql_seconds': 'Time spent executing SQL statements',
+    'write_wait_seconds': 'Time spent waiting for the writer thread',
+    'rows': 'Rows fetched from the database',
+    'response_bytes': 'Response body bytes sent',
+}
+
+class RequestMetrics:
+    """يجمع زمن الاستجابة وعدادات قاعدة البيانات لكل مسار، ويعرضها بصيغة Prometheus النصية."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+        self._latency = {}
+        self._totals = defaultdict(lambda: dict.fromkeys(REQUEST_TOTALS, 0))
+
+    def observe(self, endpoint, method, status, duration, stats):
+        """يضيف طلبًا منتهيًا إلى المقاييس."""
+        with self._lock:
+            self._requests[endpoint, method, status] += 1
+            histogram = self._latency.setdefault(endpoint, [0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[index] += 1
+            histogram[-2] += 1
+            histogram[-1] += duration
+            totals = self._totals[endpoint]
+            for name in REQUEST_TOTALS:
+                totals[name] += stats[name]
+
+    def render(self):
+        """يعيد المقاييس بصيغة Prometheus النصية."""
+        lines = [
+            '# HELP brako_requests_total HTTP requests by endpoint, method and status.',
+            '# TYPE brako_requests_total counter',
+        ]
+        with self._lock:
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'brako_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            lines += [
+                '# HELP brako_request_duration_seconds Request latency by endpoint.',
+                '# TYPE brako_request_duration_seconds histogram',
+            ]
+            for endpoint, histogram in sorted(self._latency.items()):
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'brako_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'brako_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram[-2]}')
+                lines.append(f'brako_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram[-2]}')
+                lines.append(f'brako_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram[-1]:.6f}')
+            for name, description in REQUEST_TOTALS.items():
+                lines += [f'# HELP brako_{name}_total {description}, by endpoint.', f'# TYPE brako_{name}_total counter']
+                for endpoint, totals in sorted(self._totals.items()):
+                    lines.append(f'brako_{name}_total{{endpoint="{endpoint}"}} {totals[name]:g}')
+        return '\n'.join(lines) + '\n'
+
+metrics = RequestMetrics(LATENCY_BUCKETS)
+
+@app.before_request
+def start_request_stats():
+    """يبدأ توقيت الطلب وعداداته."""
+    g.request_stats = dict.fromkeys(REQUEST_TOTALS, 0)
+    g.request_stats['started'] = time.perf_counter()
+
+def _count_streamed_bytes(body, stats):
+    """يمرر أجزاء الاستجابة المبثوثة مع احتساب حجمها."""
+    try:
+        for chunk in body:
+            stats['response_bytes'] += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    يسجل مقاييس الطلب بعد إرسال الاستجابة؛ الاستجابات المبثوثة تُسجل عند انتهاء البث
+    فيدخل فيها زمن البث والاستعلامات التي تُنفذ أثناءه.
+    """
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    method, path = request.method, request.path
+
+    def finish():
+        duration = time.perf_counter() - stats['started']
+        metrics.observe(endpoint, method, response.status_code, duration, stats)
+        if SLOW_REQUEST_MS and duration * 1000 >= SLOW_REQUEST_MS:
+            app.logger.warning(
+                'slow request: %s %s -> %s in %.1f ms (sql: %d statements, %.1f ms; writer wait %.1f ms; rows: %d; bytes: %d)',
+                method, path, response.status_code, duration * 1000, stats['sql_statements'],
+                stats['sql_seconds'] * 1000, stats['write_wait_seconds'] * 1000, stats['rows'], stats['response_bytes'])
+
+    if response.is_streamed:
+        response.response = _count_streamed_bytes(response.response, stats)
+        response.call_on_close(finish)
+    else:
+        stats['response_bytes'] = response.content_length or 0
+        finish()
+    return response
+
+# لا تُضغط الاستجابات الأصغر من هذا الحجم بالبايت؛ الضغط لا يوفر فيها ما يستحق زمن المعالج
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+# أنواع المحتوى النصية التي تُضغط (ملفات xlsx مضغوطة أصلاً)
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/html'}
+# مستويات ضغط سريعة تناسب الاستجابات المولدة لكل طلب (الملفات الثابتة تُضغط مسبقًا بأعلى مستوى)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+def negotiate_encoding():
+    """يختار أفضل ترميز ضغط يقبله العميل، أو None إذا لم يقبل أيًا منها."""
+    encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+    encoding = max(encodings, key=lambda name: request.accept_encodings[name])
+    return encoding if request.accept_encodings[encoding] else None
+
+def _compress_stream(body, encoding):
+    """يضغط أجزاء الاستجابة المبثوثة جزءًا بجزء، مع تفريغ كل جزء حتى يصل للعميل دون انتظار نهاية البث."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+# يُسجل بعد record_request_metrics فيُنفذ قبله، فتُحتسب في المقاييس الأحجام بعد الضغط
+@app.after_request
+def compress_response(response):
+    """يضغط استجابات JSON و CSV و HTML بترميز gzip أو brotli حسب Accept-Encoding."""
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    يعرض مقاييس الطلبات ومجمع الاتصالات وخيط الكتابة والذاكرة المؤقتة بصيغة Prometheus النصية.
+    تكشف المقاييس ما تكشفه /api/db_stats، فتتطلب جلسة المسؤول أو رمز METRICS_TOKEN.
+    """
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not session.get('logged_in') and not (METRICS_TOKEN and hmac.compare_digest(token, METRICS_TOKEN)):
+        return jsonify({"error": "Unauthorized"}), 401
+    pool_stats = get_pool().stats()
+    writer_stats = get_writer().stats()
+    cache_stats = get_shipment_cache().stats()
+    event_stats = get_event_broker().stats()
+    lines = [
+        '# HELP brako_db_pool_connections Connection pool counters.',
+        '# TYPE brako_db_pool_connections gauge',
+        *(f'brako_db_pool_connections{{state="{name}"}} {pool_stats[name]}' for name in ('idle', 'opened', 'reused', 'closed')),
+        '# HELP brako_db_writer_batches_total Write transactions committed by the writer thread.',
+        '# TYPE brako_db_writer_batches_total counter',
+        f"brako_db_writer_batches_total {writer_stats['batches']}",
+        '# HELP brako_db_writer_jobs_total Write jobs executed by the writer thread.',
+        '# TYPE brako_db_writer_jobs_total counter',
+        f"brako_db_writer_jobs_total {writer_stats['jobs']}",
+        '# HELP brako_shipment_cache_total Single-shipment cache lookups and removals.',
+        '# TYPE brako_shipment_cache_total counter',
+        *(f'brako_shipment_cache_total{{event="{name}"}} {cache_stats[name]}' for name in ('hits', 'misses', 'evictions', 'invalidations')),
+        '# HELP brako_event_subscribers Open Server-Sent Events connections.',
+        '# TYPE brako_event_subscribers gauge',
+        f'brako_event_subscribers{{kind="admin"}} {event_stats["subscribers"]}',
+        f'brako_event_subscribers{{kind="public"}} {event_stats["public_subscribers"]}',
+        '# HELP brako_events_total Events queued to subscribers and subscribers dropped for falling behind.',
+        '# TYPE brako_events_total counter',
+        *(f'brako_events_total{{outcome="{name}"}} {event_stats[name]}' for name in ('published', 'overflows')),
+    ]
+    return Response(metrics.render() + '\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# أعمدة جدول الشحنات بالترتيب الذي تُعاد به في الاستجابات
+SHIPMENT_COLUMNS = (
+    'id', 'shipmentNumber', 'invoiceNumber', 'date', 'time', 'branch', 'shippingType',
+    'sender_id', 'receiver_id', 'paymentMethod', 'insurance', 'insuranceCost', 'packaging',
+    'packagingCost', 'quantity', 'unitPrice', 'weight', 'itemType', 'contents',
+    'finalPrice', 'currency', 'status', 'trackingCode', *PRICE_COLUMNS
+)
+
+# حالات الشحنة المسموح بها (تطابق statusTexts في الواجهة)
+SHIPMENT_STATUSES = (
+    'received', 'in_sorting', 'local_shipping', 'departed', 'at_border',
+    'in_transit', 'arrived_city', 'delayed', 'ready_pickup', 'returned'
+)
+
+# حقول جهة الاتصال كما تظهر في كائنات sender و receiver
+CONTACT_FIELDS = ('name', 'phone', 'country', 'city', 'address')
+
+# الحقول المتداخلة التي يمكن طلبها إلى جانب أعمدة الشحنة
+NESTED_FIELDS = ('sender', 'receiver', 'statusHistory')
+
+# الحجم الافتراضي والأقصى لصفحة قائمة الشحنات
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# الحجم الأقصى (والافتراضي) لبث قائمة الشحنات بصيغة JSON lines؛ تُتابع البقية بالمؤشر كالصفحات
+MAX_STREAM_SIZE = 10000
+
+# المرشحات المدعومة: اسم المعامل -> (العمود، المقارنة). مرشحات المساواة تقبل قائمة قيم
+SHIPMENT_FILTERS = {
+    'status': ('status', '='),
+    'branch': ('branch', '='),
+    'paymentMethod': ('paymentMethod', '='),
+    'currency': ('currency', '='),
+    'dateFrom': ('date', '>='),
+    'dateTo': ('date', '<='),
+}
+# مفاتيح ترتيب قائمة الشحنات: اسم المفتاح -> العمود؛ يُكسر التعادل دائمًا بالمعرّف
+SHIPMENT_SORTS = {
+    'id': 'id',
+    'date': 'date',
+    'status': 'status',
+    'branch': 'branch',
+    'shipmentNumber': 'shipmentNumber',
+    'finalPrice': 'finalPriceMinor',
+}
+DEFAULT_SHIPMENT_SORT = '-id'
+# الحقول التي تُحسب لها أعداد الشحنات (facets) حسب المرشح الحالي
+FACET_FIELDS = ('status', 'branch')
+
+def build_shipment_filters(filters, prefix='s.', exclude=()):
+    """
+    يحول قاموس المرشحات إلى شروط SQL ومعاملاتها؛ يرفع ValueError عند وجود مرشح غير معروف
+    أو قيمة ليست نصًا أو رقمًا أو قائمة منها. prefix يسبق أسماء الأعمدة، والمرشحات في exclude تُتجاهل.
+    """
+    if not isinstance(filters, dict):
+        raise ValueError('filter must be an object')
+    unknown = set(filters) - set(SHIPMENT_FILTERS)
+    if unknown:
+        raise ValueError('Unknown filters: ' + ', '.join(sorted(unknown)))
+    for name, value in filters.items():
+        values = value if isinstance(value, list) else [value]
+        if not all(item is None or isinstance(item, (str, int, float)) for item in values):
+            raise ValueError(f'Invalid value for filter {name}')
+    conditions = []
+    params = []
+    for name, (column, operator) in SHIPMENT_FILTERS.items():
+        value = filters.get(name)
+        if name in exclude or value in (None, '', []):
+            continue
+        if isinstance(value, list) and len(value) == 1:
+            # قيمة واحدة تُقارن بالمساواة فيستخدم الاستعلام ترتيب الفهرس دون فرز إضافي
+            value = value[0]
+        if isinstance(value, list):
+            if operator != '=':
+                raise ValueError(f'{name} accepts a single value')
+            conditions.append(f'{prefix}{column} IN (SELECT value FROM json_each(?))')
+            params.append(json.dumps(value))
+        else:
+            conditions.append(f'{prefix}{column} {operator} ?')
+            params.append(value)
+    return conditions, params
+
+def filters_from_args(args):
+    """يقرأ المرشحات من معاملات الرابط؛ القيم المتعددة لمرشح المساواة مفصولة بفواصل (status=received,delayed)."""
+    filters = {}
+    for name, (_, operator) in SHIPMENT_FILTERS.items():
+        value = args.get(name, '').strip()
+        if value:
+            filters[name] = [item for item in value.split(',') if item] if operator == '=' else value
+    return filters
+
+def parse_sort(raw_sort):
+    """يحلل معامل sort= (مثل date أو -date للتنازلي) ويعيد (العمود، تنازلي؟)."""
+    raw_sort = raw_sort or DEFAULT_SHIPMENT_SORT
+    descending = raw_sort.startswith('-')
+    column = SHIPMENT_SORTS.get(raw_sort.lstrip('-'))
+    if column is None:
+        raise ValueError('Unknown sort: ' + raw_sort.lstrip('-'))
+    return column, descending
+
+def encode_cursor(values):
+    """يرمز قيم آخر صف في الصفحة كمؤشر نصي للصفحة التالية."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """يفك مؤشر الصفحة؛ يرفع ValueError إذا كان تالفًا."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or not values:
+        raise ValueError('Invalid cursor')
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        raise ValueError('Invalid cursor')
+    return values
+
+def cursor_condition(sort_column, descending, values):
+    """
+    يبني شرط الصفوف التي تلي آخر صف في الصفحة حسب (عمود الترتيب، المعرّف) ومعاملاته.
+    القيم الفارغة (NULL) تأتي أولًا في الاتجاهين (انظر shipment_order_by)، والمقارنة معها لا تُرجع صحيحًا
+    أبدًا: بعد قيمة فارغة تبقى الفارغة ذات المعرّف التالي ثم كل القيم غير الفارغة، وبعد قيمة غير فارغة
+    تكفي مقارنة المدى التي يخدمها فهرس العمود.
+    """
+    operator = '<' if descending else '>'
+    if sort_column == 'id':
+        return f's.id {operator} ?', values
+    column = f's.{sort_column}'
+    value, last_id = values
+    if value is None:
+        return f'({column} IS NOT NULL OR s.id {operator} ?)', [last_id]
+    return f'({column}, s.id) {operator} (?, ?)', values
+
+def shipment_order_by(sort_column, descending):
+    """يبني ORDER BY لمفتاح الترتيب مع المعرّف لكسر التعادل؛ القيم الفارغة أولًا في الاتجاهين ليبقى الترقيم بالمدى."""
+    direction = 'DESC' if descending else 'ASC'
+    if sort_column == 'id':
+        return f's.id {direction}'
+    return f"s.{sort_column} {direction}{' NULLS FIRST' if descending else ''}, s.id {direction}"
+
+def build_shipment_select(fields=None):
+    """يبني جملة SELECT للشحنات، مع الاكتفاء بالأعمدة والجداول المطلوبة عند تحديد الحقول."""
+    columns = ['s.*']
+    joins = []
+    if fields is not None:
+        columns = ['s.id'] + ['s.' + field for field in SHIPMENT_COLUMNS if field in fields and field != 'id']
+    for role in ('sender', 'receiver'):
+        if fields is None or role in fields:
+            columns += [f'{role}.{field} AS {role}_{field}' for field in CONTACT_FIELDS]
+            joins.append(f'JOIN contacts {role} ON s.{role}_id = {role}.id')
+    return 'SELECT ' + ', '.join(columns) + ' FROM shipments s ' + ' '.join(joins) + ' '
+
+def parse_fields(raw_fields):
+    """يحلل معامل fields= ويعيد مجموعة الحقول المطلوبة، أو None لإعادة الشحنة كاملة."""
+    if not raw_fields:
+        return None
+    fields = {field.strip() for field in raw_fields.split(',') if field.strip()}
+    unknown = fields - set(SHIPMENT_COLUMNS) - set(NESTED_FIELDS)
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(sorted(unknown)))
+    return fields | {'id'}
+
+def hydrate_shipments(c, rows, fields=None):
+    """يبني كائنات الشحنات المتداخلة ويجلب سجل الحالات لكل الصفوف باستعلام واحد."""
+    shipments_list = []
+    shipments_by_id = {}
+    for row in rows:
+        s_dict = dict(row)
+        for role in ('sender', 'receiver'):
+            if fields is None or role in fields:
+                s_dict[role] = {field: s_dict.pop(f'{role}_{field}') for field in CONTACT_FIELDS}
+        if fields is None or 'statusHistory' in fields:
+            s_dict['statusHistory'] = []
+            shipments_by_id[s_dict['id']] = s_dict
+        shipments_list.append(s_dict)
+
+    if shipments_by_id:
+        c.execute('''
+            SELECT shipment_id, status, city, notes, date, time FROM status_updates
+            WHERE shipment_id IN (SELECT value FROM json_each(?))
+            ORDER BY id
+        ''', (json.dumps(list(shipments_by_id)),))
+        for row in c.fetchall():
+            status_dict = dict(row)
+            shipments_by_id[status_dict.pop('shipment_id')]['statusHistory'].append(status_dict)
+
+    return shipments_list
+
+def execute_shipment_query(c, where_clause='', params=(), limit=None, fields=None, order_by='s.id DESC'):
+    """ينفذ استعلام الشحنات مع شرط وترتيب وحد اختيارية على المؤشر c دون جلب الصفوف."""
+    sql = build_shipment_select(fields) + where_clause + ' ORDER BY ' + order_by
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params = tuple(params) + (limit,)
+    c.execute(sql, params)
+
+def query_shipments(c, where_clause='', params=(), limit=None, fields=None, order_by='s.id DESC'):
+    """ينفذ استعلام الشحنات مع شرط اختياري ويعيد الكائنات مرتبة من الأحدث ما لم يُحدد ترتيب آخر."""
+    execute_shipment_query(c, where_clause, params, limit, fields, order_by)
+    return hydrate_shipments(c, c.fetchall(), fields)
+
+# عدد الشحنات التي تُجلب وتُرمّز معًا في كل جزء من البث
+STREAM_BATCH_SIZE = 500
+
+def stream_shipments(conn, where_clause='', params=(), limit=None, fields=None, order_by='s.id DESC'):
+    """
+    يولد الشحنات بصيغة JSON lines (شحنة في كل سطر) دفعة بعد دفعة من مؤشر قاعدة البيانات،
+    فتبقى الذاكرة ثابتة مهما كان عدد الشحنات ويبدأ العميل بالمعالجة فور وصول الدفعة الأولى.
+    """
+    c = conn.cursor()
+    # سجل الحالات يُجلب بمؤشر مستقل حتى لا يُقطع المرور على صفوف الشحنات
+    history_cursor = conn.cursor()
+    execute_shipment_query(c, where_clause, params, limit, fields, order_by)
+    while True:
+        rows = c.fetchmany(STREAM_BATCH_SIZE)
+        if not rows:
+            break
+        shipments = hydrate_shipments(history_cursor, rows, fields)
+        yield ''.join(app.json.dumps(shipment) + '\n' for shipment in shipments).encode('utf-8')
+
 def admin_required(func):
     """ديكوراتور لحماية مسارات الإدارة."""
     def wrapper(*args, **kwargs):
@@ -101,10 +1770,74 @@ def admin_required(func):
     wrapper.__name__ = func.__name__
     return wrapper
 
+# مجلد ملفات الواجهة الثابتة (CSS و JavaScript)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# ملفات الواجهة التي تُحمّل في الذاكرة وتُخدم بأسماء تحمل بصمة محتواها
+FRONTEND_ASSETS = {
+    'js/tailwind-config.js': 'text/javascript',
+    'css/app.css': 'text/css',
+    'js/app.js': 'text/javascript',
+}
+# الملفات ذات البصمة لا يتغير محتواها أبدًا، فتُخزن في المتصفح لمدة سنة
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+class StaticAsset:
+    """محتوى ثابت محمّل في الذاكرة مع وسم ETag ونسخ مضغوطة مسبقًا."""
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.encodings = {'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body)
+
+    def response(self, cache_control):
+        """يعيد الاستجابة بأفضل ترميز يقبله المتصفح، أو 304 إذا كانت نسخته حديثة."""
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+        else:
+            encoding = max(self.encodings, key=lambda name: request.accept_encodings[name], default=None)
+            if encoding is not None and request.accept_encodings[encoding]:
+                response = Response(self.encodings[encoding], mimetype=self.mimetype)
+                response.headers['Content-Encoding'] = encoding
+            else:
+                response = Response(self.body, mimetype=self.mimetype)
+        response.set_etag(self.etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+# الملفات ذات البصمة حسب اسمها، وروابطها حسب مسارها في مجلد static
+_frontend_assets = {}
+_frontend_asset_urls = {}
+_home_page = None
+
+def build_frontend_assets():
+    """يحمّل ملفات الواجهة ويضغطها، ويعرض الصفحة الرئيسية مرة واحدة عند بدء التطبيق."""
+    global _home_page
+    for path, mimetype in FRONTEND_ASSETS.items():
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            asset = StaticAsset(f.read(), mimetype)
+        name, extension = os.path.splitext(path)
+        fingerprinted_path = f'{name}.{asset.etag}{extension}'
+        _frontend_assets[fingerprinted_path] = asset
+        _frontend_asset_urls[path] = '/assets/' + fingerprinted_path
+    html = app.jinja_env.from_string(HTML_CONTENT).render(asset_url=_frontend_asset_urls.__getitem__)
+    _home_page = StaticAsset(html.encode('utf-8'), 'text/html')
+
 @app.route('/')
 def home():
-    """يعرض صفحة HTML الرئيسية."""
-    return render_template_string(HTML_CONTENT)
+    """يعرض صفحة HTML الرئيسية المعروضة مسبقًا؛ يتحقق المتصفح منها بوسم ETag في كل زيارة."""
+    return _home_page.response('no-cache')
+
+@app.route('/assets/<path:filename>')
+def frontend_asset(filename):
+    """يخدم ملفات الواجهة ذات البصمة من الذاكرة."""
+    asset = _frontend_assets.get(filename)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    return asset.response(IMMUTABLE_CACHE_CONTROL)
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -130,320 +1863,963 @@ def auth_status():
     """يتحقق من حالة مصادقة المسؤول."""
     return jsonify({"isAuthenticated": session.get('logged_in', False)}), 200
 
+@app.route('/api/db_stats', methods=['GET'])
+@admin_required
+def db_stats():
+    """يعيد عدادات مجمع الاتصالات وخيط الكتابة لأغراض المراقبة."""
+    stats = get_pool().stats()
+    stats['writer'] = get_writer().stats()
+    stats['shipment_cache'] = get_shipment_cache().stats()
+    stats['events'] = get_event_broker().stats()
+    return jsonify(stats), 200
+
+@app.route('/api/stats', methods=['GET'])
+@admin_required
+def shipment_statistics():
+    """
+    يعيد إحصاءات لوحة المعلومات من جدول الإحصاءات التراكمية: الإجماليات ثم التجميع حسب الحالة والفرع والعملة،
+    مع التجميع حسب التاريخ عند طلبه (by_date=1). تقبل الفلترة بـ branch و dateFrom و dateTo.
+    """
+    conditions = []
+    params = []
+    for name, condition in (('branch', 'branch = ?'), ('dateFrom', 'date >= ?'), ('dateTo', 'date <= ?')):
+        if request.args.get(name):
+            conditions.append(condition)
+            params.append(request.args[name])
+    where_clause = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+    c = get_db_connection().cursor()
+
+    def grouped(dimension):
+        c.execute(f"""
+            SELECT {dimension} AS value, SUM(shipments) AS shipments, SUM(revenueMinor) AS revenue
+            FROM shipment_stats {where_clause}
+            GROUP BY {dimension} ORDER BY {dimension}
+        """, params)
+        return {row['value']: {'shipments': row['shipments'], 'revenue': row['revenue'] / MINOR_UNITS}
+                for row in c.fetchall()}
+
+    by_status = grouped('status')
+    total_shipments = sum(group['shipments'] for group in by_status.values())
+    delivered_shipments = by_status.get(DELIVERED_STATUS, {}).get('shipments', 0)
+    # يُجمع الإجمالي بالوحدات الصغرى الصحيحة ثم يُحول، فلا تتراكم أخطاء التقريب
+    c.execute(f'SELECT TOTAL(revenueMinor) FROM shipment_stats {where_clause}', params)
+    stats = {
+        'totalShipments': total_shipments,
+        'totalRevenue': c.fetchone()[0] / MINOR_UNITS,
+        'deliveredShipments': delivered_shipments,
+        'pendingShipments': total_shipments - delivered_shipments,
+        'byStatus': by_status,
+        'byBranch': grouped('branch'),
+        'byCurrency': grouped('currency'),
+    }
+    if request.args.get('by_date') == '1':
+        stats['byDate'] = grouped('date')
+    return jsonify(stats), 200
+
 @app.route('/api/shipments', methods=['GET', 'POST'])
 @admin_required
 def handle_shipments():
     """يتعامل مع إنشاء واسترداد الشحنات."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
     if request.method == 'POST':
         new_shipment = request.json
         
-        # إدراج بيانات المرسل والمستلم في جدول جهات الاتصال
-        c.execute('INSERT INTO contacts (name, phone, country, city, address) VALUES (?, ?, ?, ?, ?)',
-                  (new_shipment['sender']['name'], new_shipment['sender']['phone'], new_shipment['sender']['country'], new_shipment['sender']['city'], new_shipment['sender']['address']))
-        sender_id = c.lastrowid
+        def insert_shipment(c):
+            # إعادة استخدام جهة اتصال المرسل والمستلم حسب رقم الهاتف أو إنشاؤها
+            sender_id = upsert_contact(c, new_shipment['sender'])
+            receiver_id = upsert_contact(c, new_shipment['receiver'])
         
-        c.execute('INSERT INTO contacts (name, phone, country, city, address) VALUES (?, ?, ?, ?, ?)',
-                  (new_shipment['receiver']['name'], new_shipment['receiver']['phone'], new_shipment['receiver']['country'], new_shipment['receiver']['city'], new_shipment['receiver']['address']))
-        receiver_id = c.lastrowid
+            # إنشاء كود التتبع من تسلسل الفرع داخل معاملة الكتابة نفسها
+            tracking_code = allocate_tracking_code(c, new_shipment.get('branch'))
         
-        # إنشاء كود التتبع
-        branch_prefix = "TOP" if new_shipment.get('branch') == 'topeka' else "BRA"
-        tracking_code = branch_prefix + str(int(time.time() * 1000))[-8:]
-        
-        # إدراج بيانات الشحنة الرئيسية
-        c.execute('''
-            INSERT INTO shipments (
-                shipmentNumber, invoiceNumber, date, time, branch, shippingType,
-                sender_id, receiver_id, paymentMethod, insurance, insuranceCost, packaging,
-                packagingCost, quantity, unitPrice, weight, itemType, contents,
-                finalPrice, currency, status, trackingCode
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            new_shipment['shipmentNumber'], new_shipment['invoiceNumber'],
-            new_shipment['date'], new_shipment['time'], new_shipment['branch'],
-            new_shipment['shippingType'], sender_id, receiver_id, new_shipment['paymentMethod'],
-            new_shipment['insurance'], new_shipment['insuranceCost'],
-            new_shipment['packaging'], new_shipment['packagingCost'],
-            new_shipment['quantity'], new_shipment['unitPrice'],
-            new_shipment['weight'], new_shipment['itemType'], new_shipment['contents'],
-            new_shipment['finalPrice'], new_shipment['currency'],
-            new_shipment['status'], tracking_code
-        ))
-        shipment_id = c.lastrowid
+            # إدراج بيانات الشحنة الرئيسية مع الأسعار المحسوبة على الخادم
+            c.execute(f'''
+                INSERT INTO shipments (
+                    shipmentNumber, invoiceNumber, date, time, branch, shippingType,
+                    sender_id, receiver_id, paymentMethod, insurance, packaging,
+                    itemType, contents, currency, status, trackingCode, {', '.join(PRICED_COLUMNS)}
+                ) VALUES ({', '.join(['?'] * (16 + len(PRICED_COLUMNS)))})
+            ''', (
+                new_shipment['shipmentNumber'], new_shipment['invoiceNumber'],
+                new_shipment['date'], new_shipment['time'], new_shipment['branch'],
+                new_shipment['shippingType'], sender_id, receiver_id, new_shipment['paymentMethod'],
+                new_shipment['insurance'], new_shipment['packaging'],
+                new_shipment['itemType'], new_shipment['contents'], new_shipment['currency'],
+                new_shipment['status'], tracking_code, *prices.values()
+            ))
+            shipment_id = c.lastrowid
         
-        # إدراج تحديث الحالة الأولي
-        initial_status = new_shipment['statusHistory'][0]
-        c.execute('INSERT INTO status_updates (shipment_id, status, city, notes, date, time) VALUES (?, ?, ?, ?, ?, ?)',
-                  (shipment_id, initial_status['status'], initial_status['city'], initial_status['notes'], initial_status['date'], initial_status['time']))
-
-        conn.commit()
-        conn.close()
+            # إدراج تحديث الحالة الأولي
+            initial_status = new_shipment['statusHistory'][0]
+            c.execute('INSERT INTO status_updates (shipment_id, status, city, notes, date, time) VALUES (?, ?, ?, ?, ?, ?)',
+                      (shipment_id, initial_status['status'], initial_status['city'], initial_status['notes'], initial_status['date'], initial_status['time']))
+            return shipment_id, tracking_code
+
+        prices = price_shipment(new_shipment)
+        shipment_id, tracking_code = get_writer().submit(insert_shipment)
         
         # إرجاع تفاصيل الشحنة التي تم إنشاؤها حديثًا
+        new_shipment.update(prices)
         new_shipment['id'] = shipment_id
         new_shipment['trackingCode'] = tracking_code
         return jsonify(new_shipment), 201
     
-    # طلب GET
+    # طلب GET: مرشحات وترتيب (sort) تُنفذ في SQL، مع ترقيم بالمؤشر (cursor، أو after_id للترتيب الافتراضي)
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        after_id = request.args.get('after_id', type=int)
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        ids = [int(shipment_id) for shipment_id in request.args.get('ids', '').split(',') if shipment_id]
+        sort_column, descending = parse_sort(request.args.get('sort'))
+        conditions, params = build_shipment_filters(filters_from_args(request.args))
+        if after_id is not None:
+            if sort_column != 'id':
+                raise ValueError('after_id only applies to the default sort; use cursor')
+            cursor = encode_cursor([after_id])
+        if cursor is not None:
+            # الصفحة التالية تبدأ بعد آخر صف بمقارنة (عمود الترتيب، المعرّف) التي يخدمها فهرس العمود
+            values = decode_cursor(cursor)
+            if len(values) != (1 if sort_column == 'id' else 2):
+                raise ValueError('Invalid cursor')
+            condition, condition_params = cursor_condition(sort_column, descending, values)
+            conditions.append(condition)
+            params += condition_params
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if ids:
+        conditions.append('s.id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(ids))
+    where_clause = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    order_by = shipment_order_by(sort_column, descending)
+
+    streaming = request.accept_mimetypes.best_match(('application/json', *JSON_LINES_MIMETYPES)) in JSON_LINES_MIMETYPES
+    if streaming:
+        # رقم التغيير ومؤشر الدفعة التالية والبث تُقرأ من لقطة واحدة؛ تُغلق المعاملة عند إعادة الاتصال إلى المجمع
+        conn.execute('BEGIN')
+    # رقم آخر تغيير يُقرأ قبل القائمة، فيبدأ منه العميل متابعة /api/changes دون أن يفوته تغيير
+    headers = {'X-Change-Seq': str(current_change_seq(c))}
+
+    # مع Accept: application/x-ndjson تُبث الشحنات المطابقة سطرًا لكل شحنة، حتى MAX_STREAM_SIZE شحنة في كل طلب
+    if streaming:
+        limit = max(1, min(MAX_STREAM_SIZE if limit is None else limit, MAX_STREAM_SIZE))
+        # مفتاح آخر صف في البث يُقرأ مسبقًا، فيُرسل مؤشر الدفعة التالية في الترويسات قبل بدء البث
+        key_columns = 's.id' if sort_column == 'id' else f's.{sort_column}, s.id'
+        last = c.execute(f'SELECT {key_columns} FROM shipments s {where_clause} ORDER BY {order_by} LIMIT 1 OFFSET ?',
+                         (*params, limit - 1)).fetchone()
+        if last is not None:
+            headers['X-Next-Cursor'] = encode_cursor(list(last))
+            if sort_column == 'id' and descending:
+                headers['X-Next-After-Id'] = str(last[0])
+        return Response(stream_with_context(stream_shipments(conn, where_clause, params, limit, fields, order_by)),
+                        mimetype=JSON_LINES_MIMETYPES[0], headers=headers)
+
+    # بدون مؤشر أو limit تُعاد كل الشحنات المطابقة كما في السابق
+    if cursor is not None and limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    # عمود الترتيب يلزم لبناء مؤشر الصفحة التالية
+    if fields is not None:
+        fields = fields | {sort_column}
+    shipments_list = query_shipments(c, where_clause, params, limit=limit, fields=fields, order_by=order_by)
+
+    response = jsonify(shipments_list)
+    response.headers.update(headers)
+    if limit is not None and len(shipments_list) == limit:
+        last = shipments_list[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor(
+            [last['id']] if sort_column == 'id' else [last[sort_column], last['id']])
+        if sort_column == 'id' and descending:
+            response.headers['X-Next-After-Id'] = str(last['id'])
+    return response
+
+# الحجم الافتراضي والأقصى لصفحة خلاصة التغييرات
+DEFAULT_CHANGES_PAGE_SIZE = 500
+MAX_CHANGES_PAGE_SIZE = 5000
+
+def current_change_seq(c):
+    """يعيد رقم آخر تغيير مسجل، أو 0 إذا لم يُسجل أي تغيير."""
+    row = c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'shipment_changes'").fetchone()
+    return row[0] if row else 0
+
+@app.route('/api/changes', methods=['GET'])
+@admin_required
+def shipment_changes():
+    """
+    يعيد الشحنات التي تغيرت بعد رقم التغيير since، مرتبة بآخر تغيير لكل شحنة: upsert مع الشحنة كاملة
+    (أو الحقول المطلوبة في fields) أو delete مع معرّفها فقط. يتابع العميل من قيمة next في الطلب التالي.
+    يبدأ العميل الجديد برقم X-Change-Seq من قائمة الشحنات، ويحصل على 410 إذا حُذفت التغييرات التي يحتاجها.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_CHANGES_PAGE_SIZE)), MAX_CHANGES_PAGE_SIZE))
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    c = get_db_connection().cursor()
+    latest = current_change_seq(c)
+    oldest = c.execute('SELECT MIN(seq) FROM shipment_changes').fetchone()[0]
+    if oldest is not None and since < oldest - 1:
+        return jsonify({"error": "Changes since this sequence are no longer available", "latest": latest}), 410
+
+    # آخر تغيير لكل شحنة فقط؛ التغييرات الأقدم لها تُغني عنها الأحدث
     c.execute('''
-        SELECT 
-            s.*,
-            sender.name AS sender_name, sender.phone AS sender_phone, sender.country AS sender_country, sender.city AS sender_city, sender.address AS sender_address,
-            receiver.name AS receiver_name, receiver.phone AS receiver_phone, receiver.country AS receiver_country, receiver.city AS receiver_city, receiver.address AS receiver_address
-        FROM shipments s
-        JOIN contacts sender ON s.sender_id = sender.id
-        JOIN contacts receiver ON s.receiver_id = receiver.id
-        ORDER BY s.id DESC
-    ''')
-    shipments = c.fetchall()
-    
-    shipments_list = []
-    for s in shipments:
-        s_dict = dict(s)
-        s_dict['sender'] = {'name': s_dict['sender_name'], 'phone': s_dict['sender_phone'], 'country': s_dict['sender_country'], 'city': s_dict['sender_city'], 'address': s_dict['sender_address']}
-        s_dict['receiver'] = {'name': s_dict['receiver_name'], 'phone': s_dict['receiver_phone'], 'country': s_dict['receiver_country'], 'city': s_dict['receiver_city'], 'address': s_dict['receiver_address']}
-        
-        c.execute('SELECT status, city, notes, date, time FROM status_updates WHERE shipment_id = ? ORDER BY id', (s_dict['id'],))
-        s_dict['statusHistory'] = [dict(row) for row in c.fetchall()]
-        
-        shipments_list.append(s_dict)
-    
-    conn.close()
-    return jsonify(shipments_list)
+        SELECT seq, shipment_id, kind FROM shipment_changes ch
+        WHERE seq > ? AND seq = (SELECT MAX(seq) FROM shipment_changes WHERE shipment_id = ch.shipment_id)
+        ORDER BY seq
+        LIMIT ?
+    ''', (since, limit))
+    rows = c.fetchall()
+    upserted = [row['shipment_id'] for row in rows if row['kind'] == 'upsert']
+    shipments_by_id = {
+        shipment['id']: shipment for shipment in query_shipments(
+            c, 'WHERE s.id IN (SELECT value FROM json_each(?))', (json.dumps(upserted),), fields=fields)
+    } if upserted else {}
+
+    changes = []
+    for row in rows:
+        # شحنة حُذفت بعد قراءة السجل تُعاد كحذف؛ سيصل تغيير حذفها في الطلب التالي أيضًا
+        shipment = shipments_by_id.get(row['shipment_id'])
+        if shipment is None:
+            changes.append({'seq': row['seq'], 'id': row['shipment_id'], 'op': 'delete'})
+        else:
+            changes.append({'seq': row['seq'], 'id': row['shipment_id'], 'op': 'upsert', 'shipment': shipment})
+    return jsonify({
+        'changes': changes,
+        'next': rows[-1]['seq'] if rows else max(since, 0),
+        'latest': latest,
+        'more': len(rows) == limit,
+    })
+
+@app.route('/api/shipments/facets', methods=['GET'])
+@admin_required
+def shipment_facets():
+    """
+    يعيد عدد الشحنات المطابقة للمرشحات نفسها التي تقبلها قائمة الشحنات، وأعدادها حسب الحالة والفرع.
+    أعداد كل حقل تتجاهل مرشح الحقل نفسه، فتظهر بقية قيمه للتبديل بينها.
+    تُقرأ من جدول الإحصاءات التراكمية ما لم يُطلب مرشح ليس من أبعاده (مثل paymentMethod).
+    """
+    try:
+        filters = filters_from_args(request.args)
+        build_shipment_filters(filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stats_columns = set(STATS_DIMENSIONS)
+    from_stats = all(SHIPMENT_FILTERS[name][0] in stats_columns for name in filters)
+    if from_stats:
+        source, count, prefix = 'shipment_stats', 'TOTAL(shipments)', ''
+    else:
+        source, count, prefix = 'shipments s', 'COUNT(*)', 's.'
+
+    def where(exclude=()):
+        conditions, params = build_shipment_filters(filters, prefix=prefix, exclude=exclude)
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+    c = get_db_connection().cursor()
+    where_clause, params = where()
+    facets = {'total': int(c.execute(f'SELECT {count} FROM {source} {where_clause}', params).fetchone()[0])}
+    for field in FACET_FIELDS:
+        where_clause, params = where(exclude=(field,))
+        c.execute(f'''
+            SELECT {prefix}{field}, {count} FROM {source} {where_clause}
+            GROUP BY 1 ORDER BY 2 DESC
+        ''', params)
+        facets[field] = {(row[0] or ''): int(row[1]) for row in c.fetchall()}
+    return jsonify(facets)
 
 @app.route('/api/shipments/<int:shipment_id>', methods=['GET', 'DELETE', 'PUT'])
 @admin_required
 def update_or_delete_shipment(shipment_id):
     """يتعامل مع تحديث وحذف الشحنات بواسطة المعرّف."""
-    conn = get_db_connection()
-    c = conn.cursor()
-    
     if request.method == 'GET':
-        c.execute('''
-            SELECT 
-                s.*,
-                sender.name AS sender_name, sender.phone AS sender_phone, sender.country AS sender_country, sender.city AS sender_city, sender.address AS sender_address,
-                receiver.name AS receiver_name, receiver.phone AS receiver_phone, receiver.country AS receiver_country, receiver.city AS receiver_city, receiver.address AS receiver_address
-            FROM shipments s
-            JOIN contacts sender ON s.sender_id = sender.id
-            JOIN contacts receiver ON s.receiver_id = receiver.id
-            WHERE s.id = ?
-        ''', (shipment_id,))
-        shipment = c.fetchone()
-        
-        if shipment:
-            shipment_dict = dict(shipment)
-            shipment_dict['sender'] = {'name': shipment_dict['sender_name'], 'phone': shipment_dict['sender_phone'], 'country': shipment_dict['sender_country'], 'city': shipment_dict['sender_city'], 'address': shipment_dict['sender_address']}
-            shipment_dict['receiver'] = {'name': shipment_dict['receiver_name'], 'phone': shipment_dict['receiver_phone'], 'country': shipment_dict['receiver_country'], 'city': shipment_dict['receiver_city'], 'address': shipment_dict['receiver_address']}
-            
-            c.execute('SELECT status, city, notes, date, time FROM status_updates WHERE shipment_id = ? ORDER BY id', (shipment_dict['id'],))
-            shipment_dict['statusHistory'] = [dict(row) for row in c.fetchall()]
-
-            conn.close()
-            return jsonify(shipment_dict), 200
-        else:
-            conn.close()
-            return jsonify({"error": "Shipment not found"}), 404
+        cache = get_shipment_cache()
+        shipment = cache.get(shipment_id)
+        if shipment is None:
+            generation = cache.generation()
+            shipments_list = query_shipments(get_db_connection().cursor(), 'WHERE s.id = ?', (shipment_id,))
+            if not shipments_list:
+                return jsonify({"error": "Shipment not found"}), 404
+            shipment = shipments_list[0]
+            cache.put(shipment_id, shipment, generation)
+        return jsonify(shipment), 200
 
     if request.method == 'DELETE':
-        # الحصول على معرّفات جهات الاتصال قبل حذف الشحنة
-        c.execute('SELECT sender_id, receiver_id FROM shipments WHERE id = ?', (shipment_id,))
-        contact_ids = c.fetchone()
-        
-        if contact_ids:
+        def delete_shipment(c):
+            # الحصول على معرّفات جهات الاتصال قبل حذف الشحنة
+            c.execute('SELECT sender_id, receiver_id FROM shipments WHERE id = ?', (shipment_id,))
+            contact_ids = c.fetchone()
+            if not contact_ids:
+                return False
             sender_id, receiver_id = contact_ids['sender_id'], contact_ids['receiver_id']
             c.execute('DELETE FROM status_updates WHERE shipment_id = ?', (shipment_id,))
             c.execute('DELETE FROM shipments WHERE id = ?', (shipment_id,))
-            c.execute('DELETE FROM contacts WHERE id IN (?, ?)', (sender_id, receiver_id))
-            conn.commit()
-            conn.close()
+            delete_orphan_contacts(c, (sender_id, receiver_id))
+            invalidate_cached_shipments((shipment_id,))
+            return True
+
+        if get_writer().submit(delete_shipment):
             return '', 204
         else:
-            conn.close()
             return jsonify({"error": "Shipment not found"}), 404
 
     if request.method == 'PUT':
         updated_shipment = request.json
-        c.execute('SELECT * FROM shipments WHERE id = ?', (shipment_id,))
-        existing_shipment = c.fetchone()
-
-        if existing_shipment:
-            # تحديث جهات اتصال المرسل والمستلم
-            c.execute('UPDATE contacts SET name=?, phone=?, country=?, city=?, address=? WHERE id=?',
-                      (updated_shipment['sender']['name'], updated_shipment['sender']['phone'], updated_shipment['sender']['country'], updated_shipment['sender']['city'], updated_shipment['sender']['address'], existing_shipment['sender_id']))
-            c.execute('UPDATE contacts SET name=?, phone=?, country=?, city=?, address=? WHERE id=?',
-                      (updated_shipment['receiver']['name'], updated_shipment['receiver']['phone'], updated_shipment['receiver']['country'], updated_shipment['receiver']['city'], updated_shipment['receiver']['address'], existing_shipment['receiver_id']))
-
-            # تحديث بيانات الشحنة الرئيسية
-            c.execute('''
+        prices = price_shipment(updated_shipment)
+
+        def update_shipment(c):
+            c.execute('SELECT * FROM shipments WHERE id = ?', (shipment_id,))
+            existing_shipment = c.fetchone()
+            if not existing_shipment:
+                return False
+
+            # ربط الشحنة بجهات اتصال المرسل والمستلم حسب رقم الهاتف (قد يتغير الرقم فتتغير جهة الاتصال)
+            sender_id = upsert_contact(c, updated_shipment['sender'])
+            receiver_id = upsert_contact(c, updated_shipment['receiver'])
+
+            # تحديث بيانات الشحنة الرئيسية مع إعادة حساب الأسعار على الخادم
+            c.execute(f'''
                 UPDATE shipments SET
                     shipmentNumber=?, invoiceNumber=?, date=?, time=?, branch=?, shippingType=?,
-                    paymentMethod=?, insurance=?, insuranceCost=?, packaging=?, packagingCost=?,
-                    quantity=?, unitPrice=?, weight=?, itemType=?, contents=?, finalPrice=?, currency=?
+                    sender_id=?, receiver_id=?,
+                    paymentMethod=?, insurance=?, packaging=?, itemType=?, contents=?, currency=?,
+                    {', '.join(f'{column}=?' for column in PRICED_COLUMNS)}
                 WHERE id=?
             ''', (
                 updated_shipment['shipmentNumber'], updated_shipment['invoiceNumber'],
                 updated_shipment['date'], updated_shipment['time'], updated_shipment['branch'],
-                updated_shipment['shippingType'], updated_shipment['paymentMethod'],
-                updated_shipment['insurance'], updated_shipment['insuranceCost'],
-                updated_shipment['packaging'], updated_shipment['packagingCost'],
-                updated_shipment['quantity'], updated_shipment['unitPrice'],
-                updated_shipment['weight'], updated_shipment['itemType'], updated_shipment['contents'],
-                updated_shipment['finalPrice'], updated_shipment['currency'], shipment_id
+                updated_shipment['shippingType'], sender_id, receiver_id, updated_shipment['paymentMethod'],
+                updated_shipment['insurance'], updated_shipment['packaging'],
+                updated_shipment['itemType'], updated_shipment['contents'], updated_shipment['currency'],
+                *prices.values(), shipment_id
             ))
-            conn.commit()
-            conn.close()
+            delete_orphan_contacts(c, (existing_shipment['sender_id'], existing_shipment['receiver_id']))
+            invalidate_cached_shipments((shipment_id,))
+            return True
+
+        if get_writer().submit(update_shipment):
+            updated_shipment.update(prices)
             return jsonify(updated_shipment), 200
     
-        conn.close()
         return jsonify({"error": "Shipment not found"}), 404
 
 @app.route('/api/shipments/search', methods=['POST'])
+@admin_required
 def search_shipments():
-    """يبحث عن الشحنات بناءً على معايير مختلفة."""
+    """يبحث عن الشحنات في فهرس البحث النصي ويعيدها مرتبة حسب الصلة."""
+    data = request.json
+    try:
+        limit = max(1, min(int(data.get('limit', DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid limit"}), 400
+
+    # كل كلمة في البحث تُطابق كبادئة، ويجب أن تتحقق كل الكلمات معًا
+    terms = re.findall(r'[^\W_]+', normalize_arabic(data.get('query', '')))
+    
     conn = get_db_connection()
     c = conn.cursor()
-    search_term = f"%{request.json.get('query', '').lower()}%"
+
+    if not terms:
+        shipments_list = query_shipments(c, limit=limit)
+        return jsonify(shipments_list)
+
+    weights = ', '.join(str(weight) for _, _, weight in SEARCH_COLUMNS)
+    c.execute(f'''
+        SELECT rowid FROM shipments_fts
+        WHERE shipments_fts MATCH ?
+        ORDER BY bm25(shipments_fts, {weights})
+        LIMIT ?
+    ''', (' '.join(f'"{term}"*' for term in terms), limit))
+    ranked_ids = [row['rowid'] for row in c.fetchall()]
+
+    shipments_by_id = {
+        s['id']: s for s in query_shipments(c, 'WHERE s.id IN (SELECT value FROM json_each(?))', (json.dumps(ranked_ids),))
+    }
+    shipments_list = [shipments_by_id[shipment_id] for shipment_id in ranked_ids if shipment_id in shipments_by_id]
     
+    return jsonify(shipments_list)
+
+def tracking_info(c, shipment_id, shipment=None):
+    """يبني بيانات التتبع العامة لشحنة (دون بيانات المرسل والمستلم)، أو None إذا لم تعد موجودة."""
+    if shipment is None:
+        shipment = c.execute('SELECT trackingCode, status, weight, contents FROM shipments WHERE id = ?',
+                             (shipment_id,)).fetchone()
+        if shipment is None:
+            return None
+    c.execute('SELECT status, city, notes, date, time FROM status_updates WHERE shipment_id = ? ORDER BY id', (shipment_id,))
+    return {
+        'trackingCode': shipment['trackingCode'],
+        'status': shipment['status'],
+        'weight': shipment['weight'],
+        'contents': shipment['contents'],
+        'statusHistory': [dict(row) for row in c.fetchall()],
+    }
+
+def tracking_code_variants(tracking_code):
+    """الأكواد تُولد بأحرف كبيرة: يُبحث عن الكود كما كُتب وبأحرف كبيرة، مع بقاء البحث على الفهرس الفريد."""
+    tracking_code = tracking_code.strip()
+    return tracking_code, tracking_code.upper()
+
+def find_tracking_shipment_id(c, tracking_code):
+    """يعيد معرّف الشحنة ذات كود التتبع، أو None إذا لم توجد."""
+    row = c.execute('SELECT id FROM shipments WHERE trackingCode IN (?, ?)', tracking_code_variants(tracking_code)).fetchone()
+    return row[0] if row else None
+
+def event_resync_needed(last_event_id, start_seq):
+    """يحدد هل فاتت الاتصالَ المعاد أحداثٌ: Last-Event-ID أقدم من موضع الموزع أو غير صالح."""
+    try:
+        return int(last_event_id if last_event_id is not None else start_seq) < start_seq
+    except ValueError:
+        return True
+
+@app.route('/api/track/<tracking_code>', methods=['GET'])
+def track_shipment(tracking_code):
+    """يعيد سجل الحالات العام لشحنة واحدة بكود التتبع، مع ETag يسمح بالرد 304 على الاستعلامات المتكررة."""
+    conn = get_db_connection()
+    c = conn.cursor()
     c.execute('''
-        SELECT 
-            s.*,
-            sender.name AS sender_name, sender.phone AS sender_phone, sender.country AS sender_country, sender.city AS sender_city, sender.address AS sender_address,
-            receiver.name AS receiver_name, receiver.phone AS receiver_phone, receiver.country AS receiver_country, receiver.city AS receiver_city, receiver.address AS receiver_address
+        SELECT s.id, s.trackingCode, s.status, s.weight, s.contents,
+               (SELECT MAX(id) FROM status_updates WHERE shipment_id = s.id) AS last_update_id
         FROM shipments s
-        JOIN contacts sender ON s.sender_id = sender.id
-        JOIN contacts receiver ON s.receiver_id = receiver.id
-        WHERE
-            lower(s.shipmentNumber) LIKE ? OR
-            lower(s.invoiceNumber) LIKE ? OR
-            lower(s.trackingCode) LIKE ?
-        ORDER BY s.id DESC
-    ''', (search_term, search_term, search_term))
-    
-    shipments = c.fetchall()
-    
-    shipments_list = []
-    for s in shipments:
-        s_dict = dict(s)
-        s_dict['sender'] = {'name': s_dict['sender_name'], 'phone': s_dict['sender_phone'], 'country': s_dict['sender_country'], 'city': s_dict['sender_city'], 'address': s_dict['sender_address']}
-        s_dict['receiver'] = {'name': s_dict['receiver_name'], 'phone': s_dict['receiver_phone'], 'country': s_dict['receiver_country'], 'city': s_dict['receiver_city'], 'address': s_dict['receiver_address']}
-        
-        c.execute('SELECT status, city, notes, date, time FROM status_updates WHERE shipment_id = ? ORDER BY id', (s_dict['id'],))
-        s_dict['statusHistory'] = [dict(row) for row in c.fetchall()]
-        
-        shipments_list.append(s_dict)
-    
-    conn.close()
-    return jsonify(shipments_list)
+        WHERE s.trackingCode IN (?, ?)
+    ''', tracking_code_variants(tracking_code))
+    shipment = c.fetchone()
+
+    if not shipment:
+        return jsonify({"error": "Shipment not found"}), 404
+
+    # يتغير الوسم مع كل تحديث حالة جديد أو تعديل على الحقول المعروضة
+    etag_source = f"{shipment['id']}:{shipment['last_update_id']}:{shipment['status']}:{shipment['weight']}:{shipment['contents']}"
+    etag = hashlib.sha1(etag_source.encode('utf-8')).hexdigest()[:16]
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(tracking_info(c, shipment['id'], shipment))
+
+    response.set_etag(etag)
+    # يعيد المتصفح التحقق في كل مرة، فيحصل على 304 ما لم تتغير الشحنة
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+def stream_events(broker, subscription, resync):
+    """يولد أحداث المشترك حتى ينقطع العميل أو يبلغ الاتصال أقصى عمره، مع نبضة إبقاء عند الخمول."""
+    try:
+        yield f'retry: {EVENTS_RETRY_MS}\n\n'.encode('utf-8')
+        if resync:
+            yield format_event('resync', {})
+        deadline = time.monotonic() + EVENTS_MAX_AGE
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if subscription.overflowed:
+                yield format_event('resync', {})
+                return
+            try:
+                yield subscription.events.get(timeout=min(EVENTS_HEARTBEAT, remaining))
+            except queue.Empty:
+                # الكتابة إلى اتصال مغلق تفشل هنا فيُحرر الاشتراك خلال فترة نبضة واحدة
+                yield b': ping\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+@app.route('/api/events', methods=['GET'])
+def shipment_events():
+    """
+    يبث أحداث الشحنات بصيغة Server-Sent Events. مع trackingCode يتلقى العميل (صفحة التتبع العامة)
+    أحداث tracking لشحنته فقط، ودونه يتلقى المسؤول أحداث shipment لكل إنشاء أو تعديل أو تغيير حالة أو حذف.
+    إذا أعاد المتصفح الاتصال بـ Last-Event-ID أقدم من موضع الموزع يصله resync ليعيد تحميل البيانات.
+    في الإنتاج يخدم هذا المسار events_server.py دون خيط لكل اتصال؛ هذا المسار لخادم التطوير.
+    """
+    tracking_code = request.args.get('trackingCode')
+    if tracking_code:
+        shipment_id = find_tracking_shipment_id(get_db_connection().cursor(), tracking_code)
+        if shipment_id is None:
+            return jsonify({"error": "Shipment not found"}), 404
+    elif session.get('logged_in'):
+        shipment_id = None
+    else:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    broker = get_event_broker()
+    client = request.headers.get(EVENTS_CLIENT_HEADER) if EVENTS_CLIENT_HEADER else request.remote_addr
+    subscription = broker.subscribe(shipment_id, client)
+    if subscription is None:
+        response = jsonify({"error": "Too many event subscribers"})
+        response.headers['Retry-After'] = str(int(EVENTS_RETRY_MS / 1000))
+        return response, 503
+    resync = event_resync_needed(request.headers.get('Last-Event-ID'), subscription.start_seq)
+
+    # لا يُستخدم stream_with_context: يعود اتصال قاعدة البيانات إلى المجمع قبل بدء البث
+    response = Response(stream_events(broker, subscription, resync), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # يمنع nginx من تجميع الأحداث في ذاكرته المؤقتة
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/shipments/update_status', methods=['POST'])
 @admin_required
 def update_status():
-    """يحدث حالة شحنات متعددة."""
+    """يحدث حالة شحنات متعددة بجملتين على مستوى المجموعة داخل معاملة واحدة."""
     data = request.json
     selected_ids = data.get('selectedIds', [])
     new_status = data.get('newStatus')
     current_city = data.get('currentCity')
     status_notes = data.get('statusNotes')
-    
-    conn = get_db_connection()
-    c = conn.cursor()
 
-    for shipment_id in selected_ids:
-        c.execute('UPDATE shipments SET status = ? WHERE id = ?', (new_status, shipment_id))
-        
-        c.execute('INSERT INTO status_updates (shipment_id, status, city, notes, date, time) VALUES (?, ?, ?, ?, ?, ?)',
-                  (shipment_id, new_status, current_city, status_notes, data.get('date'), data.get('time')))
-    
-    conn.commit()
-    conn.close()
-    return jsonify({'message': 'Status updated successfully'})
-    
+    # التحقق من المدخلات قبل أي كتابة
+    if new_status not in SHIPMENT_STATUSES:
+        return jsonify({"error": "Invalid status"}), 400
+    if (not isinstance(selected_ids, list) or not selected_ids
+            or not all(isinstance(shipment_id, int) and not isinstance(shipment_id, bool) for shipment_id in selected_ids)):
+        return jsonify({"error": "selectedIds must be a non-empty list of shipment ids"}), 400
+    ids_json = json.dumps(sorted(set(selected_ids)))
+
+    def apply_status(c):
+        # تُحدَّث فقط الشحنات التي تتغير حالتها فعلاً
+        c.execute('''
+            UPDATE shipments SET status = ?
+            WHERE id IN (SELECT value FROM json_each(?)) AND status IS NOT ?
+        ''', (new_status, ids_json, new_status))
+        changed = c.rowcount
+        # يُضاف سجل الحالة لكل شحنة موجودة حتى لو بقيت حالتها كما هي (مثل تغيير المدينة)
+        c.execute('''
+            INSERT INTO status_updates (shipment_id, status, city, notes, date, time)
+            SELECT id, ?, ?, ?, ?, ? FROM shipments
+            WHERE id IN (SELECT value FROM json_each(?))
+            ORDER BY id
+        ''', (new_status, current_city, status_notes, data.get('date'), data.get('time'), ids_json))
+        invalidate_cached_shipments(set(selected_ids))
+        return c.rowcount, changed
+
+    matched, changed = get_writer().submit(apply_status)
+    return jsonify({'message': 'Status updated successfully', 'matched': matched, 'changed': changed})
+
+# عدد الصفوف التي تُدرج في معاملة واحدة أثناء الاستيراد الجماعي
+BULK_IMPORT_CHUNK_SIZE = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', 5000))
+# الحد الأقصى لعدد أخطاء الصفوف المعادة في تقرير الاستيراد
+MAX_IMPORT_ERRORS = 1000
+# الحقول الإلزامية في كل شحنة مستوردة إلى جانب اسمي المرسل والمستلم
+REQUIRED_IMPORT_FIELDS = ('shipmentNumber', 'date', 'branch', 'status')
+# الحقول التي يجب أن تكون أعدادًا إذا وُجدت
+NUMERIC_IMPORT_FIELDS = ('insuranceCost', 'packagingCost', 'quantity', 'unitPrice', 'weight', 'finalPrice')
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+JSON_LINES_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}$')
+# حقول سجل الحالات التي تُخزن لكل شحنة مستوردة
+STATUS_HISTORY_FIELDS = ('status', 'city', 'notes', 'date', 'time')
+
+def _check_import_scalars(values, fields, label):
+    """يرفع ValueError إذا كانت قيمة أحد الحقول المخزنة ليست نصًا أو رقمًا (كائن أو قائمة مثلًا)."""
+    # يُمر على قيم الصف الموجودة فقط، وأغلبها نصوص وأرقام فلا يُبحث في fields إلا نادرًا
+    for field, value in values.items():
+        if value is not None and not isinstance(value, (str, int, float)) and field in fields:
+            raise ValueError(f'{label}{field} must be a text or a number')
+
+def _xlsx_cell_value(value):
+    """يحول قيم التاريخ والوقت في خلايا Excel إلى النصوص التي يخزنها التطبيق."""
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d') if value.time() == datetime.time() else value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M')
+    return value
+
+def _read_import_xlsx(file):
+    """يقرأ الورقة الأولى من ملف Excel؛ الصف الأول أسماء الحقول (مثل shipmentNumber و sender_name)."""
+    try:
+        wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except Exception:
+        raise ValueError('Invalid xlsx file')
+
+    def rows():
+        try:
+            sheet_rows = wb.active.iter_rows(values_only=True)
+            header = [str(name).strip() if name is not None else '' for name in next(sheet_rows, ())]
+            for number, values in enumerate(sheet_rows, start=2):
+                if all(value in (None, '') for value in values):
+                    continue
+                yield number, {name: _xlsx_cell_value(value) for name, value in zip(header, values)
+                               if name and value is not None}
+        finally:
+            wb.close()
+
+    return rows()
+
+def _read_import_json_lines(stream):
+    """يقرأ شحنة من كل سطر JSON؛ السطر غير الصالح يُعاد كاستثناء ليُسجل كخطأ في صفه."""
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f'Invalid JSON: {e}')
+
+def open_import_rows():
+    """
+    يحدد صيغة طلب الاستيراد ويعيد مولّد أزواج (رقم الصف، الشحنة).
+    يقبل ملف xlsx أو JSON lines أو مصفوفة JSON (بصيغة shipments.json)، إما في جسم الطلب أو كملف باسم file.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        name = (upload.filename or '').lower()
+        stream, mimetype = upload.stream, upload.mimetype
+        if name.endswith('.xlsx'):
+            mimetype = XLSX_MIMETYPE
+        elif name.endswith(('.jsonl', '.ndjson')):
+            mimetype = JSON_LINES_MIMETYPES[0]
+        elif name.endswith('.json'):
+            mimetype = 'application/json'
+    else:
+        # جسم الطلب الخام غير مخزن مؤقتًا، فقراءة الأسطر منه مباشرة تقرأ بايتًا بايتًا
+        stream, mimetype = io.BufferedReader(request.stream), request.mimetype
+
+    if mimetype == XLSX_MIMETYPE:
+        return _read_import_xlsx(io.BytesIO(stream.read()))
+    if mimetype in JSON_LINES_MIMETYPES:
+        return _read_import_json_lines(stream)
+    try:
+        data = json.load(stream)
+    except ValueError:
+        raise ValueError('Invalid JSON body')
+    if isinstance(data, dict):
+        data = data.get('shipments')
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of shipments')
+    return enumerate(data, start=1)
+
+def validate_import_row(shipment):
+    """
+    يتحقق من شحنة مستوردة ويعيدها بالصيغة المتداخلة التي يقبلها POST /api/shipments؛ يرفع ValueError عند الخطأ.
+    تُقبل حقول جهات الاتصال المسطحة (sender_name أو sender.name) كما في أعمدة Excel.
+    """
+    if not isinstance(shipment, dict):
+        raise ValueError('Shipment must be an object')
+    shipment = dict(shipment)
+    for role in ('sender', 'receiver'):
+        contact = shipment.get(role)
+        if not isinstance(contact, dict):
+            contact = {}
+            for field in CONTACT_FIELDS:
+                for key in (f'{role}_{field}', f'{role}.{field}'):
+                    if key in shipment:
+                        contact[field] = shipment.pop(key)
+            shipment[role] = contact
+        _check_import_scalars(contact, CONTACT_FIELDS, f'{role}.')
+        if not str(contact.get('name') or '').strip():
+            raise ValueError(f'{role}.name is required')
+    _check_import_scalars(shipment, SHIPMENT_COLUMNS, '')
+
+    missing = [field for field in REQUIRED_IMPORT_FIELDS if shipment.get(field) in (None, '')]
+    if missing:
+        raise ValueError('Missing fields: ' + ', '.join(missing))
+    if shipment['status'] not in SHIPMENT_STATUSES:
+        raise ValueError(f"Invalid status: {shipment['status']}")
+    if not DATE_PATTERN.match(str(shipment['date'])):
+        raise ValueError('date must be YYYY-MM-DD')
+    for field in NUMERIC_IMPORT_FIELDS:
+        if shipment.get(field) not in (None, ''):
+            try:
+                float(shipment[field])
+            except (TypeError, ValueError):
+                raise ValueError(f'{field} must be a number')
+
+    # بدون سجل حالات يُنشأ سجل أولي من حالة الشحنة وتاريخها
+    history = shipment.get('statusHistory') or [
+        {'status': shipment['status'], 'city': '', 'notes': '', 'date': shipment['date'], 'time': shipment.get('time')}
+    ]
+    if not isinstance(history, list) or not all(
+            isinstance(entry, dict) and entry.get('status') in SHIPMENT_STATUSES for entry in history):
+        raise ValueError('Invalid statusHistory')
+    for entry in history:
+        _check_import_scalars(entry, STATUS_HISTORY_FIELDS, 'statusHistory.')
+    shipment['statusHistory'] = history
+    if shipment.get('trackingCode') not in (None, ''):
+        shipment['trackingCode'] = str(shipment['trackingCode']).strip()
+    else:
+        shipment['trackingCode'] = None
+    return shipment
+
+def insert_shipment_chunk(chunk):
+    """
+    يبني عملية كتابة تدرج دفعة من الشحنات المتحقق منها بجمل executemany وتعيد (عدد المدرج، أخطاء الصفوف).
+    تُحجز المعرّفات وأكواد التتبع داخل معاملة خيط الكتابة، فلا تتعارض مع عمليات الكتابة الأخرى.
+    """
+    def job(c):
+        errors = []
+        provided_codes = [shipment['trackingCode'] for _, shipment in chunk if shipment['trackingCode']]
+        taken_codes = set()
+        if provided_codes:
+            c.execute('SELECT trackingCode FROM shipments WHERE trackingCode IN (SELECT value FROM json_each(?))',
+                      (json.dumps(provided_codes),))
+            taken_codes = {row[0] for row in c.fetchall()}
+
+        accepted = []
+        for number, shipment in chunk:
+            tracking_code = shipment['trackingCode']
+            if tracking_code:
+                if tracking_code in taken_codes:
+                    errors.append({'row': number, 'error': f'Duplicate trackingCode: {tracking_code}'})
+                    continue
+                taken_codes.add(tracking_code)
+            accepted.append(shipment)
+        reserve_tracking_codes(c, [shipment['trackingCode'] for shipment in accepted if shipment['trackingCode']])
+
+        # الشحنات بدون كود تتبع تحصل على أكواد متتالية من تسلسل فرعها بجملة واحدة لكل فرع
+        without_code = defaultdict(list)
+        for shipment in accepted:
+            if not shipment['trackingCode']:
+                without_code[shipment['branch']].append(shipment)
+        for branch, shipments in without_code.items():
+            for shipment, tracking_code in zip(shipments, allocate_tracking_codes(c, branch, len(shipments))):
+                shipment['trackingCode'] = tracking_code
+
+        # جهات الاتصال ذات رقم الهاتف تُدمج حسب مفتاحه (آخر بياناتها في الدفعة هي المعتمدة)
+        keyed_contacts = {}
+        for shipment in accepted:
+            for role in ('sender', 'receiver'):
+                phone_key = normalize_phone(shipment[role].get('phone'))
+                if phone_key:
+                    keyed_contacts[phone_key] = tuple(shipment[role].get(field) for field in CONTACT_FIELDS) + (phone_key,)
+        existing = c.execute('SELECT COUNT(*) FROM contacts WHERE phone_key IN (SELECT value FROM json_each(?))',
+                             (json.dumps(list(keyed_contacts)),)).fetchone()[0]
+        c.executemany(CONTACT_UPSERT, keyed_contacts.values())
+        # تحديث جهات اتصال موجودة قد يغير شحنات سابقة كثيرة، فتُفرغ الذاكرة المؤقتة كلها بعد التثبيت
+        if c.rowcount > len(keyed_contacts) - existing:
+            get_writer().after_commit(lambda: get_shipment_cache().clear())
+        c.execute('SELECT phone_key, id FROM contacts WHERE phone_key IN (SELECT value FROM json_each(?))',
+                  (json.dumps(list(keyed_contacts)),))
+        contact_ids = {row[0]: row[1] for row in c.fetchall()}
+
+        contact_id = c.execute('SELECT COALESCE(MAX(id), 0) FROM contacts').fetchone()[0]
+        shipment_id = c.execute('SELECT COALESCE(MAX(id), 0) FROM shipments').fetchone()[0]
+        contacts, shipment_rows, status_rows = [], [], []
+        for shipment in accepted:
+            shipment_id += 1
+            # السعر النهائي المستورد هو ما دُفع فعلًا، فلا يُعاد حسابه بقواعد التسعير الحالية
+            ids = {'id': shipment_id, **price_shipment(shipment, charged=shipment.get('finalPrice'))}
+            for role in ('sender', 'receiver'):
+                phone_key = normalize_phone(shipment[role].get('phone'))
+                if phone_key:
+                    ids[f'{role}_id'] = contact_ids[phone_key]
+                    continue
+                # جهة اتصال بدون هاتف تُنشأ كصف جديد
+                contact_id += 1
+                ids[f'{role}_id'] = contact_id
+                contacts.append((contact_id, *(shipment[role].get(field) for field in CONTACT_FIELDS)))
+            shipment_rows.append(tuple(ids[column] if column in ids else shipment.get(column)
+                                       for column in SHIPMENT_COLUMNS))
+            status_rows += [(shipment_id, entry['status'], entry.get('city'), entry.get('notes'),
+                             entry.get('date'), entry.get('time')) for entry in shipment['statusHistory']]
+
+        c.executemany('INSERT INTO contacts (id, name, phone, country, city, address) VALUES (?, ?, ?, ?, ?, ?)', contacts)
+        c.executemany(f'''
+            INSERT INTO shipments ({', '.join(SHIPMENT_COLUMNS)})
+            VALUES ({', '.join(['?'] * len(SHIPMENT_COLUMNS))})
+        ''', shipment_rows)
+        c.executemany('INSERT INTO status_updates (shipment_id, status, city, notes, date, time) VALUES (?, ?, ?, ?, ?, ?)',
+                      status_rows)
+        return len(accepted), errors
+
+    return job
+
+@app.route('/api/shipments/bulk', methods=['POST'])
+@admin_required
+def bulk_import_shipments():
+    """
+    يستورد الشحنات دفعة واحدة من xlsx أو JSON lines أو مصفوفة JSON.
+    تُتحقق كل شحنة على حدة، وتُدرج الصالحة في معاملات من BULK_IMPORT_CHUNK_SIZE صف، ويُعاد تقرير بأخطاء الصفوف.
+    """
+    try:
+        rows = open_import_rows()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    received = imported = failed = 0
+    errors = []
+
+    def record_errors(row_errors):
+        nonlocal failed
+        failed += len(row_errors)
+        errors.extend(row_errors[:MAX_IMPORT_ERRORS - len(errors)])
+
+    def flush(chunk):
+        nonlocal imported
+        # دفعة ترفضها قاعدة البيانات تُلغى وحدها، وتبقى الدفعات المثبتة قبلها معدودة في التقرير
+        try:
+            inserted, row_errors = get_writer().submit(insert_shipment_chunk(chunk))
+        except sqlite3.Error as e:
+            app.logger.exception('Bulk import chunk rejected')
+            inserted, row_errors = 0, [{'row': number, 'error': f'Chunk rejected: {e}'} for number, _ in chunk]
+        imported += inserted
+        record_errors(row_errors)
+
+    chunk = []
+    for number, shipment in rows:
+        received += 1
+        try:
+            # قارئ JSON lines يعيد الأسطر غير الصالحة كاستثناءات
+            if isinstance(shipment, Exception):
+                raise shipment
+            chunk.append((number, validate_import_row(shipment)))
+        except ValueError as e:
+            record_errors([{'row': number, 'error': str(e)}])
+            continue
+        if len(chunk) >= BULK_IMPORT_CHUNK_SIZE:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    if not received:
+        return jsonify({"error": "No shipments provided to import"}), 400
+    report = {
+        'received': received,
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+        'errorsTruncated': failed > len(errors),
+    }
+    return jsonify(report), 201 if imported else 400
+
+# عناوين أعمدة تقرير التصدير
+EXPORT_HEADERS = [
+    "رقم الشحنة", "كود التتبع", "المرسل", "هاتف المرسل", "دولة المرسل", "مدينة المرسل",
+    "المستلم", "هاتف المستلم", "دولة المستلم", "مدينة المستلم",
+    "العدد", "الوزن (كغ)", "النوع", "المحتويات", "السعر الأساسي", "تكلفة التأمين",
+    "تكلفة التغليف", "تعديل السعر", "السعر النهائي", "العملة", "طريقة الدفع", "الحالة"
+]
+# الحقول التي يقرؤها التصدير من قاعدة البيانات
+EXPORT_FIELDS = {
+    'shipmentNumber', 'trackingCode', 'sender', 'receiver', 'quantity', 'weight', 'itemType',
+    'contents', 'currency', 'paymentMethod', 'status', *PRICE_COLUMNS
+}
+# حجم الأجزاء المرسلة عند بث ملف التصدير
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def export_rows(cursor):
+    """يولد صفوف التقرير مباشرة من مؤشر قاعدة البيانات دون تحميل النتائج كلها في الذاكرة."""
+    for shipment in cursor:
+        yield [
+            str(shipment['shipmentNumber'] or ''),
+            str(shipment['trackingCode'] or ''),
+            str(shipment['sender_name'] or ''),
+            str(shipment['sender_phone'] or ''),
+            str(shipment['sender_country'] or ''),
+            str(shipment['sender_city'] or ''),
+            str(shipment['receiver_name'] or ''),
+            str(shipment['receiver_phone'] or ''),
+            str(shipment['receiver_country'] or ''),
+            str(shipment['receiver_city'] or ''),
+            str(shipment['quantity'] if shipment['quantity'] is not None else ''),
+            str(shipment['weight'] if shipment['weight'] is not None else ''),
+            str(shipment['itemType'] or ''),
+            str(shipment['contents'] or ''),
+            format_minor_units(shipment['basePriceMinor']),
+            format_minor_units(shipment['insuranceCostMinor']),
+            format_minor_units(shipment['packagingCostMinor']),
+            format_minor_units(shipment['priceAdjustmentMinor']),
+            format_minor_units(shipment['finalPriceMinor']),
+            str(shipment['currency'] or ''),
+            "دفع مقدم" if shipment['paymentMethod'] == 'prepaid' else "دفع عكسي",
+            str(shipment['status'] or '')
+        ]
+
+def _stream_file(file):
+    """يبث محتوى ملف مؤقت على أجزاء ثم يغلقه."""
+    try:
+        while True:
+            chunk = file.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
 @app.route('/api/shipments/export_excel', methods=['POST'])
 @admin_required
 def export_excel():
-    """يولد ملف Excel من الشحنات المحددة ويعيده."""
+    """
+    يولد تقريرًا للشحنات المحددة بالمعرّفات (ids) أو بمرشح (filter) بقراءتها مباشرة من قاعدة البيانات.
+    يُكتب ملف Excel بوضع write_only إلى ملف مؤقت ثم يُبث، أما CSV فيُبث صفًا بصف.
+    """
     data = request.json
-    shipments_to_export = data.get('shipments', [])
+    ids = data.get('ids')
+    filters = data.get('filter')
+    export_format = data.get('format', 'xlsx')
 
-    if not shipments_to_export:
+    if not ids and not filters:
         return jsonify({"error": "No shipments provided to export"}), 400
+    if export_format not in ('xlsx', 'csv'):
+        return jsonify({"error": "Unsupported export format"}), 400
 
+    conditions = []
+    params = []
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Shipments Report"
-        
-        headers = [
-            "رقم الشحنة", "كود التتبع", "المرسل", "هاتف المرسل", "دولة المرسل", "مدينة المرسل",
-            "المستلم", "هاتف المستلم", "دولة المستلم", "مدينة المستلم",
-            "العدد", "الوزن (كغ)", "النوع", "المحتويات", "السعر الأساسي", "تكلفة التأمين",
-            "تكلفة التغليف", "السعر النهائي", "العملة", "طريقة الدفع", "الحالة"
-        ]
-        ws.append(headers)
-        
-        for shipment in shipments_to_export:
-            weight = float(shipment.get('weight', 0))
-            unit_price = float(shipment.get('unitPrice', 0))
-            insurance_cost = float(shipment.get('insuranceCost', 0))
-            packaging_cost = float(shipment.get('packagingCost', 0))
-            
-            # حساب السعر الأساسي بناءً على الوزن، مع فرض 10 كغ كحد أدنى
-            calculated_weight = max(weight, 10)
-            base_price = calculated_weight * unit_price
-
-            row_data = [
-                str(shipment.get('shipmentNumber', '')),
-                str(shipment.get('trackingCode', '')),
-                str(shipment.get('sender', {}).get('name', '')),
-                str(shipment.get('sender', {}).get('phone', '')),
-                str(shipment.get('sender', {}).get('country', '')),
-                str(shipment.get('sender', {}).get('city', '')),
-                str(shipment.get('receiver', {}).get('name', '')),
-                str(shipment.get('receiver', {}).get('phone', '')),
-                str(shipment.get('receiver', {}).get('country', '')),
-                str(shipment.get('receiver', {}).get('city', '')),
-                str(shipment.get('quantity', '')),
-                str(shipment.get('weight', '')),
-                str(shipment.get('itemType', '')),
-                str(shipment.get('contents', '')),
-                f"{base_price:.2f}",
-                f"{insurance_cost:.2f}",
-                f"{packaging_cost:.2f}",
-                str(shipment.get('finalPrice', '')),
-                str(shipment.get('currency', '')),
-                str("دفع مقدم" if shipment.get('paymentMethod') == 'prepaid' else "دفع عكسي"),
-                str(shipment.get('status', ''))
-            ]
+        if ids:
+            if not isinstance(ids, list) or not all(isinstance(shipment_id, int) for shipment_id in ids):
+                raise ValueError('ids must be a list of shipment ids')
+            conditions.append('s.id IN (SELECT value FROM json_each(?))')
+            params.append(json.dumps(ids))
+        if filters:
+            filter_conditions, filter_params = build_shipment_filters(filters)
+            conditions += filter_conditions
+            params += filter_params
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    # مرشح كل قيمه فارغة لا يحدد أي شحنة، ولا يُصدَّر الجدول كاملًا بدلًا منه
+    if not conditions:
+        return jsonify({"error": "No shipments provided to export"}), 400
+
+    c = get_db_connection().cursor()
+    c.execute(build_shipment_select(EXPORT_FIELDS) + 'WHERE ' + ' AND '.join(conditions) + ' ORDER BY s.id DESC', params)
+
+    if export_format == 'csv':
+        def generate_csv():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # علامة BOM ليتعرف Excel على الترميز العربي
+            buffer.write('\ufeff')
+            writer.writerow(EXPORT_HEADERS)
+            for row_data in export_rows(c):
+                writer.writerow(row_data)
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode('utf-8')
+
+        return Response(stream_with_context(generate_csv()), mimetype='text/csv', headers={
+            'Content-Disposition': 'attachment; filename=shipment_report.csv'
+        })
+
+    try:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Shipments Report")
+        ws.append(EXPORT_HEADERS)
+        for row_data in export_rows(c):
             ws.append(row_data)
 
-        output = io.BytesIO()
+        output = tempfile.TemporaryFile()
         wb.save(output)
         output.seek(0)
-
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        response.headers['Content-Disposition'] = 'attachment; filename=shipment_report.xlsx'
-        
-        return response
-    except Exception as e:
-        print(f"Error generating Excel file: {e}")
+    except Exception:
+        app.logger.exception('Error generating Excel file')
         return jsonify({"error": "Failed to generate Excel file"}), 500
-        
-@app.route('/api/shipments/generate_a4_print_html', methods=['POST'])
-@admin_required
-def generate_a4_print_html():
-    """يولد صفحة HTML مع فواتير مصممة لصفحات A4 نصفية."""
-    data = request.json
-    shipments_to_print = data.get('shipments', [])
 
-    if not shipments_to_print:
-        return jsonify({"error": "No shipments provided to print"}), 400
-
-    A4_HALF_PRINT_TEMPLATE = """
+    response = Response(_stream_file(output), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response.headers['Content-Disposition'] = 'attachment; filename=shipment_report.xlsx'
+    return response
+        
+# قالب فواتير A4 النصفية؛ يُترجم مرة واحدة عند تحميل التطبيق بدل كل طلب
+A4_HALF_PRINT_TEMPLATE = """
     <!DOCTYPE html>
     <html lang="ar" dir="rtl">
     <head>
@@ -555,129 +2931,67 @@ def generate_a4_print_html():
         </div>
     </body>
     </html>
-    """
-    
-    # حساب الأسعار لكل شحنة
-    for shipment in shipments_to_print:
-        try:
-            weight = float(shipment.get('weight', 0))
-            unit_price = float(shipment.get('unitPrice', 0))
-            insurance_cost = float(shipment.get('insuranceCost', 0))
-            packaging_cost = float(shipment.get('packagingCost', 0))
-            
-            # حساب السعر الأساسي بناءً على الوزن، مع فرض 10 كغ كحد أدنى
-            calculated_weight = max(weight, 10)
-            base_price = calculated_weight * unit_price
-
-            shipment['basePrice'] = "{:.2f}".format(base_price)
-            shipment['insuranceCost'] = "{:.2f}".format(insurance_cost)
-            shipment['packagingCost'] = "{:.2f}".format(packaging_cost)
-        except (ValueError, TypeError):
-            shipment['basePrice'] = "0.00"
-            shipment['insuranceCost'] = "0.00"
-            shipment['packagingCost'] = "0.00"
-            
-    html = render_template_string(A4_HALF_PRINT_TEMPLATE, shipments=shipments_to_print)
-    response = make_response(html)
-    response.headers['Content-Type'] = 'text/html'
-    return response
-
-# قالب HTML مع CSS و JavaScript مدمجة
-HTML_CONTENT = """
-<!DOCTYPE html>
-<html lang="ar" dir="rtl">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>BRAKO - شركة الشحن الدولي</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <script>
-        tailwind.config = {
-            theme: {
-                extend: {
-                    colors: {
-                        'brako-blue': '#1e40af',
-                        'brako-yellow': '#fbbf24',
-                        'brako-teal': '#14b8a6',
-                        'brako-dark': '#0f172a'
-                    },
-                    fontFamily: {
-                        sans: ['Cairo', 'sans-serif'],
-                    },
-                },
-            },
-        };
-    </script>
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Cairo:wght@300;400;600;700&display=swap');
-        body { font-family: 'Cairo', sans-serif; }
-        .gradient-bg { background: linear-gradient(135deg, #1e40af 0%, #14b8a6 50%, #fbbf24 100%); }
-        .tab-active { background-color: #1e40af; color: white !important; }
-        .tab-inactive { color: #1e40af; background-color: white; }
-        .modal { transition: opacity 0.3s ease-in-out; }
-        .modal.hidden { opacity: 0; pointer-events: none; }
-        .modal-content { transform: scale(0.95); transition: transform 0.3s ease-in-out; }
-        .modal:not(.hidden) .modal-content { transform: scale(1); }
-        
-        .loading-spinner {
-            border: 4px solid rgba(255, 255, 255, 0.3);
-            border-top: 4px solid #fff;
-            border-radius: 50%;
-            width: 24px;
-            height: 24px;
-            animation: spin 1s linear infinite;
-        }
-
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-
-        @media print {
-            body { font-size: 10px; margin: 0; padding: 0; }
-            .no-print { display: none !important; }
-            
-            @page {
-                size: A4 portrait;
-                margin: 0;
-            }
-            
-            .print-page {
-                display: flex;
-                flex-direction: column;
-                justify-content: space-between;
-                height: 297mm; /* A4 height */
-                width: 210mm; /* A4 width */
-                margin: auto;
-                padding: 10mm;
-                box-sizing: border-box;
-                page-break-inside: avoid;
-            }
-            
-            .print-invoice {
-                width: 100%;
-                height: 148.5mm; /* Half of A4 */
-                border: 1px dashed #999;
-                padding: 10px;
-                box-sizing: border-box;
-                page-break-inside: avoid;
-                margin-bottom: 5mm;
-            }
+"""
+A4_HALF_PRINT = app.jinja_env.from_string(A4_HALF_PRINT_TEMPLATE)
+
+# الحد الأقصى لعدد النسخ المطبوعة من كل فاتورة
+MAX_PRINT_COPIES = 100
+
+def format_invoice_prices(shipments):
+    """ينسق أسعار الشحنات المحفوظة بالوحدات الصغرى قبل عرض القالب؛ الشحنات المرسلة دون أسعار محفوظة تُسعَّر أولاً."""
+    for shipment in shipments:
+        if 'finalPriceMinor' not in shipment:
+            shipment.update(price_shipment(shipment))
+        shipment['basePrice'] = format_minor_units(shipment['basePriceMinor'])
+        shipment['insuranceCost'] = format_minor_units(shipment['insuranceCostMinor'])
+        shipment['packagingCost'] = format_minor_units(shipment['packagingCostMinor'])
+        shipment['priceAdjustment'] = format_minor_units(shipment.get('priceAdjustmentMinor'))
+        shipment['finalPrice'] = format_minor_units(shipment['finalPriceMinor'])
 
-            .print-header { text-align: center; margin-bottom: 5px; padding-bottom: 5px; border-bottom: 1px solid #000; }
-            .company-name { font-size: 16px; font-weight: bold; color: #1e40af; }
-            .invoice-title { font-size: 12px; color: #14b8a6; }
-            .tracking-code { background: #fbbf24; color: #1e40af; padding: 3px; border-radius: 3px; font-weight: bold; text-align: center; margin-top: 5px; font-size: 10px; }
-            .section-title { font-size: 12px; font-weight: bold; color: #1e40af; margin-bottom: 5px; border-bottom: 1px solid #1e40af; padding-bottom: 3px; }
-            .info-row { font-size: 10px; margin-bottom: 2px; }
-            .label { font-weight: bold; color: #374151; }
-            .value { color: #1f2937; }
-            .grid-print { display: grid; grid-template-columns: 1fr 1fr; gap: 5px; }
-            .total-section { background: linear-gradient(135deg, #1e40af, #14b8a6); color: white; padding: 5px; border-radius: 3px; text-align: center; margin-top: 10px; }
-            .total-price { font-size: 14px; font-weight: bold; }
-            .footer { text-align: center; margin-top: 10px; font-size: 8px; color: #6b7280; }
+@app.route('/api/shipments/generate_a4_print_html', methods=['POST'])
+@admin_required
+def generate_a4_print_html():
+    """
+    يولد صفحة HTML مع فواتير مصممة لصفحات A4 نصفية، للشحنات المحددة بالمعرّفات (ids) بقراءتها
+    من قاعدة البيانات، أو لكائنات الشحنات المرسلة (shipments).
+    """
+    data = request.json
+    ids = data.get('ids')
+    shipments_to_print = data.get('shipments', [])
+    copies = data.get('copies', 1)
+
+    if ids:
+        if not isinstance(ids, list) or not all(isinstance(shipment_id, int) for shipment_id in ids):
+            return jsonify({"error": "ids must be a list of shipment ids"}), 400
+        c = get_db_connection().cursor()
+        shipments_by_id = {
+            s['id']: s for s in query_shipments(c, 'WHERE s.id IN (SELECT value FROM json_each(?))', (json.dumps(ids),))
         }
-    </style>
+        shipments_to_print = [shipments_by_id[shipment_id] for shipment_id in ids if shipment_id in shipments_by_id]
+
+    if not shipments_to_print:
+        return jsonify({"error": "No shipments provided to print"}), 400
+    if not isinstance(copies, int) or not 1 <= copies <= MAX_PRINT_COPIES:
+        return jsonify({"error": "Invalid number of copies"}), 400
+
+    # تُنسق الأسعار مرة لكل شحنة، وتتكرر النسخ كمراجع للكائن نفسه
+    format_invoice_prices(shipments_to_print)
+    html = A4_HALF_PRINT.render(shipments=[shipment for shipment in shipments_to_print for _ in range(copies)])
+    response = make_response(html)
+    response.headers['Content-Type'] = 'text/html'
+    return response
+
+# قالب الصفحة الرئيسية؛ ملفات CSS و JavaScript في مجلد static وتُربط بروابط ذات بصمة
+HTML_CONTENT = """
+<!DOCTYPE html>
+<html lang="ar" dir="rtl">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>BRAKO - شركة الشحن الدولي</title>
+    <script src="https://cdn.tailwindcss.com"></script>
+    <script src="{{ asset_url('js/tailwind-config.js') }}"></script>
+    <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
 </head>
 <body class="bg-gray-100 font-sans text-brako-dark">
     <div id="modalContainer" class="fixed inset-0 bg-gray-900 bg-opacity-50 flex items-center justify-center p-4 z-50 modal hidden">
@@ -1142,7 +3456,7 @@ HTML_CONTENT = """
                             <h3 class="text-xl font-bold text-brako-teal mb-6">جميع الشحنات</h3>
                             
                             <div class="mb-6 flex flex-wrap gap-4">
-                                <input type="text" id="searchInput" class="flex-1 p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-brako-blue" placeholder="البحث برقم الشحنة، رقم الفاتورة، أو كود التتبع">
+                                <input type="text" id="searchInput" class="flex-1 p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-brako-blue" placeholder="البحث برقم الشحنة، رقم الفاتورة، كود التتبع، الاسم أو الهاتف">
                                 <button onclick="searchAndFilter()" class="bg-brako-blue text-white px-6 py-3 rounded-lg font-semibold hover:bg-blue-700 transition-colors">
                                     بحث
                                 </button>
@@ -1153,6 +3467,30 @@ HTML_CONTENT = """
                                     تصدير الفواتير (Excel)
                                 </button>
                             </div>
+
+                            <div class="mb-6 flex flex-wrap gap-4 items-center">
+                                <select id="filterStatus" onchange="applyShipmentFilters()" class="p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-brako-blue">
+                                    <option value="">كل الحالات</option>
+                                </select>
+                                <select id="filterBranch" onchange="applyShipmentFilters()" class="p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-brako-blue">
+                                    <option value="">كل الفروع</option>
+                                </select>
+                                <label class="flex items-center gap-2 text-gray-600">من
+                                    <input type="date" id="filterDateFrom" onchange="applyShipmentFilters()" class="p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-brako-blue">
+                                </label>
+                                <label class="flex items-center gap-2 text-gray-600">إلى
+                                    <input type="date" id="filterDateTo" onchange="applyShipmentFilters()" class="p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-brako-blue">
+                                </label>
+                                <select id="shipmentsSort" onchange="applyShipmentFilters()" class="p-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-brako-blue">
+                                    <option value="-id">الأحدث إضافة</option>
+                                    <option value="id">الأقدم إضافة</option>
+                                    <option value="-date">تاريخ الشحنة (الأحدث)</option>
+                                    <option value="date">تاريخ الشحنة (الأقدم)</option>
+                                    <option value="-finalPrice">السعر (الأعلى)</option>
+                                    <option value="finalPrice">السعر (الأدنى)</option>
+                                </select>
+                                <span id="shipmentsTotal" class="text-gray-600"></span>
+                            </div>
                             
                             <div id="shipmentsTable" class="overflow-x-auto rounded-lg shadow-inner">
                                 <table class="w-full border-collapse">
@@ -1178,6 +3516,7 @@ HTML_CONTENT = """
                                     </tbody>
                                 </table>
                             </div>
+                            <div id="shipmentsListSentinel" class="text-center p-4 text-gray-500 hidden">جارٍ تحميل المزيد...</div>
                         </div>
                     </div>
 
@@ -1315,1128 +3654,31 @@ HTML_CONTENT = """
         </section>
     </main>
 
-    <script>
-        const API_BASE_URL = '/api/shipments';
-        const sectionIds = ['home', 'services', 'about', 'contact', 'customerTracking', 'admin'];
-        let allShipments = [];
-        let lastSavedShipment = null;
-        let isAuthenticated = false;
-
-        const citiesData = {
-            syria: ['دمشق', 'حمص', 'القامشلي', 'حلب', 'الرقة', 'دير الزور', 'المالكية', 'معبدة', 'الجوادية', 'القحطانية', 'عامودا', 'الدرباسية', 'الحسكة', 'كوباني'],
-            iraq: ['أربيل', 'دهوك', 'دوميز', 'السليمانية', 'زاخو', 'فايدة', 'كركوك', 'كويلان', 'دار شكران', 'قوشتبه']
-        };
-
-        const statusTexts = {
-            'received': 'استلام في المركز',
-            'in_sorting': 'قيد الفرز',
-            'local_shipping': 'شحن داخلي',
-            'departed': 'انطلاق الشحنة',
-            'at_border': 'في المعبر',
-            'in_transit': 'في الطريق',
-            'arrived_city': 'وصول إلى المدينة',
-            'delayed': 'مؤجل',
-            'ready_pickup': 'جاهزة للاستلام',
-            'returned': 'مرتجع'
-        };
-        
-        function showLoading() { document.getElementById('loadingOverlay').classList.remove('hidden'); }
-        function hideLoading() { document.getElementById('loadingOverlay').classList.add('hidden'); }
-
-        function showModal(title, message, isConfirm = false, onConfirm = null) {
-            const modal = document.getElementById('modalContainer');
-            document.getElementById('modalTitle').textContent = title;
-            document.getElementById('modalMessage').textContent = message;
-            
-            const confirmBtn = document.getElementById('modalConfirmBtn');
-            const cancelBtn = document.getElementById('modalCancelBtn');
-
-            if (isConfirm) {
-                confirmBtn.classList.remove('hidden');
-                confirmBtn.onclick = () => {
-                    if (onConfirm) onConfirm();
-                    hideModal();
-                };
-                cancelBtn.onclick = hideModal;
-            } else {
-                confirmBtn.classList.add('hidden');
-                cancelBtn.onclick = hideModal;
-            }
-            
-            modal.classList.remove('hidden');
-        }
-
-        function hideModal() {
-            const modal = document.getElementById('modalContainer');
-            modal.classList.add('hidden');
-        }
-        
-        function showPostSaveModal(shipmentData) {
-            lastSavedShipment = shipmentData;
-            document.getElementById('savedTrackingCode').textContent = shipmentData.trackingCode;
-            document.getElementById('postSaveModal').classList.remove('hidden');
-        }
-
-        function hidePostSaveModal() {
-            document.getElementById('postSaveModal').classList.add('hidden');
-        }
-
-        function hidePostSaveModalAndReset() {
-            hidePostSaveModal();
-            resetForm();
-            loadAllShipments();
-        }
-        
-        function showPrintCopiesModal(shipments) {
-            const modal = document.getElementById('printCopiesModal');
-            document.getElementById('copiesCount').value = 1;
-            modal.classList.remove('hidden');
-
-            const printBtn = document.getElementById('printCopiesBtn');
-            printBtn.onclick = () => {
-                const count = parseInt(document.getElementById('copiesCount').value);
-                if (count > 0) {
-                    const shipmentsToPrint = Array(count).fill(shipments[0]);
-                    printToNewWindow(shipmentsToPrint);
-                }
-                hidePrintCopiesModal();
-            };
-        }
-
-        function hidePrintCopiesModal() {
-            const modal = document.getElementById('printCopiesModal');
-            modal.classList.add('hidden');
-        }
-
-        function sendWhatsAppFromModal() {
-            if (lastSavedShipment) {
-                sendWhatsApp(lastSavedShipment);
-                hidePostSaveModal();
-            }
-        }
-
-        function sendWhatsApp(shipmentData) {
-            const phoneForLink = shipmentData.sender.phone.replace('+', '').replace(/\s/g, '');
-            const trackingLink = `${window.location.origin}/#tracking/${shipmentData.trackingCode}`;
-
-            const senderInfo = `${shipmentData.sender.name}
-*الوجهة:* ${shipmentData.sender.city || 'غير محدد'}, ${shipmentData.sender.country}
-*العنوان:* ${shipmentData.sender.address || 'غير محدد'}`;
-
-            const message = `🚚 *شركة BRAKO للشحن الدولي* 🚚
-
-✅ *تم إنشاء شحنتكم بنجاح!*
-
-📋 *تفاصيل الشحنة:*
-• رقم الشحنة: *${shipmentData.shipmentNumber}*
-• كود التتبع: *${shipmentData.trackingCode}*
-• المرسل: ${senderInfo}
-• المستلم: ${shipmentData.receiver.name}
-
-🔍 *لتتبع شحنتكم عبر الرابط التالي:*
-${trackingLink}
-
-📞 *للاستفسار:*
-+963943396345
-+963984487359
-
-🙏 *شكراً لثقتكم بنا*
-نحن نعمل على توصيل شحناتكم بأمان وسرعة`;
-            
-            const whatsappUrl = `https://wa.me/${phoneForLink}?text=${encodeURIComponent(message)}`;
-            window.open(whatsappUrl, '_blank');
-        }
-
-        function updateCountryCode(type) {
-            const countrySelect = document.getElementById(type + 'Country');
-            const countryCodeInput = document.getElementById(type + 'CountryCode');
-            const citySelect = document.getElementById(type + 'City');
-            
-            const selectedOption = countrySelect.options[countrySelect.selectedIndex];
-            const countryCode = selectedOption.getAttribute('data-code') || '+00';
-            const countryValue = selectedOption.value;
-            
-            countryCodeInput.value = countryCode;
-            
-            if (citiesData[countryValue]) {
-                citySelect.classList.remove('hidden');
-                citySelect.innerHTML = '<option value="">اختر المدينة</option>';
-                citiesData[countryValue].forEach(city => {
-                    const option = document.createElement('option');
-                    option.value = city;
-                    option.textContent = city;
-                    citySelect.appendChild(option);
-                });
-            } else {
-                citySelect.classList.add('hidden');
-                citySelect.innerHTML = '<option value="">اختر المدينة</option>';
-            }
-        }
-
-        async function showSection(sectionId) {
-            const sections = document.querySelectorAll('.section-content');
-            sections.forEach(section => section.classList.add('hidden'));
-
-            if (sectionId === 'admin') {
-                showLoading();
-                const response = await fetch('/api/auth_status');
-                hideLoading();
-                const data = await response.json();
-                isAuthenticated = data.isAuthenticated;
-
-                if (isAuthenticated) {
-                    document.getElementById('adminPanelContent').classList.remove('hidden');
-                    document.getElementById('adminLoginSection').classList.add('hidden');
-                    document.getElementById('logoutButton').classList.remove('hidden');
-                    document.getElementById(sectionId).classList.remove('hidden');
-                    showAdminTab('addShipment');
-                } else {
-                    document.getElementById('adminLoginSection').classList.remove('hidden');
-                    document.getElementById('adminPanelContent').classList.add('hidden');
-                    document.getElementById('logoutButton').classList.add('hidden');
-                    document.getElementById(sectionId).classList.remove('hidden');
-                }
-            } else {
-                document.getElementById('logoutButton').classList.add('hidden');
-                document.getElementById(sectionId).classList.remove('hidden');
-            }
-            window.location.hash = sectionId;
-        }
-        
-        async function handleLogout() {
-            showLoading();
-            const response = await fetch('/api/logout', { method: 'POST' });
-            hideLoading();
-            if (response.ok) {
-                isAuthenticated = false;
-                document.getElementById('adminPanelContent').classList.add('hidden');
-                document.getElementById('adminLoginSection').classList.add('hidden');
-                document.getElementById('logoutButton').classList.add('hidden');
-                showSection('home');
-            } else {
-                showModal('خطأ', 'فشل تسجيل الخروج.');
-            }
-        }
-
-        function toggleInsurance() {
-            const checkbox = document.getElementById('insurance');
-            const details = document.getElementById('insuranceDetails');
-            if (checkbox.checked) {
-                details.classList.remove('hidden');
-            } else {
-                details.classList.add('hidden');
-                document.getElementById('insuranceCost').value = '';
-            }
-            calculateTotal();
-        }
-
-        function togglePackaging() {
-            const checkbox = document.getElementById('packaging');
-            const details = document.getElementById('packagingDetails');
-            if (checkbox.checked) {
-                details.classList.remove('hidden');
-            } else {
-                details.classList.add('hidden');
-                document.getElementById('packagingCost').value = '';
-            }
-            calculateTotal();
-        }
-
-        function calculateTotal() {
-            const weight = parseFloat(document.getElementById('weight').value) || 0;
-            const unitPrice = parseFloat(document.getElementById('unitPrice').value) || 0;
-            const insuranceCost = parseFloat(document.getElementById('insuranceCost').value) || 0;
-            const packagingCost = parseFloat(document.getElementById('packagingCost').value) || 0;
-
-            // حساب السعر الأساسي بناءً على الوزن، مع فرض 10 كغ كحد أدنى
-            let basePrice = 0;
-            if (weight > 0) {
-                const calculatedWeight = (weight < 10) ? 10 : weight;
-                basePrice = calculatedWeight * unitPrice;
-            }
-
-            const finalPrice = basePrice + insuranceCost + packagingCost;
-
-            document.getElementById('basePrice').textContent = basePrice.toFixed(2);
-            document.getElementById('insuranceDisplay').textContent = insuranceCost.toFixed(2);
-            document.getElementById('packagingDisplay').textContent = packagingCost.toFixed(2);
-            document.getElementById('finalPrice').textContent = finalPrice.toFixed(2);
-        }
-
-        function updateCurrencyDisplay() {
-            const currency = document.getElementById('currency').value;
-            document.getElementById('currencySymbol').textContent = currency;
-            calculateTotal();
-        }
-        
-        function showAdminTab(tabName) {
-            const tabs = document.querySelectorAll('.admin-tab-content');
-            tabs.forEach(tab => tab.classList.add('hidden'));
-            
-            const tabButtons = document.querySelectorAll('.p-1 button');
-            tabButtons.forEach(btn => btn.classList.replace('tab-active', 'tab-inactive'));
-            
-            if (tabName === 'addShipment') {
-                document.getElementById('addShipmentSection').classList.remove('hidden');
-                document.getElementById('addShipmentTab').classList.replace('tab-inactive', 'tab-active');
-                resetForm();
-            } else if (tabName === 'shipmentsList') {
-                document.getElementById('shipmentsListSection').classList.remove('hidden');
-                document.getElementById('shipmentsListTab').classList.replace('tab-inactive', 'tab-active');
-                loadAllShipments();
-            } else if (tabName === 'trackingUpdate') {
-                document.getElementById('trackingUpdateSection').classList.remove('hidden');
-                document.getElementById('trackingUpdateTab').classList.replace('tab-inactive', 'tab-active');
-            }
-        }
-        
-        async function startEditShipment(id) {
-            if (!isAuthenticated) {
-                showModal('لا يوجد تصريح', 'يجب تسجيل الدخول كمسؤول للوصول إلى هذه الميزة.');
-                return;
-            }
-
-            showLoading();
-            try {
-                const response = await fetch(`${API_BASE_URL}/${id}`);
-                if (!response.ok) {
-                    hideLoading();
-                    showModal('خطأ', 'لم يتم العثور على الشحنة.');
-                    return;
-                }
-                const shipment = await response.json();
-                
-                // الانتقال إلى واجهة إضافة/تعديل الشحنة
-                showAdminTab('addShipment');
-
-                // ملء حقول النموذج ببيانات الشحنة
-                document.getElementById('shipmentId').value = shipment.id;
-                document.getElementById('formTitle').textContent = 'تعديل الشحنة';
-                document.getElementById('saveButton').textContent = 'حفظ التعديلات';
-                
-                // ملء بيانات الشحنة الرئيسية
-                document.getElementById('shipmentNumber').value = shipment.shipmentNumber;
-                document.getElementById('invoiceNumber').value = shipment.invoiceNumber;
-                document.getElementById('shipmentDate').value = shipment.date;
-                document.getElementById('shipmentTime').value = shipment.time;
-                document.getElementById('branch').value = shipment.branch;
-                document.getElementById('shippingType').value = shipment.shippingType;
-                
-                // ملء معلومات المرسل
-                document.getElementById('senderName').value = shipment.sender.name;
-                const senderCountryOption = Array.from(document.getElementById('senderCountry').options).find(option => option.textContent === shipment.sender.country);
-                if (senderCountryOption) {
-                    document.getElementById('senderCountry').value = senderCountryOption.value;
-                }
-                updateCountryCode('sender'); 
-                
-                const senderPhoneParts = (shipment.sender.phone || '').split(' ');
-                document.getElementById('senderCountryCode').value = senderPhoneParts[0] || '';
-                document.getElementById('senderPhone').value = senderPhoneParts.slice(1).join('') || '';
-                
-                if (shipment.sender.city && document.getElementById('senderCity').options.length > 1) {
-                    document.getElementById('senderCity').value = shipment.sender.city;
-                }
-                document.getElementById('senderAddress').value = shipment.sender.address;
-                
-                // ملء معلومات المستلم
-                document.getElementById('receiverName').value = shipment.receiver.name;
-                const receiverCountryOption = Array.from(document.getElementById('receiverCountry').options).find(option => option.textContent === shipment.receiver.country);
-                if (receiverCountryOption) {
-                    document.getElementById('receiverCountry').value = receiverCountryOption.value;
-                }
-                updateCountryCode('receiver');
-                
-                const receiverPhoneParts = (shipment.receiver.phone || '').split(' ');
-                document.getElementById('receiverCountryCode').value = receiverPhoneParts[0] || '';
-                document.getElementById('receiverPhone').value = receiverPhoneParts.slice(1).join('') || '';
-
-                if (shipment.receiver.city && document.getElementById('receiverCity').options.length > 1) {
-                    document.getElementById('receiverCity').value = shipment.receiver.city;
-                }
-                document.getElementById('receiverAddress').value = shipment.receiver.address;
-                
-                // ملء تفاصيل الدفع والخدمات الإضافية
-                document.getElementById('paymentMethod').value = shipment.paymentMethod;
-                document.getElementById('insurance').checked = shipment.insurance == 1;
-                toggleInsurance();
-                if (document.getElementById('insurance').checked) {
-                    document.getElementById('insuranceCost').value = shipment.insuranceCost;
-                }
-                
-                document.getElementById('packaging').checked = shipment.packaging == 1;
-                togglePackaging();
-                if (document.getElementById('packaging').checked) {
-                    document.getElementById('packagingCost').value = shipment.packagingCost;
-                }
-                
-                // ملء تفاصيل الطرد
-                document.getElementById('quantity').value = shipment.quantity;
-                document.getElementById('unitPrice').value = shipment.unitPrice;
-                document.getElementById('weight').value = shipment.weight;
-                document.getElementById('itemType').value = shipment.itemType;
-                document.getElementById('contents').value = shipment.contents;
-                document.getElementById('currency').value = shipment.currency;
-                
-                calculateTotal();
-            } catch (error) {
-                console.error("Error fetching shipment details:", error);
-                showModal('خطأ', 'حدث خطأ أثناء جلب بيانات الشحنة.');
-            } finally {
-                hideLoading();
-            }
-        }
-        
-        async function searchAndFilter() {
-            showLoading();
-            const searchTerm = document.getElementById('searchInput').value;
-            try {
-                const response = await fetch(`${API_BASE_URL}/search`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ query: searchTerm })
-                });
-                const shipments = await response.json();
-                displayShipments(shipments);
-            } catch (error) {
-                console.error("Error searching shipments:", error);
-                showModal('خطأ', 'حدث خطأ أثناء البحث عن الشحنات.');
-            } finally {
-                hideLoading();
-            }
-        }
-
-        function clearSearchAndLoad() {
-            document.getElementById('searchInput').value = '';
-            loadAllShipments();
-        }
-        
-        async function sendWhatsAppForShipment(shipmentId) {
-            const shipment = allShipments.find(s => s.id === shipmentId);
-            if (shipment) {
-                sendWhatsApp(shipment);
-            }
-        }
-
-        async function searchForTracking() {
-            showLoading();
-            const searchTerm = document.getElementById('trackingSearchInput').value;
-            if (!searchTerm) {
-                showModal('بيانات ناقصة', 'يرجى إدخال رقم الشحنة أو رقم الفاتورة');
-                hideLoading();
-                return;
-            }
-            
-            try {
-                const response = await fetch(`${API_BASE_URL}/search`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ query: searchTerm })
-                });
-                const shipments = await response.json();
-                
-                if (shipments.length === 0) {
-                    showModal('لا توجد نتائج', 'لم يتم العثور على شحنات.');
-                    return;
-                }
-                
-                displayTrackingResults(shipments);
-            } catch (error) {
-                console.error("Error searching for tracking:", error);
-                showModal('خطأ', 'حدث خطأ أثناء البحث.');
-            } finally {
-                hideLoading();
-            }
-        }
-
-        function displayTrackingResults(shipments) {
-            const resultsDiv = document.getElementById('trackingResults');
-            const listDiv = document.getElementById('trackingShipmentsList');
-            
-            listDiv.innerHTML = '';
-            
-            shipments.forEach(shipment => {
-                const div = document.createElement('div');
-                div.className = 'bg-gray-50 p-4 rounded-lg mb-3 shadow-sm';
-                div.innerHTML = `
-                    <label class="flex items-center space-x-3 space-x-reverse">
-                        <input type="checkbox" class="tracking-checkbox w-5 h-5 text-brako-blue rounded-md" data-id="${shipment.id}">
-                        <div class="flex-1">
-                            <div class="font-semibold">رقم الشحنة: ${shipment.shipmentNumber}</div>
-                            <div class="text-sm text-gray-600">المرسل: ${shipment.sender.name} - المستلم: ${shipment.receiver.name}</div>
-                            <div class="text-sm text-gray-600">الحالة الحالية: <span class="${getStatusColor(shipment.status)} px-2 py-0.5 rounded-full text-xs">${getStatusText(shipment.status || 'received')}</span></div>
-                        </div>
-                    </label>
-                `;
-                listDiv.appendChild(div);
-            });
-            
-            resultsDiv.classList.remove('hidden');
-        }
-        
-        function toggleAllCheckboxes() {
-            const isChecked = document.getElementById('selectAllCheckboxes').checked;
-            document.querySelectorAll('.export-checkbox').forEach(checkbox => {
-                checkbox.checked = isChecked;
-            });
-        }
-
-        function toggleSelectAllTracking() {
-            const selectAll = document.getElementById('selectAllTracking');
-            const checkboxes = document.querySelectorAll('.tracking-checkbox');
-            
-            checkboxes.forEach(checkbox => {
-                checkbox.checked = selectAll.checked;
-            });
-        }
-
-        async function updateSelectedStatuses() {
-            const checkboxes = document.querySelectorAll('.tracking-checkbox:checked');
-            if (checkboxes.length === 0) {
-                showModal('تحديد شحنات', 'يرجى تحديد شحنة واحدة على الأقل.');
-                return;
-            }
-            if (!isAuthenticated) {
-                showModal('خطأ', 'يجب أن تكون مسؤولًا لتحديث الحالة.');
-                return;
-            }
-            showLoading();
-            const selectedIds = Array.from(checkboxes).map(cb => parseInt(cb.getAttribute('data-id')));
-            const newStatus = document.getElementById('newStatus').value;
-            const currentCity = document.getElementById('currentCity').value;
-            const statusNotes = document.getElementById('statusNotes').value;
-            
-            const now = new Date();
-            const payload = {
-                selectedIds: selectedIds,
-                newStatus: newStatus,
-                currentCity: currentCity,
-                statusNotes: statusNotes,
-                date: now.toISOString().split('T')[0],
-                time: now.toTimeString().split(' ')[0].substring(0, 5)
-            };
-
-            try {
-                const response = await fetch(`${API_BASE_URL}/update_status`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(payload)
-                });
-                
-                if (response.ok) {
-                    showModal('نجاح', 'تم تحديث الحالات بنجاح.');
-                    document.getElementById('trackingResults').classList.add('hidden');
-                    document.getElementById('trackingSearchInput').value = '';
-                    loadAllShipments();
-                } else {
-                    const error = await response.json();
-                    showModal('خطأ', error.error || 'حدث خطأ أثناء التحديث.');
-                }
-            } catch (error) {
-                console.error("Error updating statuses:", error);
-                showModal('خطأ', 'حدث خطأ أثناء التحديث.');
-            } finally {
-                hideLoading();
-            }
-        }
-
-        function getStatusText(status) {
-            return statusTexts[status] || 'غير محدد';
-        }
-        
-        async function trackShipment(trackingCode) {
-            showLoading();
-            trackingCode = trackingCode || document.getElementById('trackingCodeInput').value;
-            if (!trackingCode) {
-                showModal('بيانات ناقصة', 'يرجى إدخال كود التتبع');
-                hideLoading();
-                return;
-            }
-            
-            try {
-                const response = await fetch(`${API_BASE_URL}/search`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ query: trackingCode })
-                });
-                const shipments = await response.json();
-                
-                const shipment = shipments.find(s => s.trackingCode === trackingCode);
-                
-                if (!shipment) {
-                    showModal('خطأ', 'كود التتبع غير صحيح.');
-                    return;
-                }
-                
-                displayTrackingInfo(shipment);
-            } catch (error) {
-                console.error("Error tracking shipment:", error);
-                showModal('خطأ', 'حدث خطأ أثناء تتبع الشحنة.');
-            } finally {
-                hideLoading();
-            }
-        }
-
-        function displayTrackingInfo(shipment) {
-            const resultDiv = document.getElementById('trackingResult');
-            
-            const statusHistoryHTML = shipment.statusHistory.length > 0 ? shipment.statusHistory.map(status => `
-                <div class="flex items-start mb-4 relative pr-8">
-                    <div class="absolute right-0 w-8 h-8 flex items-center justify-center rounded-full bg-brako-blue text-white z-10">
-                        <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
-                            <path fill-rule="evenodd" d="M10 18a8 8 0 100-16 8 8 0 000 16zm1-11a1 1 0 10-2 0v4a1 1 0 00.293.707l2.828 2.829a1 1 0 101.415-1.415L11 10.586V7z" clip-rule="evenodd" />
-                        </svg>
-                    </div>
-                    <div class="flex-1 bg-gray-50 p-4 rounded-lg shadow-sm">
-                        <div class="font-bold text-lg text-brako-blue">${getStatusText(status.status)}</div>
-                        <div class="text-sm text-gray-600">${status.date} - ${status.time}</div>
-                        ${status.city ? `<div class="text-sm text-gray-600">المدينة: ${status.city}</div>` : ''}
-                        ${status.notes ? `<div class="text-sm text-gray-600">ملاحظات: ${status.notes}</div>` : ''}
-                    </div>
-                </div>
-            `).join('') : '<div class="text-center text-gray-500 p-4">لا توجد تحديثات للحالة</div>';
-            
-            resultDiv.innerHTML = `
-                <div class="border-t pt-6">
-                    <div class="bg-brako-blue text-white p-4 rounded-lg mb-6 shadow-md text-center">
-                        <h4 class="text-xl font-semibold mb-2">معلومات الشحنة</h4>
-                        <p class="text-2xl font-bold">كود التتبع: ${shipment.trackingCode}</p>
-                    </div>
-                    
-                    <div class="grid md:grid-cols-2 gap-4 mb-6 text-gray-700">
-                        <div class="bg-gray-100 p-4 rounded-lg">
-                            <strong>المرسل:</strong> ${shipment.sender.name}
-                        </div>
-                        <div class="bg-gray-100 p-4 rounded-lg">
-                            <strong>المستلم:</strong> ${shipment.receiver.name}
-                        </div>
-                        <div class="bg-gray-100 p-4 rounded-lg">
-                            <strong>الوزن:</strong> ${shipment.weight} كغ
-                        </div>
-                        <div class="bg-gray-100 p-4 rounded-lg">
-                            <strong>المحتويات:</strong> ${shipment.contents}
-                        </div>
-                    </div>
-
-                    <h4 class="text-2xl font-bold text-brako-blue mb-4 text-center mt-8">حالة التتبع</h4>
-                    <div class="space-y-6">
-                        ${statusHistoryHTML}
-                    </div>
-                </div>
-                `;
-            
-            resultDiv.classList.remove('hidden');
-        }
-
-        async function saveShipment() {
-            if (!isAuthenticated) {
-                showModal('خطأ', 'يجب أن تكون مسؤولًا لحفظ شحنة.');
-                return;
-            }
-            showLoading();
-            const shipmentNumber = document.getElementById('shipmentNumber').value;
-            const senderName = document.getElementById('senderName').value;
-            const receiverName = document.getElementById('receiverName').value;
-            const branch = document.getElementById('branch').value;
-            const shipmentId = document.getElementById('shipmentId').value;
-            
-            if (!shipmentNumber || !senderName || !receiverName || !branch) {
-                showModal('بيانات ناقصة', 'يرجى ملء البيانات الأساسية (رقم الشحنة، اسم المرسل، اسم المستلم، والفرع)');
-                hideLoading();
-                return;
-            }
-            
-            const currency = document.getElementById('currency').value;
-            const now = new Date();
-            const payload = {
-                shipmentNumber: shipmentNumber,
-                invoiceNumber: document.getElementById('invoiceNumber').value,
-                date: document.getElementById('shipmentDate').value,
-                time: document.getElementById('shipmentTime').value,
-                branch: branch,
-                shippingType: document.getElementById('shippingType').value,
-                sender: {
-                    name: senderName,
-                    phone: document.getElementById('senderCountryCode').value + ' ' + document.getElementById('senderPhone').value,
-                    country: document.getElementById('senderCountry').options[document.getElementById('senderCountry').selectedIndex].text,
-                    city: document.getElementById('senderCity').value,
-                    address: document.getElementById('senderAddress').value
-                },
-                receiver: {
-                    name: receiverName,
-                    phone: document.getElementById('receiverCountryCode').value + ' ' + document.getElementById('receiverPhone').value,
-                    country: document.getElementById('receiverCountry').options[document.getElementById('receiverCountry').selectedIndex].text,
-                    city: document.getElementById('receiverCity').value,
-                    address: document.getElementById('receiverAddress').value
-                },
-                paymentMethod: document.getElementById('paymentMethod').value,
-                insurance: document.getElementById('insurance').checked,
-                insuranceCost: document.getElementById('insuranceCost').value || '0',
-                packaging: document.getElementById('packaging').checked,
-                packagingCost: document.getElementById('packagingCost').value || '0',
-                quantity: document.getElementById('quantity').value,
-                unitPrice: document.getElementById('unitPrice').value,
-                weight: document.getElementById('weight').value,
-                itemType: document.getElementById('itemType').value,
-                contents: document.getElementById('contents').value,
-                finalPrice: document.getElementById('finalPrice').textContent,
-                currency: currency,
-                status: 'received',
-                statusHistory: [{
-                    status: 'received',
-                    city: '',
-                    notes: 'تم استلام الشحنة في المركز',
-                    date: now.toISOString().split('T')[0],
-                    time: now.toTimeString().split(' ')[0].substring(0, 5)
-                }]
-            };
-
-            try {
-                let response;
-                if (shipmentId) {
-                    payload.id = parseInt(shipmentId);
-                    response = await fetch(`${API_BASE_URL}/${shipmentId}`, {
-                        method: 'PUT',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify(payload)
-                    });
-                } else {
-                    response = await fetch(API_BASE_URL, {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify(payload)
-                    });
-                }
-
-                if (response.ok) {
-                    const savedShipment = await response.json();
-                    showPostSaveModal(savedShipment);
-                    loadAllShipments();
-                } else {
-                    const error = await response.json();
-                    showModal('خطأ', error.error || 'حدث خطأ أثناء الحفظ.');
-                }
-            } catch (error) {
-                console.error("Error saving shipment:", error);
-                showModal('خطأ', 'حدث خطأ أثناء الاتصال بالخادم.');
-            } finally {
-                hideLoading();
-            }
-        }
-        
-        async function exportFilteredShipmentsToExcel() {
-            if (!isAuthenticated) {
-                showModal('خطأ', 'يجب أن تكون مسؤولًا لتصدير البيانات.');
-                return;
-            }
-            const checkboxes = document.querySelectorAll('.export-checkbox:checked');
-            const shipmentsToExport = [];
-            
-            if (checkboxes.length === 0) {
-                showModal('لا توجد شحنات', 'يرجى تحديد شحنة واحدة على الأقل لتصديرها.');
-                return;
-            }
-
-            checkboxes.forEach(checkbox => {
-                const shipmentId = checkbox.getAttribute('data-id');
-                const shipment = allShipments.find(s => s.id == shipmentId);
-                if (shipment) {
-                    shipmentsToExport.push(shipment);
-                }
-            });
-
-            if (shipmentsToExport.length === 0) {
-                showModal('لا توجد شحنات', 'لا توجد شحنات لتصديرها.');
-                return;
-            }
-
-            showModal('جارٍ التصدير', 'يتم الآن توليد ملف Excel. يرجى الانتظار...', false);
-            
-            const url = '/api/shipments/export_excel';
-            try {
-                const response = await fetch(url, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ shipments: shipmentsToExport })
-                });
-
-                if (response.ok) {
-                    const blob = await response.blob();
-                    const excelUrl = URL.createObjectURL(blob);
-                    
-                    const a = document.createElement('a');
-                    a.href = excelUrl;
-                    a.download = 'shipment_report.xlsx';
-                    document.body.appendChild(a);
-                    a.click();
-                    document.body.removeChild(a);
-                    URL.revokeObjectURL(excelUrl);
-                    hideModal();
-                } else {
-                    const error = await response.json();
-                    hideModal();
-                    showModal('خطأ', error.error || 'فشل في توليد ملف Excel. يرجى المحاولة مرة أخرى.');
-                }
-            } catch (error) {
-                console.error("Error generating Excel:", error);
-                hideModal();
-                showModal('خطأ', 'حدث خطأ غير متوقع أثناء توليد الملف.');
-            }
-        }
-        
-        async function printToNewWindow(shipmentsToPrint) {
-            if (!isAuthenticated) {
-                showModal('خطأ', 'يجب أن تكون مسؤولًا للطباعة.');
-                return;
-            }
-            const printWindow = window.open('', '_blank');
-            if (!printWindow) {
-                showModal('خطأ', 'تم حظر النوافذ المنبثقة. يرجى السماح بها لإجراء الطباعة.');
-                return;
-            }
-            
-            try {
-                const url = '/api/shipments/generate_a4_print_html';
-                const response = await fetch(url, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ shipments: shipmentsToPrint })
-                });
-                
-                if (response.ok) {
-                    const htmlContent = await response.text();
-                    printWindow.document.open();
-                    printWindow.document.write(htmlContent);
-                    printWindow.document.close();
-                    printWindow.onload = () => {
-                        printWindow.print();
-                    };
-                } else {
-                    const error = await response.json();
-                    showModal('خطأ', error.error || 'فشل في توليد صفحة الطباعة.');
-                    printWindow.close();
-                }
-            } catch (error) {
-                console.error("Error generating print HTML:", error);
-                showModal('خطأ', 'حدث خطأ غير متوقع أثناء الطباعة.');
-                printWindow.close();
-            }
-        }
-        
-        function printA4ForShipment(shipmentId) {
-             const shipment = allShipments.find(s => s.id === shipmentId);
-             if (shipment) {
-                 showPrintCopiesModal([shipment]);
-             } else {
-                 showModal('خطأ', 'لم يتم العثور على الشحنة.');
-             }
-        }
-        
-        async function handleAdminLogin() {
-            showLoading();
-            const username = document.getElementById('adminUsername').value;
-            const password = document.getElementById('adminPassword').value;
-            
-            try {
-                const response = await fetch('/api/login', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ username, password })
-                });
-                const data = await response.json();
-                
-                if (data.success) {
-                    isAuthenticated = true;
-                    document.getElementById('adminLoginSection').classList.add('hidden');
-                    document.getElementById('adminPanelContent').classList.remove('hidden');
-                    document.getElementById('logoutButton').classList.remove('hidden');
-                    document.getElementById('adminButton').classList.add('hidden');
-                    showAdminTab('addShipment');
-                } else {
-                    showModal('فشل', 'اسم المستخدم أو كلمة المرور غير صحيح.');
-                }
-            } catch (error) {
-                console.error('Error during login:', error);
-                showModal('خطأ', 'حدث خطأ أثناء الاتصال بالخادم.');
-            } finally {
-                hideLoading();
-            }
-        }
-        
-        async function viewShipmentDetails(id) {
-            if (!isAuthenticated) {
-                showModal('خطأ', 'يجب أن تكون مسؤولًا لعرض التفاصيل.');
-                return;
-            }
-            showLoading();
-            try {
-                const response = await fetch(`${API_BASE_URL}/${id}`);
-                if (!response.ok) {
-                    showModal('خطأ', 'لم يتم العثور على الشحنة');
-                    return;
-                }
-                const shipment = await response.json();
-                
-                window.currentShipmentId = id;
-                
-                const content = document.getElementById('shipmentDetailsContent');
-                const statusHistoryHTML = shipment.statusHistory.length > 0 ? shipment.statusHistory.map(status => `
-                    <div class="flex justify-between items-center p-3 bg-gray-50 rounded-lg shadow-sm">
-                        <div>
-                            <div class="font-semibold">${getStatusText(status.status)}</div>
-                            ${status.city ? `<div class="text-sm text-gray-600">المدينة: ${status.city}</div>` : ''}
-                            ${status.notes ? `<div class="text-sm text-gray-600">ملاحظات: ${status.notes}</div>` : ''}
-                        </div>
-                        <div class="text-sm text-gray-500">
-                            ${status.date} - ${status.time}
-                        </div>
-                    </div>
-                `).join('') : '<div class="text-center text-gray-500 p-4">لا توجد تحديثات للحالة</div>';
-
-                content.innerHTML = `
-                    <div class="grid md:grid-cols-2 gap-8">
-                        <div class="space-y-6">
-                            <div class="bg-brako-blue text-white p-4 rounded-lg shadow-md">
-                                <h3 class="text-lg font-bold mb-2">معلومات الشحنة</h3>
-                                <div class="space-y-2 text-sm">
-                                    <div><strong>رقم الشحنة:</strong> ${shipment.shipmentNumber}</div>
-                                    <div><strong>رقم الفاتورة:</strong> ${shipment.invoiceNumber}</div>
-                                    <div><strong>كود التتبع:</strong> ${shipment.trackingCode || 'غير محدد'}</div>
-                                    <div><strong>التاريخ:</strong> ${shipment.date} - ${shipment.time}</div>
-                                    <div><strong>الفرع:</strong> ${shipment.branch === 'topeka' ? 'توبيكا' : 'براكو'}</div>
-                                    <div><strong>نوع الشحن:</strong> ${shipment.shippingType === 'local' ? 'محلي' : 'دولي'}</div>
-                                </div>
-                            </div>
-                            
-                            <div class="bg-brako-teal text-white p-4 rounded-lg shadow-md">
-                                <h3 class="text-lg font-bold mb-2">معلومات المرسل</h3>
-                                <div class="space-y-2 text-sm">
-                                    <div><strong>الاسم:</strong> ${shipment.sender.name}</div>
-                                    <div><strong>الهاتف:</strong> ${shipment.sender.phone}</div>
-                                    <div><strong>الدولة:</strong> ${shipment.sender.country}</div>
-                                    <div><strong>المدينة:</strong> ${shipment.sender.city || 'غير محدد'}</div>
-                                    <div><strong>العنوان:</strong> ${shipment.sender.address}</div>
-                                </div>
-                            </div>
-                        </div>
-                        
-                        <div class="space-y-6">
-                            <div class="bg-brako-yellow text-white p-4 rounded-lg shadow-md">
-                                <h3 class="text-lg font-bold mb-2">معلومات المستلم</h3>
-                                <div class="space-y-2 text-sm">
-                                    <div><strong>الاسم:</strong> ${shipment.receiver.name}</div>
-                                    <div><strong>الهاتف:</strong> ${shipment.receiver.phone}</div>
-                                    <div><strong>الدولة:</strong> ${shipment.receiver.country}</div>
-                                    <div><strong>المدينة:</strong> ${shipment.receiver.city || 'غير محدد'}</div>
-                                    <div><strong>العنوان:</strong> ${shipment.receiver.address}</div>
-                                </div>
-                            </div>
-                            
-                            <div class="bg-gray-100 p-4 rounded-lg shadow-md">
-                                <h3 class="text-lg font-bold mb-2 text-brako-dark">تفاصيل الطرد</h3>
-                                <div class="space-y-2 text-sm text-gray-700">
-                                    <div><strong>الوزن:</strong> ${shipment.weight} كغ</div>
-                                    <div><strong>العدد:</strong> ${shipment.quantity}</div>
-                                    <div><strong>نوع البضاعة:</strong> ${shipment.itemType}</div>
-                                    <div><strong>المحتويات:</strong> ${shipment.contents}</div>
-                                    <div><strong>السعر النهائي:</strong> ${shipment.finalPrice} ${shipment.currency || 'USD'}</div>
-                                    <div><strong>طريقة الدفع:</strong> ${shipment.paymentMethod === 'prepaid' ? 'دفع مقدم' : 'دفع عكسي'}</div>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                    
-                    <div class="mt-8 bg-white border-2 border-brako-blue rounded-lg p-6 shadow-sm">
-                        <h3 class="text-xl font-bold text-brako-blue mb-4">حالة التتبع</h3>
-                        <div class="space-y-3">
-                            ${statusHistoryHTML}
-                        </div>
-                    </div>
-                `;
-                
-                document.getElementById('printDetailsBtn').onclick = () => printA4ForShipment(shipment.id);
-                document.getElementById('whatsappDetailsBtn').onclick = () => sendWhatsApp(shipment);
-                document.getElementById('deleteDetailsBtn').onclick = () => confirmDelete(shipment.id);
-
-                showSection('shipmentDetails');
-            } catch (error) {
-                console.error("Error viewing shipment details:", error);
-                showModal('خطأ', 'حدث خطأ أثناء عرض التفاصيل.');
-            } finally {
-                hideLoading();
-            }
-        }
-
-        function confirmDelete(id) {
-            window.currentDeleteId = id;
-            showModal('تأكيد الحذف', 'هل أنت متأكد من حذف هذه الشحنة؟ لا يمكن التراجع عن هذا الإجراء.', true, deleteShipment);
-        }
-
-        async function deleteShipment() {
-            if (!isAuthenticated) {
-                showModal('خطأ', 'يجب أن تكون مسؤولًا للحذف.');
-                return;
-            }
-            const id = window.currentDeleteId;
-            if (id === undefined) return;
-            showLoading();
-            try {
-                const response = await fetch(`${API_BASE_URL}/${id}`, {
-                    method: 'DELETE'
-                });
-                
-                if (response.ok) {
-                    showModal('نجاح', 'تم حذف الشحنة بنجاح.');
-                    showSection('admin');
-                    showAdminTab('shipmentsList');
-                } else {
-                    showModal('خطأ', 'حدث خطأ أثناء الحذف.');
-                }
-            } catch (error) {
-                console.error("Error deleting shipment:", error);
-                showModal('خطأ', 'حدث خطأ أثناء الحذف.');
-            } finally {
-                hideLoading();
-            }
-        }
-
-        function resetForm() {
-            document.getElementById('shipmentId').value = '';
-            document.getElementById('formTitle').textContent = 'إضافة شحنة جديدة';
-            document.getElementById('saveButton').textContent = 'حفظ الشحنة';
-            
-            document.querySelector('#addShipmentSection form').reset();
-            document.getElementById('insuranceDetails').classList.add('hidden');
-            document.getElementById('packagingDetails').classList.add('hidden');
-            document.getElementById('insuranceCost').value = '';
-            document.getElementById('packagingCost').value = '';
-            calculateTotal();
-            
-            const now = new Date();
-            document.getElementById('shipmentDate').value = now.toISOString().split('T')[0];
-            document.getElementById('shipmentTime').value = now.toTimeString().split(' ')[0].substring(0, 5);
-        }
-        
-        async function loadAllShipments() {
-            showLoading();
-            try {
-                const response = await fetch(API_BASE_URL);
-                if (!response.ok) {
-                    showModal('خطأ', 'فشل في تحميل الشحنات.');
-                    return;
-                }
-                allShipments = await response.json();
-                displayShipments(allShipments);
-                updateStatistics(allShipments);
-            } catch (error) {
-                console.error("Error loading shipments:", error);
-                showModal('خطأ', 'حدث خطأ أثناء تحميل الشحنات.');
-            } finally {
-                hideLoading();
-            }
-        }
-
-        function displayShipments(shipments) {
-            const tableBody = document.getElementById('shipmentsTableBody');
-            
-            if (shipments.length === 0) {
-                tableBody.innerHTML = '<tr><td colspan="11" class="text-center p-8 text-gray-500">لا توجد شحنات مسجلة</td></tr>';
-                return;
-            }
-            
-            tableBody.innerHTML = '';
-            
-            shipments.forEach((shipment, index) => {
-                const row = document.createElement('tr');
-                row.className = index % 2 === 0 ? 'bg-gray-50 hover:bg-gray-200 transition-colors' : 'bg-white hover:bg-gray-200 transition-colors';
-                
-                row.ondblclick = () => viewShipmentDetails(shipment.id);
-
-                const amountText = shipment.paymentMethod === 'cod' ? `${shipment.finalPrice} ${shipment.currency || 'USD'}` : '---';
-                
-                row.innerHTML = `
-                    <td class="border border-gray-300 p-3">
-                        <input type="checkbox" class="export-checkbox w-4 h-4 text-brako-blue rounded-md" data-id="${shipment.id}">
-                    </td>
-                    <td class="border border-gray-300 p-3">${shipment.shipmentNumber}</td>
-                    <td class="border border-gray-300 p-3">${shipment.trackingCode || 'غير محدد'}</td>
-                    <td class="border border-gray-300 p-3">${shipment.sender.name}</td>
-                    <td class="border border-gray-300 p-3">${shipment.receiver.name}</td>
-                    <td class="border border-gray-300 p-3">${shipment.receiver.phone}</td>
-                    <td class="border border-gray-300 p-3">${shipment.quantity}</td>
-                    <td class="border border-gray-300 p-3">${shipment.weight} كغ</td>
-                    <td class="border border-gray-300 p-3">${amountText}</td>
-                    <td class="border border-gray-300 p-3">
-                        <span class="px-2 py-1 rounded-full text-xs font-semibold ${getStatusColor(shipment.status)}">
-                            ${getStatusText(shipment.status)}
-                        </span>
-                    </td>
-                    <td class="border border-gray-300 p-3 flex flex-wrap gap-2 justify-center">
-                        <button onclick="viewShipmentDetails(${shipment.id})" class="bg-brako-teal text-white px-3 py-1 rounded-full text-sm hover:bg-teal-700 transition-colors">عرض</button>
-                        <button onclick="startEditShipment(${shipment.id})" class="bg-brako-yellow text-brako-dark px-3 py-1 rounded-full text-sm hover:bg-yellow-300 transition-colors">تعديل</button>
-                        <button onclick="sendWhatsAppForShipment(${shipment.id})" class="bg-green-500 text-white px-3 py-1 rounded-full text-sm hover:bg-green-600 transition-colors">📱</button>
-                        <button onclick="printA4ForShipment(${shipment.id})" class="bg-brako-blue text-white px-3 py-1 rounded-full text-sm hover:bg-blue-700 transition-colors">🖨️</button>
-                        <button onclick="confirmDelete(${shipment.id})" class="bg-red-500 text-white px-3 py-1 rounded-full text-sm hover:bg-red-700 transition-colors">حذف</button>
-                    </td>
-                `;
-                
-                tableBody.appendChild(row);
-            });
-        }
-        
-        function getStatusColor(status) {
-            const colors = {
-                'received': 'bg-blue-100 text-blue-800',
-                'in_sorting': 'bg-indigo-100 text-indigo-800',
-                'local_shipping': 'bg-purple-100 text-purple-800',
-                'departed': 'bg-yellow-100 text-yellow-800',
-                'at_border': 'bg-orange-100 text-orange-800',
-                'in_transit': 'bg-purple-100 text-purple-800',
-                'arrived_city': 'bg-teal-100 text-teal-800',
-                'delayed': 'bg-red-100 text-red-800',
-                'ready_pickup': 'bg-green-100 text-green-800',
-                'returned': 'bg-gray-300 text-gray-800'
-            };
-            return colors[status] || 'bg-gray-100 text-gray-800';
-        }
-
-        function updateStatistics(shipments) {
-            const totalShipments = shipments.length;
-            const deliveredShipments = shipments.filter(s => s.status === 'ready_pickup').length;
-            const pendingShipments = totalShipments - deliveredShipments;
-            
-            let totalRevenue = 0;
-            shipments.forEach(shipment => {
-                const price = parseFloat(shipment.finalPrice) || 0;
-                totalRevenue += price;
-            });
-            
-            document.getElementById('totalShipments').textContent = totalShipments;
-            document.getElementById('totalRevenue').textContent = totalRevenue.toFixed(2);
-            document.getElementById('deliveredShipments').textContent = deliveredShipments;
-            document.getElementById('pendingShipments').textContent = pendingShipments;
-        }
-
-        document.addEventListener('DOMContentLoaded', async function() {
-            const now = new Date();
-            document.getElementById('shipmentDate').value = now.toISOString().split('T')[0];
-            document.getElementById('shipmentTime').value = now.toTimeString().split(' ')[0].substring(0, 5);
-
-            const hash = window.location.hash;
-            if (hash.startsWith('#tracking/')) {
-                const trackingCodeFromUrl = hash.substring(hash.indexOf('/') + 1);
-                showSection('customerTracking');
-                document.getElementById('trackingCodeInput').value = trackingCodeFromUrl;
-                trackShipment(trackingCodeFromUrl);
-            } else {
-                showSection('home');
-            }
-        });
-    </script>
+    <script src="{{ asset_url('js/app.js') }}"></script>
 </body>
 </html>
 """
 
+build_frontend_assets()
+
+def create_app(database_file=None, setup=True):
+    """
+    يهيئ التطبيق لقاعدة البيانات المطلوبة ويعيده؛ نقطة الدخول لخوادم WSGI (انظر wsgi.py).
+    يُنشأ مجمع الاتصالات وخيط الكتابة من جديد عند أول طلب في كل عملية.
+    """
+    global DATABASE_FILE, _pool, _writer, _shipment_cache, _event_broker
+    if database_file:
+        DATABASE_FILE = database_file
+    with _pool_lock:
+        _pool = None
+        _writer = None
+        _shipment_cache = None
+        _event_broker = None
+    if setup:
+        setup_database()
+    return app
+
 if __name__ == '__main__':
-    setup_database()
-    app.run(debug=True)
\ No newline at end of file
+    # خادم التطوير فقط؛ للإنتاج استخدم: gunicorn -c gunicorn.conf.py
+    create_app()
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
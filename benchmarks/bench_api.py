@@ -0,0 +1,265 @@
+"""
+مجموعة قياس لواجهة API: تملأ قاعدة مؤقتة بشحنات اصطناعية ثم تقيس أهم المسارات عبر عميل اختبار فلاسك
+وعبر خادم WSGI حقيقي، وتطبع p50/p95/p99 والإنتاجية وذروة الذاكرة (RSS).
+يمكن حفظ النتائج كخط أساس JSON ومقارنة التشغيلات اللاحقة به لاكتشاف التراجع في الأداء.
+
+الاستخدام:
+    python benchmarks/bench_api.py --shipments 100000 --save-baseline baseline.json
+    python benchmarks/bench_api.py --shipments 100000 --baseline baseline.json
+    python benchmarks/bench_api.py --db bench.db --modes external --url 127.0.0.1:8000
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from seed import seed_database, STATUSES, CITIES, NAMES, BRANCHES
+
+LIST_FIELDS = 'id,shipmentNumber,trackingCode,sender,receiver,quantity,weight,paymentMethod,finalPrice,currency,status'
+
+# المسارات المقاسة: الاسم -> (دالة تبني الطلب من مولد عشوائي والحد الأعلى للمعرّف، نسبة عدد الطلبات)
+# المسارات الثقيلة (التصدير والطباعة) تُقاس بعدد أقل من الطلبات
+SCENARIOS = {
+    'list': (lambda rng, max_id: ('GET', f'/api/shipments?limit=50&fields={LIST_FIELDS}&after_id={rng.randint(51, max_id + 1)}', None), 1.0),
+    'filtered_list': (lambda rng, max_id: ('GET', f'/api/shipments?limit=50&fields={LIST_FIELDS}&sort=-date'
+                                                  f'&branch={rng.choice(BRANCHES)}&status={rng.choice(STATUSES)}', None), 1.0),
+    'facets': (lambda rng, max_id: ('GET', f'/api/shipments/facets?branch={rng.choice(BRANCHES)}', None), 1.0),
+    'detail': (lambda rng, max_id: ('GET', f'/api/shipments/{rng.randint(1, max_id)}', None), 1.0),
+    'search': (lambda rng, max_id: ('POST', '/api/shipments/search', {'query': f'{rng.choice(NAMES)} {rng.choice(CITIES)}'}), 1.0),
+    'update_status': (lambda rng, max_id: ('POST', '/api/shipments/update_status', {
+        'selectedIds': rng.sample(range(1, max_id + 1), 5), 'newStatus': rng.choice(STATUSES),
+        'currentCity': rng.choice(CITIES), 'statusNotes': '', 'date': '2025-06-01', 'time': '12:00'}), 1.0),
+    'export_excel': (lambda rng, max_id: ('POST', '/api/shipments/export_excel', {
+        'ids': rng.sample(range(1, max_id + 1), min(500, max_id))}), 0.1),
+    'print': (lambda rng, max_id: ('POST', '/api/shipments/generate_a4_print_html', {
+        'ids': rng.sample(range(1, max_id + 1), min(20, max_id))}), 0.2),
+}
+
+# نسبة التراجع المسموح بها عن خط الأساس قبل اعتبار النتيجة تراجعًا
+DEFAULT_TOLERANCE = 0.25
+
+
+class TestClientDriver:
+    """ينفذ الطلبات عبر عميل اختبار فلاسك (بدون شبكة)، بعميل لكل خيط."""
+
+    name = 'test_client'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = app.app.test_client()
+            with client.session_transaction() as session:
+                session['logged_in'] = True
+        response = client.open(path, method=method, json=body)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+    def close(self):
+        pass
+
+
+class KeepAliveHandler(WSGIRequestHandler):
+    """يبقي اتصال HTTP/1.1 مفتوحًا بين الطلبات ولا يطبع سطرًا لكل طلب."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class HttpDriver:
+    """
+    ينفذ الطلبات عبر HTTP باتصال دائم لكل خيط. بدون address يشغل التطبيق على خادم WSGI متعدد الخيوط
+    داخل العملية نفسها؛ ومع address يقيس خادمًا يعمل مسبقًا (مثل gunicorn -c gunicorn.conf.py).
+    """
+
+    name = 'wsgi_server'
+
+    def __init__(self, address=None):
+        self._server = None
+        if address is None:
+            self._server = make_server('127.0.0.1', 0, app.app, threaded=True, request_handler=KeepAliveHandler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            address = f'127.0.0.1:{self._server.server_port}'
+        self._host, _, port = address.partition(':')
+        self._port = int(port or 80)
+        self._local = threading.local()
+        status, headers, _ = self._send(self._connection(), 'POST', '/api/login', {'username': 'brako', 'password': '1988'})
+        assert status == 200, 'login failed'
+        self._cookie = headers['Set-Cookie'].split(';', 1)[0]
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self._host, self._port)
+        return connection
+
+    def _send(self, connection, method, path, body, cookie=None):
+        headers = {'Content-Type': 'application/json'}
+        if cookie:
+            headers['Cookie'] = cookie
+        connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, response.headers, data
+
+    def request(self, method, path, body):
+        status, _, data = self._send(self._connection(), method, path, body, self._cookie)
+        return status, len(data)
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def percentile(sorted_values, fraction):
+    """يعيد القيمة عند النسبة المطلوبة من قائمة مرتبة."""
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_scenario(driver, build, count, concurrency, max_id, seed):
+    """ينفذ count طلبًا من concurrency خيطًا ويعيد ملخص الزمن والإنتاجية."""
+    rng = random.Random(seed)
+    requests = [build(rng, max_id) for _ in range(count)]
+    latencies, errors, sizes = [], [], []
+    lock = threading.Lock()
+
+    def worker(share):
+        for method, path, body in share:
+            started = time.perf_counter()
+            try:
+                status, size = driver.request(method, path, body)
+            except Exception as e:
+                status, size = repr(e), 0
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                sizes.append(size)
+                if not isinstance(status, int) or status >= 400:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(requests[index::concurrency],)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': count,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'throughput_rps': round(count / elapsed, 1),
+        'avg_bytes': round(sum(sizes) / count),
+        'errors': len(errors),
+        # ru_maxrss بالكيلوبايت على لينكس؛ الذروة تراكمية منذ بدء العملية
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """يعيد قائمة بالتراجعات: p95 أبطأ أو إنتاجية أقل من خط الأساس بأكثر من tolerance."""
+    regressions = []
+    for mode, scenarios in results['results'].items():
+        for name, current in scenarios.items():
+            previous = baseline.get('results', {}).get(mode, {}).get(name)
+            if previous is None:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{mode}/{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+            if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"{mode}/{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+            if current['errors'] > previous['errors']:
+                regressions.append(f"{mode}/{name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API benchmark suite')
+    parser.add_argument('--shipments', type=int, default=10000, help='number of synthetic shipments to seed')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario (scaled down for heavy ones)')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads')
+    parser.add_argument('--db', help='reuse or create the seeded database at this path')
+    parser.add_argument('--modes', default='test_client,wsgi_server', help='comma-separated drivers to run')
+    parser.add_argument('--url', help='host:port of an already running server, measured as the "external" mode')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--seed', type=int, default=1988, help='random seed for data and requests')
+    parser.add_argument('--baseline', help='compare against this JSON baseline and exit 1 on regression')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed regression ratio')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    if not os.path.exists(db_path):
+        started = time.perf_counter()
+        seed_database(db_path, args.shipments, seed=args.seed)
+        print(f'seeded {args.shipments:,} shipments in {time.perf_counter() - started:.1f}s')
+    app.DATABASE_FILE = db_path
+    app.setup_database(db_path)
+    app._pool = None
+    app._writer = None
+    max_id = app.open_connection(db_path).execute('SELECT MAX(id) FROM shipments').fetchone()[0]
+
+    drivers = {'test_client': TestClientDriver, 'wsgi_server': HttpDriver, 'external': lambda: HttpDriver(args.url)}
+    results = {
+        'shipments': max_id,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'results': {},
+    }
+    print(f'{"mode":<13}{"scenario":<15}{"requests":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+          f'{"req/s":>9}{"errors":>8}{"RSS MB":>8}')
+    for mode in args.modes.split(','):
+        driver = drivers[mode]()
+        results['results'][mode] = {}
+        try:
+            for name in args.scenarios.split(','):
+                build, ratio = SCENARIOS[name]
+                count = max(10, int(args.requests * ratio))
+                summary = run_scenario(driver, build, count, args.concurrency, max_id, args.seed)
+                results['results'][mode][name] = summary
+                print(f'{mode:<13}{name:<15}{count:>9}{summary["p50_ms"]:>9.2f}{summary["p95_ms"]:>9.2f}'
+                      f'{summary["p99_ms"]:>9.2f}{summary["throughput_rps"]:>9.0f}{summary["errors"]:>8}'
+                      f'{summary["peak_rss_mb"]:>8.0f}')
+        finally:
+            driver.close()
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'baseline saved to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('shipments') != results['shipments']:
+            print(f"warning: baseline was recorded with {baseline.get('shipments')} shipments")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
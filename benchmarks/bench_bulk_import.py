@@ -0,0 +1,97 @@
+"""
+يقيس سرعة الاستيراد الجماعي عبر POST /api/shipments/bulk بصيغتي JSON lines و xlsx على قاعدة فارغة،
+مع صفوف غير صالحة مقصودة للتحقق من تقرير الأخطاء.
+على نواة واحدة: نحو 3–4 آلاف صف/ث لـ JSON lines ونحو ألف صف/ث لـ xlsx؛ نصف وقت الكتابة في مشغل
+فهرس البحث النصي (انظر README).
+
+الاستخدام:
+    python benchmarks/bench_bulk_import.py [عدد الشحنات]
+"""
+import io
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from bench_writes import NEW_SHIPMENT, logged_in_client
+
+# كل صف بهذا الترتيب يحمل حالة غير صالحة ويجب أن يُرفض
+INVALID_EVERY = 1000
+
+XLSX_COLUMNS = (
+    'shipmentNumber', 'invoiceNumber', 'date', 'time', 'branch', 'shippingType', 'paymentMethod',
+    'quantity', 'unitPrice', 'weight', 'itemType', 'contents', 'finalPrice', 'currency', 'status',
+) + tuple(f'{role}_{field}' for role in ('sender', 'receiver') for field in app.CONTACT_FIELDS)
+
+
+def make_shipments(count, seed=1988):
+    """يولد count شحنة بصيغة shipments.json، مع شحنة غير صالحة كل INVALID_EVERY صف."""
+    rng = random.Random(seed)
+    for number in range(1, count + 1):
+        shipment = dict(NEW_SHIPMENT, shipmentNumber=str(number), invoiceNumber=f'INV{number}',
+                        branch=rng.choice(['topeka', 'brako']), weight=str(round(rng.uniform(1, 60), 1)))
+        if number % INVALID_EVERY == 0:
+            shipment['status'] = 'unknown'
+        yield shipment
+
+
+def flatten(shipment):
+    """يحول الشحنة إلى صف Excel بأعمدة XLSX_COLUMNS."""
+    values = dict(shipment)
+    for role in ('sender', 'receiver'):
+        for field in app.CONTACT_FIELDS:
+            values[f'{role}_{field}'] = shipment[role][field]
+    return [values[column] for column in XLSX_COLUMNS]
+
+
+def run_import(name, count, content_type, body):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bulk.db')
+    app.DATABASE_FILE = db_path
+    app._pool = None
+    app._writer = None
+    app.setup_database(db_path)
+
+    started = time.perf_counter()
+    response = logged_in_client().post('/api/shipments/bulk', data=body, content_type=content_type)
+    elapsed = time.perf_counter() - started
+    report = response.get_json()
+
+    conn = sqlite3.connect(db_path)
+    stored, distinct = conn.execute('SELECT COUNT(*), COUNT(DISTINCT trackingCode) FROM shipments').fetchone()
+    conn.close()
+
+    expected_failed = count // INVALID_EVERY
+    print(f"{name:>6}: {report['imported']:,} imported, {report['failed']:,} rejected in {elapsed:.2f}s "
+          f"({count / elapsed:,.0f} rows/s)")
+    assert response.status_code == 201, response.status_code
+    assert report['failed'] == expected_failed and report['imported'] == count - expected_failed
+    assert stored == distinct == report['imported']
+
+
+def main(count):
+    shipments = list(make_shipments(count))
+
+    jsonl = '\n'.join(json.dumps(shipment, ensure_ascii=False) for shipment in shipments).encode('utf-8')
+    run_import('jsonl', count, 'application/x-ndjson', jsonl)
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Shipments')
+    ws.append(XLSX_COLUMNS)
+    for shipment in shipments:
+        ws.append(flatten(shipment))
+    xlsx = io.BytesIO()
+    wb.save(xlsx)
+    run_import('xlsx', count, app.XLSX_MIMETYPE, xlsx.getvalue())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,75 @@
+"""
+يقيس زمن عمليات البحث الشائعة مع فهارس البحث الحالية للشحنات وسجل الحالات وبدونها.
+
+الاستخدام:
+    python benchmarks/bench_indexes.py 10000 100000 1000000
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seed import seed_database, STATUSES
+
+# عدد مرات تنفيذ كل استعلام عند القياس
+REPEATS = 200
+
+LOOKUPS = {
+    'status_history': ('SELECT status, city, notes, date, time FROM status_updates WHERE shipment_id = ? ORDER BY id', 'id'),
+    'tracking_code': ('SELECT id FROM shipments WHERE trackingCode = ?', 'trackingCode'),
+    'shipment_number': ('SELECT id FROM shipments WHERE shipmentNumber = ?', 'shipmentNumber'),
+    'invoice_number': ('SELECT id FROM shipments WHERE invoiceNumber = ?', 'invoiceNumber'),
+    'status_count': ('SELECT COUNT(*) FROM shipments WHERE status = ?', 'status'),
+    'date': ('SELECT id FROM shipments WHERE date = ?', 'date'),
+}
+
+
+def measure(conn, samples):
+    """يعيد متوسط زمن كل استعلام بالميلي ثانية."""
+    results = {}
+    for name, (sql, key) in LOOKUPS.items():
+        values = [sample[key] for sample in samples]
+        started = time.perf_counter()
+        for value in values:
+            conn.execute(sql, (value,)).fetchall()
+        results[name] = (time.perf_counter() - started) * 1000 / len(values)
+    return results
+
+
+def run(size):
+    """يبني قاعدة بحجم size ويطبع زمن البحث قبل الفهارس وبعدها."""
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed_database(db_path, size)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rng = random.Random(size)
+    ids = rng.sample(range(1, size + 1), min(REPEATS, size))
+    samples = [dict(conn.execute('SELECT id, trackingCode, shipmentNumber, invoiceNumber, date FROM shipments WHERE id = ?', (i,)).fetchone()) for i in ids]
+    for sample in samples:
+        sample['status'] = rng.choice(STATUSES)
+
+    after = measure(conn, samples)
+    # تُحذف كل الفهارس التي أنشأتها الترحيلات على الجدولين كما هي الآن، لا فهارس الترحيل الأول فقط
+    indexes = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('shipments', 'status_updates') "
+        "AND name LIKE 'idx\\_%' ESCAPE '\\'")]
+    for name in indexes:
+        conn.execute('DROP INDEX ' + name)
+    before = measure(conn, samples)
+    conn.close()
+
+    print(f'\n{size:,} shipments')
+    print(f'{"lookup":<18}{"before (ms)":>14}{"after (ms)":>14}{"speedup":>10}')
+    for name in LOOKUPS:
+        print(f'{name:<18}{before[name]:>14.3f}{after[name]:>14.3f}{before[name] / after[name]:>9.0f}x')
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    for arg in sys.argv[1:] or ['10000', '100000']:
+        run(int(arg))
@@ -0,0 +1,55 @@
+"""
+يقيس زمن توليد صفحة طباعة الفواتير لعدد 1 و100 و5000 فاتورة:
+القالب المترجم مسبقًا مقارنة بإعادة ترجمته مع كل طلب عبر render_template_string.
+
+الاستخدام:
+    python benchmarks/bench_print.py
+"""
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import render_template_string
+
+import app
+
+SHIPMENT = {
+    'shipmentNumber': '1', 'invoiceNumber': '11', 'trackingCode': 'TOP00000001',
+    'sender': {'name': 'مزكين', 'phone': '+963 0997837017', 'country': 'سوريا', 'city': 'دير الزور'},
+    'receiver': {'name': 'آلان', 'phone': '+964 0750123456', 'country': 'العراق', 'city': 'أربيل'},
+    'weight': '12', 'quantity': '2', 'unitPrice': '5', 'insuranceCost': '3', 'packagingCost': '2',
+    'finalPrice': '65.00', 'currency': 'USD', 'paymentMethod': 'prepaid',
+}
+REPEATS = {1: 200, 100: 20, 5000: 3}
+
+
+def best_of(repeats, func):
+    """يعيد أفضل زمن تنفيذ بالمللي ثانية."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def main():
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+
+    print(f'{"invoices":>9}{"recompile (ms)":>16}{"precompiled (ms)":>18}{"endpoint (ms)":>15}')
+    for count, repeats in REPEATS.items():
+        shipments = [copy.deepcopy(SHIPMENT) for _ in range(count)]
+        with app.app.test_request_context():
+            recompiled = best_of(repeats, lambda: render_template_string(app.A4_HALF_PRINT_TEMPLATE, shipments=shipments))
+            precompiled = best_of(repeats, lambda: app.A4_HALF_PRINT.render(shipments=shipments))
+        endpoint = best_of(repeats, lambda: client.post('/api/shipments/generate_a4_print_html', json={'shipments': shipments}))
+        print(f'{count:>9}{recompiled:>16.2f}{precompiled:>18.2f}{endpoint:>15.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+يقيس زمن القراءة أثناء الكتابة المتزامنة: قراءات فقط، ثم قراءات مع كتّاب متزامنين.
+يُشغَّل مرة بوضع WAL مع خيط الكتابة، ومرة بوضع rollback journal للمقارنة.
+
+الاستخدام:
+    python benchmarks/bench_writes.py [عدد الشحنات] [مدة كل مرحلة بالثواني]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from seed import seed_database
+
+READERS = 4
+WRITERS = 4
+
+NEW_SHIPMENT = {
+    'shipmentNumber': 'W1', 'invoiceNumber': 'W1', 'date': '2025-01-01', 'time': '10:00',
+    'branch': 'topeka', 'shippingType': 'local',
+    'sender': {'name': 'مرسل', 'phone': '+963 0990000000', 'country': 'سوريا', 'city': 'دمشق', 'address': ''},
+    'receiver': {'name': 'مستلم', 'phone': '+964 0750000000', 'country': 'العراق', 'city': 'أربيل', 'address': ''},
+    'paymentMethod': 'prepaid', 'insurance': False, 'insuranceCost': '0', 'packaging': False,
+    'packagingCost': '0', 'quantity': '1', 'unitPrice': '5', 'weight': '12', 'itemType': 'ملابس',
+    'contents': 'ملابس', 'finalPrice': '60.00', 'currency': 'USD', 'status': 'received',
+    'statusHistory': [{'status': 'received', 'city': '', 'notes': '', 'date': '2025-01-01', 'time': '10:00'}],
+}
+
+
+def logged_in_client():
+    """يعيد عميل اختبار بجلسة مسؤول."""
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    return client
+
+
+def reader(stop, max_id, latencies, errors):
+    client = logged_in_client()
+    rng = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = client.get(f'/api/shipments/{rng.randint(1, max_id)}')
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+def writer(stop, counter, errors):
+    client = logged_in_client()
+    rng = random.Random()
+    while not stop.is_set():
+        try:
+            if rng.random() < 0.5:
+                response = client.post('/api/shipments', json=NEW_SHIPMENT)
+            else:
+                response = client.post('/api/shipments/update_status', json={
+                    'selectedIds': [rng.randint(1, 1000) for _ in range(5)], 'newStatus': 'in_transit',
+                    'currentCity': 'دمشق', 'statusNotes': '', 'date': '2025-01-02', 'time': '11:00'})
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            counter.append(1)
+        except Exception as e:
+            errors.append(repr(e))
+
+
+def phase(max_id, duration, writers):
+    """يشغل القراء (ومعهم الكتّاب إن طُلب) لمدة duration ويعيد ملخص الزمن."""
+    stop = threading.Event()
+    latencies, errors, writes = [], [], []
+    threads = [threading.Thread(target=reader, args=(stop, max_id, latencies, errors)) for _ in range(READERS)]
+    threads += [threading.Thread(target=writer, args=(stop, writes, errors)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return {
+        'reads': len(latencies),
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95)],
+        'writes/s': len(writes) / duration,
+        'errors': len(errors),
+    }
+
+
+def run(size, duration, journal_mode):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed_database(db_path, size)
+    app.DATABASE_FILE = db_path
+    app.CONNECTION_PRAGMAS = tuple(p for p in app.CONNECTION_PRAGMAS if 'journal_mode' not in p) + (f'PRAGMA journal_mode = {journal_mode}',)
+    app._pool = None
+    app._writer = None
+    results = [('reads only', phase(size, duration, 0)), (f'reads + {WRITERS} writers', phase(size, duration, WRITERS))]
+    print(f'\njournal_mode={journal_mode}, {size:,} shipments')
+    print(f'{"phase":<22}{"reads":>8}{"p50 ms":>9}{"p95 ms":>9}{"writes/s":>10}{"errors":>8}')
+    for name, r in results:
+        print(f'{name:<22}{r["reads"]:>8}{r["p50"]:>9.2f}{r["p95"]:>9.2f}{r["writes/s"]:>10.0f}{r["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for mode in ('WAL', 'DELETE'):
+        run(size, duration, mode)
@@ -0,0 +1,79 @@
+"""
+يملأ قاعدة بيانات مؤقتة بشحنات وجهات اتصال وسجل حالات اصطناعية لأغراض القياس.
+
+الاستخدام:
+    python benchmarks/seed.py /tmp/bench.db 100000
+"""
+import os
+import random
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+STATUSES = ['received', 'in_sorting', 'local_shipping', 'departed', 'at_border',
+            'in_transit', 'arrived_city', 'delayed', 'ready_pickup', 'returned']
+CITIES = ['دمشق', 'حمص', 'القامشلي', 'حلب', 'الحسكة', 'أربيل', 'دهوك', 'السليمانية', 'زاخو', 'كركوك']
+BRANCHES = ['topeka', 'brako']
+NAMES = ['محمد', 'أحمد', 'علي', 'فاطمة', 'مزكين', 'آلان', 'سارة', 'يوسف', 'ليلى', 'خالد']
+ITEM_TYPES = ['ملابس', 'أدوية', 'إلكترونيات', 'وثائق', 'مواد غذائية']
+
+
+def _contact(rng, contact_id):
+    """يولد جهة اتصال اصطناعية."""
+    country, code = rng.choice([('سوريا', '+963'), ('العراق', '+964')])
+    return (contact_id, f'{rng.choice(NAMES)} {contact_id}', f'{code} 09{rng.randrange(10**8):08d}',
+            country, rng.choice(CITIES), 'عنوان تجريبي')
+
+
+def seed_database(db_path, shipment_count, history_per_shipment=2, batch_size=10000, seed=1988):
+    """ينشئ المخطط في db_path ثم يدرج shipment_count شحنة مع جهات اتصالها وسجل حالاتها."""
+    app.setup_database(db_path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    first_id = (conn.execute('SELECT MAX(id) FROM shipments').fetchone()[0] or 0) + 1
+    first_contact_id = (conn.execute('SELECT MAX(id) FROM contacts').fetchone()[0] or 0) + 1
+
+    for batch_start in range(0, shipment_count, batch_size):
+        contacts, shipments, updates = [], [], []
+        for offset in range(batch_start, min(batch_start + batch_size, shipment_count)):
+            shipment_id = first_id + offset
+            sender_id = first_contact_id + 2 * offset
+            receiver_id = sender_id + 1
+            contacts.append(_contact(rng, sender_id))
+            contacts.append(_contact(rng, receiver_id))
+
+            branch = rng.choice(BRANCHES)
+            weight = round(rng.uniform(1, 60), 1)
+            unit_price = rng.choice([2, 3, 5])
+            prices = app.price_shipment({'weight': weight, 'unitPrice': unit_price})
+            status = rng.choice(STATUSES)
+            date = f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+            shipments.append((
+                shipment_id, str(shipment_id), f'INV{shipment_id}', date, '10:00', branch,
+                rng.choice(['local', 'international']), sender_id, receiver_id,
+                rng.choice(['prepaid', 'cod']), 0, 0, 0, 0, rng.randint(1, 5), unit_price, weight,
+                rng.choice(ITEM_TYPES), 'محتويات تجريبية', prices['finalPrice'], rng.choice(['USD', 'SYP', 'IQD']),
+                status, ('TOP' if branch == 'topeka' else 'BRA') + f'{shipment_id:08d}',
+                *(prices[column] for column in app.PRICE_COLUMNS)
+            ))
+            for step in range(history_per_shipment):
+                updates.append((shipment_id, STATUSES[step] if step else 'received',
+                                rng.choice(CITIES), '', date, f'{10 + step:02d}:00'))
+
+        conn.executemany('INSERT INTO contacts (id, name, phone, country, city, address) VALUES (?, ?, ?, ?, ?, ?)', contacts)
+        conn.executemany(f'''
+            INSERT INTO shipments ({', '.join(app.SHIPMENT_COLUMNS)})
+            VALUES ({', '.join(['?'] * len(app.SHIPMENT_COLUMNS))})
+        ''', shipments)
+        conn.executemany('INSERT INTO status_updates (shipment_id, status, city, notes, date, time) VALUES (?, ?, ?, ?, ?, ?)', updates)
+        conn.commit()
+
+    conn.close()
+    return first_id, first_id + shipment_count - 1
+
+
+if __name__ == '__main__':
+    seed_database(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
@@ -0,0 +1,75 @@
+"""
+يختبر مولّد أكواد التتبع تحت الضغط: عدة عمليات، في كل منها عدة خيوط، تنشئ الشحنات معًا
+عبر POST /api/shipments على قاعدة واحدة، ثم يتحقق من عدم تكرار أي كود ومن صحة خانة التحقق.
+
+الاستخدام:
+    python benchmarks/stress_tracking_codes.py [عدد الشحنات] [عدد العمليات] [خيوط كل عملية]
+"""
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from bench_writes import NEW_SHIPMENT, logged_in_client
+
+
+def create_shipments(db_path, count, threads):
+    """ينشئ count شحنة من threads خيطًا داخل عملية واحدة ويعيد عدد الأخطاء."""
+    app.DATABASE_FILE = db_path
+    app._pool = None
+    app._writer = None
+    errors = []
+
+    def worker(share):
+        client = logged_in_client()
+        for number in range(share):
+            shipment = dict(NEW_SHIPMENT, branch='topeka' if number % 2 else 'brako')
+            response = client.post('/api/shipments', json=shipment)
+            if response.status_code != 201:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=worker, args=(count // threads + (index < count % threads),))
+               for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(errors)
+
+
+def run(total, processes, threads):
+    db_path = os.path.join(tempfile.mkdtemp(), 'stress.db')
+    app.setup_database(db_path)
+
+    started = time.perf_counter()
+    shares = [total // processes + (index < total % processes) for index in range(processes)]
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        errors = sum(pool.starmap(create_shipments, [(db_path, share, threads) for share in shares]))
+    elapsed = time.perf_counter() - started
+
+    conn = sqlite3.connect(db_path)
+    created, distinct = conn.execute('SELECT COUNT(*), COUNT(DISTINCT trackingCode) FROM shipments').fetchone()
+    codes = [row[0] for row in conn.execute('SELECT trackingCode FROM shipments')]
+    bad_check_digits = sum(app.tracking_check_digit(code[3:-1]) != code[-1] for code in codes)
+    conn.close()
+
+    print(f'{created:,} shipments from {processes} processes x {threads} threads in {elapsed:.1f}s '
+          f'({created / elapsed:,.0f}/s)')
+    print(f'errors={errors} collisions={created - distinct} bad check digits={bad_check_digits}')
+    assert errors == 0 and created == total
+    assert created == distinct, 'duplicate tracking codes'
+    assert bad_check_digits == 0, 'invalid check digits'
+
+
+if __name__ == '__main__':
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    run(total, processes, threads)
@@ -0,0 +1,216 @@
+"""
+خادم أحداث الشحنات (/api/events) للإنتاج، بصيغة Server-Sent Events على حلقة asyncio واحدة.
+
+في gunicorn يشغل كل اتصال أحداث مفتوح خيطًا من خيوط العملية حتى ينقطع، فلا تتسع لآلاف المتصفحات
+الخاملة. هنا الاتصال الخامل كائن صغير ينتظر في الحلقة، ويقرأ سجل التغييرات (shipment_changes) خيط
+موزع الأحداث نفسه في app.py خارج الحلقة، فلا تحجبها استعلامات SQLite ولا انتظار busy_timeout.
+جلسة المسؤول تُقرأ من ملف تعريف الارتباط الموقّع بمفتاح التطبيق (FLASK_SECRET_KEY) نفسه.
+
+يوجّه الوكيل العكسي المسار /api/events إلى هذا الخادم وبقية الطلبات إلى gunicorn (انظر README).
+
+الاستخدام:
+    python events_server.py
+    EVENTS_BIND=0.0.0.0:8001 DATABASE_FILE=database.db python events_server.py
+"""
+import asyncio
+import functools
+import http
+import os
+import queue
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import app
+
+EVENTS_BIND = os.environ.get('EVENTS_BIND', '127.0.0.1:8001')
+# مهلة وصول ترويسات الطلب بالثواني، والحد الأقصى لحجمها
+REQUEST_TIMEOUT = 10
+MAX_REQUEST_BYTES = 16 * 1024
+
+_local = threading.local()
+
+
+class AsyncEventSubscription(app.EventSubscription):
+    """اشتراك اتصال واحد؛ ready تُرفع في الحلقة كلما وضع الموزع في طابوره أحداثًا جديدة."""
+
+    def __init__(self, shipment_id, start_seq, size, client=None):
+        super().__init__(shipment_id, start_seq, size, client)
+        self.ready = asyncio.Event()
+
+
+def _wake(subscriptions):
+    for subscription in subscriptions:
+        subscription.ready.set()
+
+
+class AsyncEventBroker(app.EventBroker):
+    """
+    موزع الأحداث في app.py كما هو: خيطه يبني كل حدث مرة واحدة ويضعه في الطوابير، ثم يوقظ
+    الاتصالات التي وصلتها أحداث بنداء واحد للحلقة لكل دفعة تغييرات.
+    """
+
+    subscription_class = AsyncEventSubscription
+
+    def __init__(self, loop, *args):
+        super().__init__(*args)
+        self._loop = loop
+        self._delivered = set()
+
+    def _deliver(self, subscribers, event):
+        super()._deliver(subscribers, event)
+        self._delivered.update(subscribers)
+
+    def _publish(self, c, rows):
+        super()._publish(c, rows)
+        delivered, self._delivered = self._delivered, set()
+        if delivered:
+            self._loop.call_soon_threadsafe(_wake, delivered)
+
+
+def find_shipment_id(tracking_code):
+    """يبحث عن الشحنة بكود التتبع باتصال خاص بخيط المنفذ؛ يُستدعى خارج الحلقة."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = app.open_connection(app.DATABASE_FILE)
+    return app.find_tracking_shipment_id(conn.cursor(), tracking_code)
+
+
+def is_admin(cookie_header):
+    """يتحقق من جلسة المسؤول كما يقرؤها Flask من ملف تعريف الارتباط."""
+    request = app.app.request_class({'REQUEST_METHOD': 'GET', 'HTTP_COOKIE': cookie_header or ''})
+    session = app.app.session_interface.open_session(app.app, request)
+    return bool(session and session.get('logged_in'))
+
+
+def http_head(status, headers):
+    lines = [f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}', *(f'{name}: {value}' for name, value in headers),
+             'Connection: close']
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def error_response(status, message, headers=()):
+    body = app.app.json.dumps({'error': message}).encode('utf-8')
+    return http_head(status, [('Content-Type', 'application/json'), ('Content-Length', len(body)), *headers]) + body
+
+
+async def stream_events(writer, broker, subscription, resync):
+    """يكتب أحداث المشترك حتى ينقطع العميل أو يبلغ الاتصال أقصى عمره، مع نبضة إبقاء عند الخمول."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + app.EVENTS_MAX_AGE
+    try:
+        writer.write(http_head(200, [
+            ('Content-Type', 'text/event-stream'),
+            ('Cache-Control', 'no-cache'),
+            ('X-Accel-Buffering', 'no'),
+        ]) + f'retry: {app.EVENTS_RETRY_MS}\n\n'.encode('utf-8'))
+        if resync:
+            writer.write(app.format_event('resync', {}))
+        while True:
+            # عميل لا يقرأ يُفصل بعد فترة نبضة واحدة، وقد فصله الموزع أصلًا عند امتلاء طابوره
+            await asyncio.wait_for(writer.drain(), app.EVENTS_HEARTBEAT)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            if subscription.overflowed:
+                writer.write(app.format_event('resync', {}))
+                await asyncio.wait_for(writer.drain(), app.EVENTS_HEARTBEAT)
+                return
+            events = []
+            while True:
+                try:
+                    events.append(subscription.events.get_nowait())
+                except queue.Empty:
+                    break
+            if events:
+                writer.write(b''.join(events))
+                continue
+            # تُمسح العلامة قبل فحص الطابور مجددًا، فلا يضيع إيقاظ وصل بينهما
+            subscription.ready.clear()
+            if not subscription.events.empty() or subscription.overflowed:
+                continue
+            try:
+                await asyncio.wait_for(subscription.ready.wait(), min(app.EVENTS_HEARTBEAT, remaining))
+            except asyncio.TimeoutError:
+                writer.write(b': ping\n\n')
+    except (ConnectionError, asyncio.TimeoutError):
+        pass
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def handle_connection(broker, reader, writer):
+    """يقرأ طلب GET واحدًا ويخدم /api/events بالقواعد نفسها لمسار Flask (shipment_events)."""
+    try:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        parts = request_line.split(' ')
+        if len(parts) != 3:
+            writer.write(error_response(400, 'Bad request'))
+            return
+        method, target, _ = parts
+        headers = {}
+        for line in header_lines:
+            name, separator, value = line.partition(':')
+            if separator:
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        if url.path != '/api/events':
+            writer.write(error_response(404, 'Not found'))
+            return
+        if method != 'GET':
+            writer.write(error_response(405, 'Method not allowed', [('Allow', 'GET')]))
+            return
+
+        tracking_code = parse_qs(url.query).get('trackingCode', [''])[0]
+        if tracking_code:
+            shipment_id = await asyncio.to_thread(find_shipment_id, tracking_code)
+            if shipment_id is None:
+                writer.write(error_response(404, 'Shipment not found'))
+                return
+        elif is_admin(headers.get('cookie')):
+            shipment_id = None
+        else:
+            writer.write(error_response(401, 'Unauthorized'))
+            return
+
+        peer = writer.get_extra_info('peername')
+        if app.EVENTS_CLIENT_HEADER:
+            client = headers.get(app.EVENTS_CLIENT_HEADER.lower())
+        else:
+            client = peer[0] if peer else None
+        subscription = broker.subscribe(shipment_id, client)
+        if subscription is None:
+            writer.write(error_response(503, 'Too many event subscribers',
+                                        [('Retry-After', int(app.EVENTS_RETRY_MS / 1000))]))
+            return
+        resync = app.event_resync_needed(headers.get('last-event-id'), subscription.start_seq)
+        await stream_events(writer, broker, subscription, resync)
+    finally:
+        writer.close()
+
+
+async def serve(host, port):
+    loop = asyncio.get_running_loop()
+    broker = AsyncEventBroker(loop, app.DATABASE_FILE, app.EVENTS_POLL_INTERVAL, app.EVENTS_QUEUE_SIZE,
+                              app.EVENTS_MAX_BATCH, app.EVENTS_MAX_SUBSCRIBERS, app.EVENTS_MAX_PUBLIC_SUBSCRIBERS,
+                              app.EVENTS_MAX_PER_CLIENT)
+    # يفتح اتصال الموزع ويقرأ موضع سجل التغييرات قبل قبول الاتصالات، لا داخل الحلقة أثناء الخدمة
+    broker.start()
+    server = await asyncio.start_server(functools.partial(handle_connection, broker), host, port,
+                                        limit=MAX_REQUEST_BYTES)
+    print(f'events server listening on {host}:{port}', flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    app.create_app()
+    host, _, port = EVENTS_BIND.rpartition(':')
+    asyncio.run(serve(host or '127.0.0.1', int(port)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+إعدادات gunicorn للإنتاج: عدة عمليات عاملة، لكل منها عدة خيوط.
+
+يُحمَّل التطبيق مسبقًا في العملية الرئيسية (preload_app) قبل إنشاء العمليات العاملة، فيُنفذ
+setup_database() وترحيلات المخطط مرة واحدة فقط، وتتشارك العمليات صفحات الذاكرة المحملة (copy-on-write).
+كل عملية تفتح مجمع اتصالاتها وخيط الكتابة الخاص بها عند أول طلب، وتنسق SQLite (WAL) الكتابة بينها.
+
+الاستخدام:
+    gunicorn -c gunicorn.conf.py
+    WEB_CONCURRENCY=4 WEB_THREADS=8 BIND=0.0.0.0:8000 gunicorn -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+
+# عدد العمليات العاملة؛ افتراضيًا عملية لكل نواة مع حد أدنى 2
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count())))
+# الخيوط داخل كل عملية؛ معظم زمن الطلب انتظار لقاعدة البيانات أو للشبكة
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+# كل اتصال أحداث مفتوح (/api/events) يشغل خيطًا حتى ينقطع؛ لكل من المسؤولين وصفحة التتبع العامة
+# ربع الخيوط بحد مستقل، فيبقى نصفها على الأقل للطلبات العادية. في الإنتاج يخدم events_server.py
+# هذا المسار دون خيط لكل اتصال، وتبقى هذه الحدود لحماية العمليات إذا وصلها الطلب مباشرة
+os.environ.setdefault('EVENTS_MAX_SUBSCRIBERS', str(max(1, threads // 4)))
+os.environ.setdefault('EVENTS_MAX_PUBLIC_SUBSCRIBERS', str(max(1, threads // 4)))
+
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+keepalive = 5
+# إعادة تشغيل العملية بعد عدد من الطلبات للحد من تضخم الذاكرة، مع تفاوت حتى لا تتوقف كلها معًا
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('ACCESS_LOG')
+errorlog = '-'
@@ -0,0 +1,1320 @@
+const API_BASE_URL = '/api/shipments';
+const sectionIds = ['home', 'services', 'about', 'contact', 'customerTracking', 'admin'];
+let allShipments = [];
+let lastSavedShipment = null;
+// حالة الترقيم في قائمة الشحنات: تُجلب الصفحات تباعًا عند التمرير
+const SHIPMENTS_PAGE_SIZE = 50;
+const SHIPMENTS_LIST_FIELDS = 'id,shipmentNumber,trackingCode,sender,receiver,quantity,weight,paymentMethod,finalPrice,currency,status';
+let nextShipmentsCursor = null;
+let hasMoreShipments = false;
+let isLoadingShipmentsPage = false;
+let isAuthenticated = false;
+// اتصالات الأحداث الحية (Server-Sent Events) للوحة الإدارة ولصفحة التتبع
+let shipmentEvents = null;
+let trackingEvents = null;
+let shipmentSummaryTimer = null;
+let shipmentEventsRetryTimer = null;
+let shipmentsReloadPending = false;
+
+const citiesData = {
+    syria: ['دمشق', 'حمص', 'القامشلي', 'حلب', 'الرقة', 'دير الزور', 'المالكية', 'معبدة', 'الجوادية', 'القحطانية', 'عامودا', 'الدرباسية', 'الحسكة', 'كوباني'],
+    iraq: ['أربيل', 'دهوك', 'دوميز', 'السليمانية', 'زاخو', 'فايدة', 'كركوك', 'كويلان', 'دار شكران', 'قوشتبه']
+};
+
+const statusTexts = {
+    'received': 'استلام في المركز',
+    'in_sorting': 'قيد الفرز',
+    'local_shipping': 'شحن داخلي',
+    'departed': 'انطلاق الشحنة',
+    'at_border': 'في المعبر',
+    'in_transit': 'في الطريق',
+    'arrived_city': 'وصول إلى المدينة',
+    'delayed': 'مؤجل',
+    'ready_pickup': 'جاهزة للاستلام',
+    'returned': 'مرتجع'
+};
+
+const branchTexts = {
+    'topeka': 'توبيكا',
+    'brako': 'براكو'
+};
+
+function showLoading() { document.getElementById('loadingOverlay').classList.remove('hidden'); }
+function hideLoading() { document.getElementById('loadingOverlay').classList.add('hidden'); }
+
+function showModal(title, message, isConfirm = false, onConfirm = null) {
+    const modal = document.getElementById('modalContainer');
+    document.getElementById('modalTitle').textContent = title;
+    document.getElementById('modalMessage').textContent = message;
+
+    const confirmBtn = document.getElementById('modalConfirmBtn');
+    const cancelBtn = document.getElementById('modalCancelBtn');
+
+    if (isConfirm) {
+        confirmBtn.classList.remove('hidden');
+        confirmBtn.onclick = () => {
+            if (onConfirm) onConfirm();
+            hideModal();
+        };
+        cancelBtn.onclick = hideModal;
+    } else {
+        confirmBtn.classList.add('hidden');
+        cancelBtn.onclick = hideModal;
+    }
+
+    modal.classList.remove('hidden');
+}
+
+function hideModal() {
+    const modal = document.getElementById('modalContainer');
+    modal.classList.add('hidden');
+}
+
+function showPostSaveModal(shipmentData) {
+    lastSavedShipment = shipmentData;
+    document.getElementById('savedTrackingCode').textContent = shipmentData.trackingCode;
+    document.getElementById('postSaveModal').classList.remove('hidden');
+}
+
+function hidePostSaveModal() {
+    document.getElementById('postSaveModal').classList.add('hidden');
+}
+
+function hidePostSaveModalAndReset() {
+    hidePostSaveModal();
+    resetForm();
+    loadAllShipments();
+}
+
+function showPrintCopiesModal(shipments) {
+    const modal = document.getElementById('printCopiesModal');
+    document.getElementById('copiesCount').value = 1;
+    modal.classList.remove('hidden');
+
+    const printBtn = document.getElementById('printCopiesBtn');
+    printBtn.onclick = () => {
+        const count = parseInt(document.getElementById('copiesCount').value);
+        if (count > 0) {
+            printToNewWindow(shipments, count);
+        }
+        hidePrintCopiesModal();
+    };
+}
+
+function hidePrintCopiesModal() {
+    const modal = document.getElementById('printCopiesModal');
+    modal.classList.add('hidden');
+}
+
+function sendWhatsAppFromModal() {
+    if (lastSavedShipment) {
+        sendWhatsApp(lastSavedShipment);
+        hidePostSaveModal();
+    }
+}
+
+function sendWhatsApp(shipmentData) {
+    const phoneForLink = shipmentData.sender.phone.replace('+', '').replace(/\s/g, '');
+    const trackingLink = `${window.location.origin}/#tracking/${shipmentData.trackingCode}`;
+
+    const senderInfo = `${shipmentData.sender.name}
+*الوجهة:* ${shipmentData.sender.city || 'غير محدد'}, ${shipmentData.sender.country}
+*العنوان:* ${shipmentData.sender.address || 'غير محدد'}`;
+
+    const message = `🚚 *شركة BRAKO للشحن الدولي* 🚚
+
+✅ *تم إنشاء شحنتكم بنجاح!*
+
+📋 *تفاصيل الشحنة:*
+• رقم الشحنة: *${shipmentData.shipmentNumber}*
+• كود التتبع: *${shipmentData.trackingCode}*
+• المرسل: ${senderInfo}
+• المستلم: ${shipmentData.receiver.name}
+
+🔍 *لتتبع شحنتكم عبر الرابط التالي:*
+${trackingLink}
+
+📞 *للاستفسار:*
++963943396345
++963984487359
+
+🙏 *شكراً لثقتكم بنا*
+نحن نعمل على توصيل شحناتكم بأمان وسرعة`;
+
+    const whatsappUrl = `https://wa.me/${phoneForLink}?text=${encodeURIComponent(message)}`;
+    window.open(whatsappUrl, '_blank');
+}
+
+function updateCountryCode(type) {
+    const countrySelect = document.getElementById(type + 'Country');
+    const countryCodeInput = document.getElementById(type + 'CountryCode');
+    const citySelect = document.getElementById(type + 'City');
+
+    const selectedOption = countrySelect.options[countrySelect.selectedIndex];
+    const countryCode = selectedOption.getAttribute('data-code') || '+00';
+    const countryValue = selectedOption.value;
+
+    countryCodeInput.value = countryCode;
+
+    if (citiesData[countryValue]) {
+        citySelect.classList.remove('hidden');
+        citySelect.innerHTML = '<option value="">اختر المدينة</option>';
+        citiesData[countryValue].forEach(city => {
+            const option = document.createElement('option');
+            option.value = city;
+            option.textContent = city;
+            citySelect.appendChild(option);
+        });
+    } else {
+        citySelect.classList.add('hidden');
+        citySelect.innerHTML = '<option value="">اختر المدينة</option>';
+    }
+}
+
+async function showSection(sectionId) {
+    const sections = document.querySelectorAll('.section-content');
+    sections.forEach(section => section.classList.add('hidden'));
+
+    if (sectionId === 'admin') {
+        showLoading();
+        const response = await fetch('/api/auth_status');
+        hideLoading();
+        const data = await response.json();
+        isAuthenticated = data.isAuthenticated;
+
+        if (isAuthenticated) {
+            document.getElementById('adminPanelContent').classList.remove('hidden');
+            document.getElementById('adminLoginSection').classList.add('hidden');
+            document.getElementById('logoutButton').classList.remove('hidden');
+            document.getElementById(sectionId).classList.remove('hidden');
+            showAdminTab('addShipment');
+            connectShipmentEvents();
+        } else {
+            document.getElementById('adminLoginSection').classList.remove('hidden');
+            document.getElementById('adminPanelContent').classList.add('hidden');
+            document.getElementById('logoutButton').classList.add('hidden');
+            document.getElementById(sectionId).classList.remove('hidden');
+        }
+    } else {
+        document.getElementById('logoutButton').classList.add('hidden');
+        document.getElementById(sectionId).classList.remove('hidden');
+    }
+    window.location.hash = sectionId;
+}
+
+async function handleLogout() {
+    showLoading();
+    const response = await fetch('/api/logout', { method: 'POST' });
+    hideLoading();
+    if (response.ok) {
+        isAuthenticated = false;
+        clearTimeout(shipmentEventsRetryTimer);
+        if (shipmentEvents) {
+            shipmentEvents.close();
+            shipmentEvents = null;
+        }
+        document.getElementById('adminPanelContent').classList.add('hidden');
+        document.getElementById('adminLoginSection').classList.add('hidden');
+        document.getElementById('logoutButton').classList.add('hidden');
+        showSection('home');
+    } else {
+        showModal('خطأ', 'فشل تسجيل الخروج.');
+    }
+}
+
+function toggleInsurance() {
+    const checkbox = document.getElementById('insurance');
+    const details = document.getElementById('insuranceDetails');
+    if (checkbox.checked) {
+        details.classList.remove('hidden');
+    } else {
+        details.classList.add('hidden');
+        document.getElementById('insuranceCost').value = '';
+    }
+    calculateTotal();
+}
+
+function togglePackaging() {
+    const checkbox = document.getElementById('packaging');
+    const details = document.getElementById('packagingDetails');
+    if (checkbox.checked) {
+        details.classList.remove('hidden');
+    } else {
+        details.classList.add('hidden');
+        document.getElementById('packagingCost').value = '';
+    }
+    calculateTotal();
+}
+
+function calculateTotal() {
+    const weight = parseFloat(document.getElementById('weight').value) || 0;
+    const unitPrice = parseFloat(document.getElementById('unitPrice').value) || 0;
+    const insuranceCost = parseFloat(document.getElementById('insuranceCost').value) || 0;
+    const packagingCost = parseFloat(document.getElementById('packagingCost').value) || 0;
+
+    // حساب السعر الأساسي بناءً على الوزن، مع فرض 10 كغ كحد أدنى
+    let basePrice = 0;
+    if (weight > 0) {
+        const calculatedWeight = (weight < 10) ? 10 : weight;
+        basePrice = calculatedWeight * unitPrice;
+    }
+
+    const finalPrice = basePrice + insuranceCost + packagingCost;
+
+    document.getElementById('basePrice').textContent = basePrice.toFixed(2);
+    document.getElementById('insuranceDisplay').textContent = insuranceCost.toFixed(2);
+    document.getElementById('packagingDisplay').textContent = packagingCost.toFixed(2);
+    document.getElementById('finalPrice').textContent = finalPrice.toFixed(2);
+}
+
+function updateCurrencyDisplay() {
+    const currency = document.getElementById('currency').value;
+    document.getElementById('currencySymbol').textContent = currency;
+    calculateTotal();
+}
+
+function showAdminTab(tabName) {
+    const tabs = document.querySelectorAll('.admin-tab-content');
+    tabs.forEach(tab => tab.classList.add('hidden'));
+
+    const tabButtons = document.querySelectorAll('.p-1 button');
+    tabButtons.forEach(btn => btn.classList.replace('tab-active', 'tab-inactive'));
+
+    if (tabName === 'addShipment') {
+        document.getElementById('addShipmentSection').classList.remove('hidden');
+        document.getElementById('addShipmentTab').classList.replace('tab-inactive', 'tab-active');
+        resetForm();
+    } else if (tabName === 'shipmentsList') {
+        document.getElementById('shipmentsListSection').classList.remove('hidden');
+        document.getElementById('shipmentsListTab').classList.replace('tab-inactive', 'tab-active');
+        loadAllShipments();
+    } else if (tabName === 'trackingUpdate') {
+        document.getElementById('trackingUpdateSection').classList.remove('hidden');
+        document.getElementById('trackingUpdateTab').classList.replace('tab-inactive', 'tab-active');
+    }
+}
+
+async function startEditShipment(id) {
+    if (!isAuthenticated) {
+        showModal('لا يوجد تصريح', 'يجب تسجيل الدخول كمسؤول للوصول إلى هذه الميزة.');
+        return;
+    }
+
+    showLoading();
+    try {
+        const response = await fetch(`${API_BASE_URL}/${id}`);
+        if (!response.ok) {
+            hideLoading();
+            showModal('خطأ', 'لم يتم العثور على الشحنة.');
+            return;
+        }
+        const shipment = await response.json();
+
+        // الانتقال إلى واجهة إضافة/تعديل الشحنة
+        showAdminTab('addShipment');
+
+        // ملء حقول النموذج ببيانات الشحنة
+        document.getElementById('shipmentId').value = shipment.id;
+        document.getElementById('formTitle').textContent = 'تعديل الشحنة';
+        document.getElementById('saveButton').textContent = 'حفظ التعديلات';
+
+        // ملء بيانات الشحنة الرئيسية
+        document.getElementById('shipmentNumber').value = shipment.shipmentNumber;
+        document.getElementById('invoiceNumber').value = shipment.invoiceNumber;
+        document.getElementById('shipmentDate').value = shipment.date;
+        document.getElementById('shipmentTime').value = shipment.time;
+        document.getElementById('branch').value = shipment.branch;
+        document.getElementById('shippingType').value = shipment.shippingType;
+
+        // ملء معلومات المرسل
+        document.getElementById('senderName').value = shipment.sender.name;
+        const senderCountryOption = Array.from(document.getElementById('senderCountry').options).find(option => option.textContent === shipment.sender.country);
+        if (senderCountryOption) {
+            document.getElementById('senderCountry').value = senderCountryOption.value;
+        }
+        updateCountryCode('sender'); 
+
+        const senderPhoneParts = (shipment.sender.phone || '').split(' ');
+        document.getElementById('senderCountryCode').value = senderPhoneParts[0] || '';
+        document.getElementById('senderPhone').value = senderPhoneParts.slice(1).join('') || '';
+
+        if (shipment.sender.city && document.getElementById('senderCity').options.length > 1) {
+            document.getElementById('senderCity').value = shipment.sender.city;
+        }
+        document.getElementById('senderAddress').value = shipment.sender.address;
+
+        // ملء معلومات المستلم
+        document.getElementById('receiverName').value = shipment.receiver.name;
+        const receiverCountryOption = Array.from(document.getElementById('receiverCountry').options).find(option => option.textContent === shipment.receiver.country);
+        if (receiverCountryOption) {
+            document.getElementById('receiverCountry').value = receiverCountryOption.value;
+        }
+        updateCountryCode('receiver');
+
+        const receiverPhoneParts = (shipment.receiver.phone || '').split(' ');
+        document.getElementById('receiverCountryCode').value = receiverPhoneParts[0] || '';
+        document.getElementById('receiverPhone').value = receiverPhoneParts.slice(1).join('') || '';
+
+        if (shipment.receiver.city && document.getElementById('receiverCity').options.length > 1) {
+            document.getElementById('receiverCity').value = shipment.receiver.city;
+        }
+        document.getElementById('receiverAddress').value = shipment.receiver.address;
+
+        // ملء تفاصيل الدفع والخدمات الإضافية
+        document.getElementById('paymentMethod').value = shipment.paymentMethod;
+        document.getElementById('insurance').checked = shipment.insurance == 1;
+        toggleInsurance();
+        if (document.getElementById('insurance').checked) {
+            document.getElementById('insuranceCost').value = shipment.insuranceCost;
+        }
+
+        document.getElementById('packaging').checked = shipment.packaging == 1;
+        togglePackaging();
+        if (document.getElementById('packaging').checked) {
+            document.getElementById('packagingCost').value = shipment.packagingCost;
+        }
+
+        // ملء تفاصيل الطرد
+        document.getElementById('quantity').value = shipment.quantity;
+        document.getElementById('unitPrice').value = shipment.unitPrice;
+        document.getElementById('weight').value = shipment.weight;
+        document.getElementById('itemType').value = shipment.itemType;
+        document.getElementById('contents').value = shipment.contents;
+        document.getElementById('currency').value = shipment.currency;
+
+        calculateTotal();
+    } catch (error) {
+        console.error("Error fetching shipment details:", error);
+        showModal('خطأ', 'حدث خطأ أثناء جلب بيانات الشحنة.');
+    } finally {
+        hideLoading();
+    }
+}
+
+async function searchAndFilter() {
+    showLoading();
+    const searchTerm = document.getElementById('searchInput').value;
+    try {
+        const response = await fetch(`${API_BASE_URL}/search`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ query: searchTerm })
+        });
+        const shipments = await response.json();
+        hasMoreShipments = false;
+        document.getElementById('shipmentsListSentinel').classList.add('hidden');
+        displayShipments(shipments);
+    } catch (error) {
+        console.error("Error searching shipments:", error);
+        showModal('خطأ', 'حدث خطأ أثناء البحث عن الشحنات.');
+    } finally {
+        hideLoading();
+    }
+}
+
+function clearSearchAndLoad() {
+    document.getElementById('searchInput').value = '';
+    ['filterStatus', 'filterBranch', 'filterDateFrom', 'filterDateTo'].forEach(id => {
+        document.getElementById(id).value = '';
+    });
+    document.getElementById('shipmentsSort').value = '-id';
+    loadAllShipments();
+}
+
+async function fetchShipment(id) {
+    const response = await fetch(`${API_BASE_URL}/${id}`);
+    if (!response.ok) {
+        return null;
+    }
+    return await response.json();
+}
+
+async function sendWhatsAppForShipment(shipmentId) {
+    const shipment = await fetchShipment(shipmentId);
+    if (shipment) {
+        sendWhatsApp(shipment);
+    }
+}
+
+async function searchForTracking() {
+    showLoading();
+    const searchTerm = document.getElementById('trackingSearchInput').value;
+    if (!searchTerm) {
+        showModal('بيانات ناقصة', 'يرجى إدخال رقم الشحنة أو رقم الفاتورة');
+        hideLoading();
+        return;
+    }
+
+    try {
+        const response = await fetch(`${API_BASE_URL}/search`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ query: searchTerm })
+        });
+        const shipments = await response.json();
+
+        if (shipments.length === 0) {
+            showModal('لا توجد نتائج', 'لم يتم العثور على شحنات.');
+            return;
+        }
+
+        displayTrackingResults(shipments);
+    } catch (error) {
+        console.error("Error searching for tracking:", error);
+        showModal('خطأ', 'حدث خطأ أثناء البحث.');
+    } finally {
+        hideLoading();
+    }
+}
+
+function displayTrackingResults(shipments) {
+    const resultsDiv = document.getElementById('trackingResults');
+    const listDiv = document.getElementById('trackingShipmentsList');
+
+    listDiv.innerHTML = '';
+
+    shipments.forEach(shipment => {
+        const div = document.createElement('div');
+        div.className = 'bg-gray-50 p-4 rounded-lg mb-3 shadow-sm';
+        div.innerHTML = `
+            <label class="flex items-center space-x-3 space-x-reverse">
+                <input type="checkbox" class="tracking-checkbox w-5 h-5 text-brako-blue rounded-md" data-id="${shipment.id}">
+                <div class="flex-1">
+                    <div class="font-semibold">رقم الشحنة: ${shipment.shipmentNumber}</div>
+                    <div class="text-sm text-gray-600">المرسل: ${shipment.sender.name} - المستلم: ${shipment.receiver.name}</div>
+                    <div class="text-sm text-gray-600">الحالة الحالية: <span class="${getStatusColor(shipment.status)} px-2 py-0.5 rounded-full text-xs">${getStatusText(shipment.status || 'received')}</span></div>
+                </div>
+            </label>
+        `;
+        listDiv.appendChild(div);
+    });
+
+    resultsDiv.classList.remove('hidden');
+}
+
+function toggleAllCheckboxes() {
+    const isChecked = document.getElementById('selectAllCheckboxes').checked;
+    document.querySelectorAll('.export-checkbox').forEach(checkbox => {
+        checkbox.checked = isChecked;
+    });
+}
+
+function toggleSelectAllTracking() {
+    const selectAll = document.getElementById('selectAllTracking');
+    const checkboxes = document.querySelectorAll('.tracking-checkbox');
+
+    checkboxes.forEach(checkbox => {
+        checkbox.checked = selectAll.checked;
+    });
+}
+
+async function updateSelectedStatuses() {
+    const checkboxes = document.querySelectorAll('.tracking-checkbox:checked');
+    if (checkboxes.length === 0) {
+        showModal('تحديد شحنات', 'يرجى تحديد شحنة واحدة على الأقل.');
+        return;
+    }
+    if (!isAuthenticated) {
+        showModal('خطأ', 'يجب أن تكون مسؤولًا لتحديث الحالة.');
+        return;
+    }
+    showLoading();
+    const selectedIds = Array.from(checkboxes).map(cb => parseInt(cb.getAttribute('data-id')));
+    const newStatus = document.getElementById('newStatus').value;
+    const currentCity = document.getElementById('currentCity').value;
+    const statusNotes = document.getElementById('statusNotes').value;
+
+    const now = new Date();
+    const payload = {
+        selectedIds: selectedIds,
+        newStatus: newStatus,
+        currentCity: currentCity,
+        statusNotes: statusNotes,
+        date: now.toISOString().split('T')[0],
+        time: now.toTimeString().split(' ')[0].substring(0, 5)
+    };
+
+    try {
+        const response = await fetch(`${API_BASE_URL}/update_status`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(payload)
+        });
+
+        if (response.ok) {
+            const result = await response.json();
+            showModal('نجاح', `تم تحديث حالة ${result.matched} شحنة بنجاح.`);
+            document.getElementById('trackingResults').classList.add('hidden');
+            document.getElementById('trackingSearchInput').value = '';
+            loadAllShipments();
+        } else {
+            const error = await response.json();
+            showModal('خطأ', error.error || 'حدث خطأ أثناء التحديث.');
+        }
+    } catch (error) {
+        console.error("Error updating statuses:", error);
+        showModal('خطأ', 'حدث خطأ أثناء التحديث.');
+    } finally {
+        hideLoading();
+    }
+}
+
+function getStatusText(status) {
+    return statusTexts[status] || 'غير محدد';
+}
+
+async function trackShipment(trackingCode) {
+    showLoading();
+    trackingCode = trackingCode || document.getElementById('trackingCodeInput').value;
+    if (!trackingCode) {
+        showModal('بيانات ناقصة', 'يرجى إدخال كود التتبع');
+        hideLoading();
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/track/${encodeURIComponent(trackingCode.trim())}`);
+
+        if (!response.ok) {
+            showModal('خطأ', 'كود التتبع غير صحيح.');
+            return;
+        }
+
+        const shipment = await response.json();
+        displayTrackingInfo(shipment);
+        watchTracking(shipment.trackingCode);
+    } catch (error) {
+        console.error("Error tracking shipment:", error);
+        showModal('خطأ', 'حدث خطأ أثناء تتبع الشحنة.');
+    } finally {
+        hideLoading();
+    }
+}
+
+// يحدّث معلومات التتبع المعروضة فور تغير حالة الشحنة، دون إعادة البحث يدويًا
+function watchTracking(trackingCode) {
+    if (trackingEvents) {
+        trackingEvents.close();
+    }
+    trackingEvents = new EventSource(`/api/events?trackingCode=${encodeURIComponent(trackingCode)}`);
+    trackingEvents.addEventListener('tracking', event => {
+        const change = JSON.parse(event.data);
+        if (change.op === 'upsert') {
+            displayTrackingInfo(change.tracking);
+        } else {
+            trackingEvents.close();
+            trackingEvents = null;
+        }
+    });
+    // فاتت الاتصال أحداث أثناء انقطاعه: تُجلب الحالة الحالية مرة واحدة
+    trackingEvents.addEventListener('resync', async () => {
+        const response = await fetch(`/api/track/${encodeURIComponent(trackingCode)}`);
+        if (response.ok) {
+            displayTrackingInfo(await response.json());
+        }
+    });
+}
+
+function displayTrackingInfo(shipment) {
+    const resultDiv = document.getElementById('trackingResult');
+
+    const statusHistoryHTML = shipment.statusHistory.length > 0 ? shipment.statusHistory.map(status => `
+        <div class="flex items-start mb-4 relative pr-8">
+            <div class="absolute right-0 w-8 h-8 flex items-center justify-center rounded-full bg-brako-blue text-white z-10">
+                <svg xmlns="http://www.w3.org/2000/svg" class="h-5 w-5" viewBox="0 0 20 20" fill="currentColor">
+                    <path fill-rule="evenodd" d="M10 18a8 8 0 100-16 8 8 0 000 16zm1-11a1 1 0 10-2 0v4a1 1 0 00.293.707l2.828 2.829a1 1 0 101.415-1.415L11 10.586V7z" clip-rule="evenodd" />
+                </svg>
+            </div>
+            <div class="flex-1 bg-gray-50 p-4 rounded-lg shadow-sm">
+                <div class="font-bold text-lg text-brako-blue">${getStatusText(status.status)}</div>
+                <div class="text-sm text-gray-600">${status.date} - ${status.time}</div>
+                ${status.city ? `<div class="text-sm text-gray-600">المدينة: ${status.city}</div>` : ''}
+                ${status.notes ? `<div class="text-sm text-gray-600">ملاحظات: ${status.notes}</div>` : ''}
+            </div>
+        </div>
+    `).join('') : '<div class="text-center text-gray-500 p-4">لا توجد تحديثات للحالة</div>';
+
+    resultDiv.innerHTML = `
+        <div class="border-t pt-6">
+            <div class="bg-brako-blue text-white p-4 rounded-lg mb-6 shadow-md text-center">
+                <h4 class="text-xl font-semibold mb-2">معلومات الشحنة</h4>
+                <p class="text-2xl font-bold">كود التتبع: ${shipment.trackingCode}</p>
+            </div>
+
+            <div class="grid md:grid-cols-2 gap-4 mb-6 text-gray-700">
+                <div class="bg-gray-100 p-4 rounded-lg">
+                    <strong>الوزن:</strong> ${shipment.weight} كغ
+                </div>
+                <div class="bg-gray-100 p-4 rounded-lg">
+                    <strong>المحتويات:</strong> ${shipment.contents}
+                </div>
+            </div>
+
+            <h4 class="text-2xl font-bold text-brako-blue mb-4 text-center mt-8">حالة التتبع</h4>
+            <div class="space-y-6">
+                ${statusHistoryHTML}
+            </div>
+        </div>
+        `;
+
+    resultDiv.classList.remove('hidden');
+}
+
+async function saveShipment() {
+    if (!isAuthenticated) {
+        showModal('خطأ', 'يجب أن تكون مسؤولًا لحفظ شحنة.');
+        return;
+    }
+    showLoading();
+    const shipmentNumber = document.getElementById('shipmentNumber').value;
+    const senderName = document.getElementById('senderName').value;
+    const receiverName = document.getElementById('receiverName').value;
+    const branch = document.getElementById('branch').value;
+    const shipmentId = document.getElementById('shipmentId').value;
+
+    if (!shipmentNumber || !senderName || !receiverName || !branch) {
+        showModal('بيانات ناقصة', 'يرجى ملء البيانات الأساسية (رقم الشحنة، اسم المرسل، اسم المستلم، والفرع)');
+        hideLoading();
+        return;
+    }
+
+    const currency = document.getElementById('currency').value;
+    const now = new Date();
+    const payload = {
+        shipmentNumber: shipmentNumber,
+        invoiceNumber: document.getElementById('invoiceNumber').value,
+        date: document.getElementById('shipmentDate').value,
+        time: document.getElementById('shipmentTime').value,
+        branch: branch,
+        shippingType: document.getElementById('shippingType').value,
+        sender: {
+            name: senderName,
+            phone: document.getElementById('senderCountryCode').value + ' ' + document.getElementById('senderPhone').value,
+            country: document.getElementById('senderCountry').options[document.getElementById('senderCountry').selectedIndex].text,
+            city: document.getElementById('senderCity').value,
+            address: document.getElementById('senderAddress').value
+        },
+        receiver: {
+            name: receiverName,
+            phone: document.getElementById('receiverCountryCode').value + ' ' + document.getElementById('receiverPhone').value,
+            country: document.getElementById('receiverCountry').options[document.getElementById('receiverCountry').selectedIndex].text,
+            city: document.getElementById('receiverCity').value,
+            address: document.getElementById('receiverAddress').value
+        },
+        paymentMethod: document.getElementById('paymentMethod').value,
+        insurance: document.getElementById('insurance').checked,
+        insuranceCost: document.getElementById('insuranceCost').value || '0',
+        packaging: document.getElementById('packaging').checked,
+        packagingCost: document.getElementById('packagingCost').value || '0',
+        quantity: document.getElementById('quantity').value,
+        unitPrice: document.getElementById('unitPrice').value,
+        weight: document.getElementById('weight').value,
+        itemType: document.getElementById('itemType').value,
+        contents: document.getElementById('contents').value,
+        finalPrice: document.getElementById('finalPrice').textContent,
+        currency: currency,
+        status: 'received',
+        statusHistory: [{
+            status: 'received',
+            city: '',
+            notes: 'تم استلام الشحنة في المركز',
+            date: now.toISOString().split('T')[0],
+            time: now.toTimeString().split(' ')[0].substring(0, 5)
+        }]
+    };
+
+    try {
+        let response;
+        if (shipmentId) {
+            payload.id = parseInt(shipmentId);
+            response = await fetch(`${API_BASE_URL}/${shipmentId}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload)
+            });
+        } else {
+            response = await fetch(API_BASE_URL, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload)
+            });
+        }
+
+        if (response.ok) {
+            const savedShipment = await response.json();
+            showPostSaveModal(savedShipment);
+            loadAllShipments();
+        } else {
+            const error = await response.json();
+            showModal('خطأ', error.error || 'حدث خطأ أثناء الحفظ.');
+        }
+    } catch (error) {
+        console.error("Error saving shipment:", error);
+        showModal('خطأ', 'حدث خطأ أثناء الاتصال بالخادم.');
+    } finally {
+        hideLoading();
+    }
+}
+
+async function exportFilteredShipmentsToExcel() {
+    if (!isAuthenticated) {
+        showModal('خطأ', 'يجب أن تكون مسؤولًا لتصدير البيانات.');
+        return;
+    }
+    const checkboxes = document.querySelectorAll('.export-checkbox:checked');
+    const filters = Object.fromEntries(currentShipmentFilters());
+
+    // بدون تحديد تُصدَّر كل الشحنات المطابقة للمرشحات الحالية
+    if (checkboxes.length === 0 && Object.keys(filters).length === 0) {
+        showModal('لا توجد شحنات', 'يرجى تحديد شحنة واحدة على الأقل أو تصفية الجدول لتصديرها.');
+        return;
+    }
+
+    const selectedIds = Array.from(checkboxes).map(cb => parseInt(cb.getAttribute('data-id')));
+    const exportRequest = selectedIds.length > 0 ? { ids: selectedIds } : { filter: filters };
+
+    showModal('جارٍ التصدير', 'يتم الآن توليد ملف Excel. يرجى الانتظار...', false);
+
+    const url = '/api/shipments/export_excel';
+    try {
+        // يقرأ الخادم الشحنات المحددة مباشرة من قاعدة البيانات
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(exportRequest)
+        });
+
+        if (response.ok) {
+            const blob = await response.blob();
+            const excelUrl = URL.createObjectURL(blob);
+
+            const a = document.createElement('a');
+            a.href = excelUrl;
+            a.download = 'shipment_report.xlsx';
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            URL.revokeObjectURL(excelUrl);
+            hideModal();
+        } else {
+            const error = await response.json();
+            hideModal();
+            showModal('خطأ', error.error || 'فشل في توليد ملف Excel. يرجى المحاولة مرة أخرى.');
+        }
+    } catch (error) {
+        console.error("Error generating Excel:", error);
+        hideModal();
+        showModal('خطأ', 'حدث خطأ غير متوقع أثناء توليد الملف.');
+    }
+}
+
+async function printToNewWindow(shipmentsToPrint, copies = 1) {
+    if (!isAuthenticated) {
+        showModal('خطأ', 'يجب أن تكون مسؤولًا للطباعة.');
+        return;
+    }
+    const printWindow = window.open('', '_blank');
+    if (!printWindow) {
+        showModal('خطأ', 'تم حظر النوافذ المنبثقة. يرجى السماح بها لإجراء الطباعة.');
+        return;
+    }
+
+    try {
+        const url = '/api/shipments/generate_a4_print_html';
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ids: shipmentsToPrint.map(shipment => shipment.id), copies: copies })
+        });
+
+        if (response.ok) {
+            const htmlContent = await response.text();
+            printWindow.document.open();
+            printWindow.document.write(htmlContent);
+            printWindow.document.close();
+            printWindow.onload = () => {
+                printWindow.print();
+            };
+        } else {
+            const error = await response.json();
+            showModal('خطأ', error.error || 'فشل في توليد صفحة الطباعة.');
+            printWindow.close();
+        }
+    } catch (error) {
+        console.error("Error generating print HTML:", error);
+        showModal('خطأ', 'حدث خطأ غير متوقع أثناء الطباعة.');
+        printWindow.close();
+    }
+}
+
+async function printA4ForShipment(shipmentId) {
+     const shipment = await fetchShipment(shipmentId);
+     if (shipment) {
+         showPrintCopiesModal([shipment]);
+     } else {
+         showModal('خطأ', 'لم يتم العثور على الشحنة.');
+     }
+}
+
+async function handleAdminLogin() {
+    showLoading();
+    const username = document.getElementById('adminUsername').value;
+    const password = document.getElementById('adminPassword').value;
+
+    try {
+        const response = await fetch('/api/login', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username, password })
+        });
+        const data = await response.json();
+
+        if (data.success) {
+            isAuthenticated = true;
+            document.getElementById('adminLoginSection').classList.add('hidden');
+            document.getElementById('adminPanelContent').classList.remove('hidden');
+            document.getElementById('logoutButton').classList.remove('hidden');
+            document.getElementById('adminButton').classList.add('hidden');
+            showAdminTab('addShipment');
+        } else {
+            showModal('فشل', 'اسم المستخدم أو كلمة المرور غير صحيح.');
+        }
+    } catch (error) {
+        console.error('Error during login:', error);
+        showModal('خطأ', 'حدث خطأ أثناء الاتصال بالخادم.');
+    } finally {
+        hideLoading();
+    }
+}
+
+async function viewShipmentDetails(id) {
+    if (!isAuthenticated) {
+        showModal('خطأ', 'يجب أن تكون مسؤولًا لعرض التفاصيل.');
+        return;
+    }
+    showLoading();
+    try {
+        const response = await fetch(`${API_BASE_URL}/${id}`);
+        if (!response.ok) {
+            showModal('خطأ', 'لم يتم العثور على الشحنة');
+            return;
+        }
+        const shipment = await response.json();
+
+        window.currentShipmentId = id;
+
+        const content = document.getElementById('shipmentDetailsContent');
+        const statusHistoryHTML = shipment.statusHistory.length > 0 ? shipment.statusHistory.map(status => `
+            <div class="flex justify-between items-center p-3 bg-gray-50 rounded-lg shadow-sm">
+                <div>
+                    <div class="font-semibold">${getStatusText(status.status)}</div>
+                    ${status.city ? `<div class="text-sm text-gray-600">المدينة: ${status.city}</div>` : ''}
+                    ${status.notes ? `<div class="text-sm text-gray-600">ملاحظات: ${status.notes}</div>` : ''}
+                </div>
+                <div class="text-sm text-gray-500">
+                    ${status.date} - ${status.time}
+                </div>
+            </div>
+        `).join('') : '<div class="text-center text-gray-500 p-4">لا توجد تحديثات للحالة</div>';
+
+        content.innerHTML = `
+            <div class="grid md:grid-cols-2 gap-8">
+                <div class="space-y-6">
+                    <div class="bg-brako-blue text-white p-4 rounded-lg shadow-md">
+                        <h3 class="text-lg font-bold mb-2">معلومات الشحنة</h3>
+                        <div class="space-y-2 text-sm">
+                            <div><strong>رقم الشحنة:</strong> ${shipment.shipmentNumber}</div>
+                            <div><strong>رقم الفاتورة:</strong> ${shipment.invoiceNumber}</div>
+                            <div><strong>كود التتبع:</strong> ${shipment.trackingCode || 'غير محدد'}</div>
+                            <div><strong>التاريخ:</strong> ${shipment.date} - ${shipment.time}</div>
+                            <div><strong>الفرع:</strong> ${shipment.branch === 'topeka' ? 'توبيكا' : 'براكو'}</div>
+                            <div><strong>نوع الشحن:</strong> ${shipment.shippingType === 'local' ? 'محلي' : 'دولي'}</div>
+                        </div>
+                    </div>
+
+                    <div class="bg-brako-teal text-white p-4 rounded-lg shadow-md">
+                        <h3 class="text-lg font-bold mb-2">معلومات المرسل</h3>
+                        <div class="space-y-2 text-sm">
+                            <div><strong>الاسم:</strong> ${shipment.sender.name}</div>
+                            <div><strong>الهاتف:</strong> ${shipment.sender.phone}</div>
+                            <div><strong>الدولة:</strong> ${shipment.sender.country}</div>
+                            <div><strong>المدينة:</strong> ${shipment.sender.city || 'غير محدد'}</div>
+                            <div><strong>العنوان:</strong> ${shipment.sender.address}</div>
+                        </div>
+                    </div>
+                </div>
+
+                <div class="space-y-6">
+                    <div class="bg-brako-yellow text-white p-4 rounded-lg shadow-md">
+                        <h3 class="text-lg font-bold mb-2">معلومات المستلم</h3>
+                        <div class="space-y-2 text-sm">
+                            <div><strong>الاسم:</strong> ${shipment.receiver.name}</div>
+                            <div><strong>الهاتف:</strong> ${shipment.receiver.phone}</div>
+                            <div><strong>الدولة:</strong> ${shipment.receiver.country}</div>
+                            <div><strong>المدينة:</strong> ${shipment.receiver.city || 'غير محدد'}</div>
+                            <div><strong>العنوان:</strong> ${shipment.receiver.address}</div>
+                        </div>
+                    </div>
+
+                    <div class="bg-gray-100 p-4 rounded-lg shadow-md">
+                        <h3 class="text-lg font-bold mb-2 text-brako-dark">تفاصيل الطرد</h3>
+                        <div class="space-y-2 text-sm text-gray-700">
+                            <div><strong>الوزن:</strong> ${shipment.weight} كغ</div>
+                            <div><strong>العدد:</strong> ${shipment.quantity}</div>
+                            <div><strong>نوع البضاعة:</strong> ${shipment.itemType}</div>
+                            <div><strong>المحتويات:</strong> ${shipment.contents}</div>
+                            <div><strong>السعر النهائي:</strong> ${shipment.finalPrice} ${shipment.currency || 'USD'}</div>
+                            <div><strong>طريقة الدفع:</strong> ${shipment.paymentMethod === 'prepaid' ? 'دفع مقدم' : 'دفع عكسي'}</div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+
+            <div class="mt-8 bg-white border-2 border-brako-blue rounded-lg p-6 shadow-sm">
+                <h3 class="text-xl font-bold text-brako-blue mb-4">حالة التتبع</h3>
+                <div class="space-y-3">
+                    ${statusHistoryHTML}
+                </div>
+            </div>
+        `;
+
+        document.getElementById('printDetailsBtn').onclick = () => printA4ForShipment(shipment.id);
+        document.getElementById('whatsappDetailsBtn').onclick = () => sendWhatsApp(shipment);
+        document.getElementById('deleteDetailsBtn').onclick = () => confirmDelete(shipment.id);
+
+        showSection('shipmentDetails');
+    } catch (error) {
+        console.error("Error viewing shipment details:", error);
+        showModal('خطأ', 'حدث خطأ أثناء عرض التفاصيل.');
+    } finally {
+        hideLoading();
+    }
+}
+
+function confirmDelete(id) {
+    window.currentDeleteId = id;
+    showModal('تأكيد الحذف', 'هل أنت متأكد من حذف هذه الشحنة؟ لا يمكن التراجع عن هذا الإجراء.', true, deleteShipment);
+}
+
+async function deleteShipment() {
+    if (!isAuthenticated) {
+        showModal('خطأ', 'يجب أن تكون مسؤولًا للحذف.');
+        return;
+    }
+    const id = window.currentDeleteId;
+    if (id === undefined) return;
+    showLoading();
+    try {
+        const response = await fetch(`${API_BASE_URL}/${id}`, {
+            method: 'DELETE'
+        });
+
+        if (response.ok) {
+            showModal('نجاح', 'تم حذف الشحنة بنجاح.');
+            showSection('admin');
+            showAdminTab('shipmentsList');
+        } else {
+            showModal('خطأ', 'حدث خطأ أثناء الحذف.');
+        }
+    } catch (error) {
+        console.error("Error deleting shipment:", error);
+        showModal('خطأ', 'حدث خطأ أثناء الحذف.');
+    } finally {
+        hideLoading();
+    }
+}
+
+function resetForm() {
+    document.getElementById('shipmentId').value = '';
+    document.getElementById('formTitle').textContent = 'إضافة شحنة جديدة';
+    document.getElementById('saveButton').textContent = 'حفظ الشحنة';
+
+    document.querySelector('#addShipmentSection form').reset();
+    document.getElementById('insuranceDetails').classList.add('hidden');
+    document.getElementById('packagingDetails').classList.add('hidden');
+    document.getElementById('insuranceCost').value = '';
+    document.getElementById('packagingCost').value = '';
+    calculateTotal();
+
+    const now = new Date();
+    document.getElementById('shipmentDate').value = now.toISOString().split('T')[0];
+    document.getElementById('shipmentTime').value = now.toTimeString().split(' ')[0].substring(0, 5);
+}
+
+async function loadAllShipments() {
+    allShipments = [];
+    nextShipmentsCursor = null;
+    hasMoreShipments = false;
+    showLoading();
+    updateStatistics();
+    loadShipmentFacets();
+    try {
+        await loadNextShipmentsPage();
+    } finally {
+        hideLoading();
+    }
+}
+
+// مرشحات جدول الشحنات الحالية كمعاملات رابط؛ تُنفذ التصفية في الخادم
+function currentShipmentFilters() {
+    const params = new URLSearchParams();
+    const filters = {
+        status: document.getElementById('filterStatus').value,
+        branch: document.getElementById('filterBranch').value,
+        dateFrom: document.getElementById('filterDateFrom').value,
+        dateTo: document.getElementById('filterDateTo').value
+    };
+    Object.entries(filters).forEach(([name, value]) => {
+        if (value) params.set(name, value);
+    });
+    return params;
+}
+
+function applyShipmentFilters() {
+    loadAllShipments();
+}
+
+function fillFacetOptions(selectId, counts, texts, allText) {
+    const select = document.getElementById(selectId);
+    const selected = select.value;
+    select.innerHTML = '';
+    select.add(new Option(allText, ''));
+    Object.keys(texts).forEach(value => {
+        select.add(new Option(`${texts[value]} (${counts[value] || 0})`, value));
+    });
+    select.value = selected;
+}
+
+// أعداد الشحنات حسب الحالة والفرع للمرشح الحالي
+async function loadShipmentFacets() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/facets?${currentShipmentFilters()}`);
+        if (!response.ok) return;
+        const facets = await response.json();
+        fillFacetOptions('filterStatus', facets.status, statusTexts, 'كل الحالات');
+        fillFacetOptions('filterBranch', facets.branch, branchTexts, 'كل الفروع');
+        document.getElementById('shipmentsTotal').textContent = `${facets.total} شحنة`;
+    } catch (error) {
+        console.error("Error loading facets:", error);
+    }
+}
+
+async function loadNextShipmentsPage() {
+    if (isLoadingShipmentsPage) return;
+    isLoadingShipmentsPage = true;
+    try {
+        const params = currentShipmentFilters();
+        params.set('limit', SHIPMENTS_PAGE_SIZE);
+        params.set('fields', SHIPMENTS_LIST_FIELDS);
+        params.set('sort', document.getElementById('shipmentsSort').value);
+        if (nextShipmentsCursor !== null) {
+            params.set('cursor', nextShipmentsCursor);
+        }
+        const response = await fetch(`${API_BASE_URL}?${params}`);
+        if (!response.ok) {
+            showModal('خطأ', 'فشل في تحميل الشحنات.');
+            return;
+        }
+        const page = await response.json();
+        const isFirstPage = nextShipmentsCursor === null;
+        nextShipmentsCursor = response.headers.get('X-Next-Cursor');
+        hasMoreShipments = nextShipmentsCursor !== null;
+        allShipments = allShipments.concat(page);
+        displayShipments(page, !isFirstPage);
+    } catch (error) {
+        console.error("Error loading shipments:", error);
+        showModal('خطأ', 'حدث خطأ أثناء تحميل الشحنات.');
+    } finally {
+        isLoadingShipmentsPage = false;
+        document.getElementById('shipmentsListSentinel').classList.toggle('hidden', !hasMoreShipments);
+    }
+}
+
+function displayShipments(shipments, append = false) {
+    const tableBody = document.getElementById('shipmentsTableBody');
+
+    if (!append) {
+        if (shipments.length === 0) {
+            tableBody.innerHTML = '<tr><td colspan="11" class="text-center p-8 text-gray-500">لا توجد شحنات مسجلة</td></tr>';
+            return;
+        }
+        tableBody.innerHTML = '';
+    }
+    const offset = tableBody.rows.length;
+
+    shipments.forEach((shipment, rowIndex) => {
+        tableBody.appendChild(renderShipmentRow(shipment, offset + rowIndex));
+    });
+}
+
+function renderShipmentRow(shipment, index) {
+    const row = document.createElement('tr');
+    row.dataset.shipmentId = shipment.id;
+    row.className = index % 2 === 0 ? 'bg-gray-50 hover:bg-gray-200 transition-colors' : 'bg-white hover:bg-gray-200 transition-colors';
+
+    row.ondblclick = () => viewShipmentDetails(shipment.id);
+
+    const amountText = shipment.paymentMethod === 'cod' ? `${shipment.finalPrice} ${shipment.currency || 'USD'}` : '---';
+
+    row.innerHTML = `
+        <td class="border border-gray-300 p-3">
+            <input type="checkbox" class="export-checkbox w-4 h-4 text-brako-blue rounded-md" data-id="${shipment.id}">
+        </td>
+        <td class="border border-gray-300 p-3">${shipment.shipmentNumber}</td>
+        <td class="border border-gray-300 p-3">${shipment.trackingCode || 'غير محدد'}</td>
+        <td class="border border-gray-300 p-3">${shipment.sender.name}</td>
+        <td class="border border-gray-300 p-3">${shipment.receiver.name}</td>
+        <td class="border border-gray-300 p-3">${shipment.receiver.phone}</td>
+        <td class="border border-gray-300 p-3">${shipment.quantity}</td>
+        <td class="border border-gray-300 p-3">${shipment.weight} كغ</td>
+        <td class="border border-gray-300 p-3">${amountText}</td>
+        <td class="border border-gray-300 p-3">
+            <span class="px-2 py-1 rounded-full text-xs font-semibold ${getStatusColor(shipment.status)}">
+                ${getStatusText(shipment.status)}
+            </span>
+        </td>
+        <td class="border border-gray-300 p-3 flex flex-wrap gap-2 justify-center">
+            <button onclick="viewShipmentDetails(${shipment.id})" class="bg-brako-teal text-white px-3 py-1 rounded-full text-sm hover:bg-teal-700 transition-colors">عرض</button>
+            <button onclick="startEditShipment(${shipment.id})" class="bg-brako-yellow text-brako-dark px-3 py-1 rounded-full text-sm hover:bg-yellow-300 transition-colors">تعديل</button>
+            <button onclick="sendWhatsAppForShipment(${shipment.id})" class="bg-green-500 text-white px-3 py-1 rounded-full text-sm hover:bg-green-600 transition-colors">📱</button>
+            <button onclick="printA4ForShipment(${shipment.id})" class="bg-brako-blue text-white px-3 py-1 rounded-full text-sm hover:bg-blue-700 transition-colors">🖨️</button>
+            <button onclick="confirmDelete(${shipment.id})" class="bg-red-500 text-white px-3 py-1 rounded-full text-sm hover:bg-red-700 transition-colors">حذف</button>
+        </td>
+    `;
+
+    return row;
+}
+
+// يفتح اتصال أحداث الشحنات للوحة الإدارة؛ يعيد المتصفح الاتصال تلقائيًا إذا انقطع
+function connectShipmentEvents() {
+    if (shipmentEvents) return;
+    let failed = false;
+    shipmentEvents = new EventSource('/api/events');
+    shipmentEvents.addEventListener('shipment', event => applyShipmentEvent(JSON.parse(event.data)));
+    // تغيير جماعي أو أحداث فاتت الاتصال: يُعاد تحميل القائمة بدل تطبيق التغييرات واحدًا واحدًا
+    shipmentEvents.addEventListener('resync', () => loadAllShipments());
+    shipmentEvents.addEventListener('open', () => {
+        // اتصال عاد بعد رفض الخادم له (503 عند بلوغ حد الاتصالات): قد تكون فاتته تغييرات
+        if (failed) loadAllShipments();
+        failed = false;
+    });
+    shipmentEvents.addEventListener('error', () => {
+        failed = true;
+        // لا يعيد المتصفح المحاولة بعد رد غير 200، فيُعاد فتح الاتصال بعد مهلة
+        if (shipmentEvents.readyState === EventSource.CLOSED) {
+            shipmentEvents = null;
+            clearTimeout(shipmentEventsRetryTimer);
+            shipmentEventsRetryTimer = setTimeout(() => {
+                if (isAuthenticated) connectShipmentEvents();
+            }, 15000);
+        }
+    });
+}
+
+// العرض الافتراضي (الأحدث أولًا دون مرشحات) تُضاف إليه الشحنات الجديدة في أعلى الجدول مباشرة
+function isDefaultShipmentsView() {
+    return document.getElementById('shipmentsSort').value === '-id' && currentShipmentFilters().toString() === '';
+}
+
+function restripeShipmentRows() {
+    Array.from(document.getElementById('shipmentsTableBody').rows).forEach((row, index) => {
+        row.classList.toggle('bg-gray-50', index % 2 === 0);
+        row.classList.toggle('bg-white', index % 2 !== 0);
+    });
+}
+
+// يطبق تغيير شحنة واحدة على الصف المعروض منها فقط، ويحدّث الإحصاءات والأعداد مرة واحدة لكل مجموعة أحداث
+function applyShipmentEvent(change) {
+    const index = allShipments.findIndex(shipment => shipment.id === change.id);
+    const row = document.querySelector(`#shipmentsTableBody tr[data-shipment-id="${change.id}"]`);
+    if (change.op === 'delete') {
+        if (index !== -1) allShipments.splice(index, 1);
+        if (row) row.remove();
+        restripeShipmentRows();
+    } else if (index !== -1) {
+        allShipments[index] = change.shipment;
+        if (row) {
+            row.replaceWith(renderShipmentRow(change.shipment, row.sectionRowIndex));
+        }
+    } else if (isDefaultShipmentsView()) {
+        // شحنة جديدة أضافها مسؤول آخر؛ أما الأقدم من أول صف فلم تُحمّل صفحتها بعد
+        if (allShipments.length === 0 || change.id > allShipments[0].id) {
+            allShipments.unshift(change.shipment);
+            if (allShipments.length === 1) {
+                displayShipments(allShipments);
+            } else {
+                document.getElementById('shipmentsTableBody').prepend(renderShipmentRow(change.shipment, 0));
+                restripeShipmentRows();
+            }
+        }
+    } else {
+        // لا يُعرف موضع الشحنة في ترتيب أو تصفية أخرى، فتُعاد الصفحة الأولى مرة واحدة لكل مجموعة أحداث
+        shipmentsReloadPending = true;
+    }
+    clearTimeout(shipmentSummaryTimer);
+    shipmentSummaryTimer = setTimeout(() => {
+        if (shipmentsReloadPending) {
+            shipmentsReloadPending = false;
+            loadAllShipments();
+        } else {
+            updateStatistics();
+            loadShipmentFacets();
+        }
+    }, 1000);
+}
+
+function getStatusColor(status) {
+    const colors = {
+        'received': 'bg-blue-100 text-blue-800',
+        'in_sorting': 'bg-indigo-100 text-indigo-800',
+        'local_shipping': 'bg-purple-100 text-purple-800',
+        'departed': 'bg-yellow-100 text-yellow-800',
+        'at_border': 'bg-orange-100 text-orange-800',
+        'in_transit': 'bg-purple-100 text-purple-800',
+        'arrived_city': 'bg-teal-100 text-teal-800',
+        'delayed': 'bg-red-100 text-red-800',
+        'ready_pickup': 'bg-green-100 text-green-800',
+        'returned': 'bg-gray-300 text-gray-800'
+    };
+    return colors[status] || 'bg-gray-100 text-gray-800';
+}
+
+async function updateStatistics() {
+    // تُحسب الإحصاءات في الخادم من جدول تراكمي، فلا تعتمد على الصفحات المحمّلة من الجدول
+    try {
+        const response = await fetch('/api/stats');
+        if (!response.ok) return;
+        const stats = await response.json();
+
+        document.getElementById('totalShipments').textContent = stats.totalShipments;
+        document.getElementById('totalRevenue').textContent = stats.totalRevenue.toFixed(2);
+        document.getElementById('deliveredShipments').textContent = stats.deliveredShipments;
+        document.getElementById('pendingShipments').textContent = stats.pendingShipments;
+    } catch (error) {
+        console.error("Error loading statistics:", error);
+    }
+}
+
+document.addEventListener('DOMContentLoaded', async function() {
+    const now = new Date();
+    document.getElementById('shipmentDate').value = now.toISOString().split('T')[0];
+    document.getElementById('shipmentTime').value = now.toTimeString().split(' ')[0].substring(0, 5);
+
+    // تحميل الصفحة التالية من الشحنات عند وصول المسؤول إلى نهاية الجدول
+    const shipmentsObserver = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting) && hasMoreShipments) {
+            loadNextShipmentsPage();
+        }
+    });
+    shipmentsObserver.observe(document.getElementById('shipmentsListSentinel'));
+
+    const hash = window.location.hash;
+    if (hash.startsWith('#tracking/')) {
+        const trackingCodeFromUrl = hash.substring(hash.indexOf('/') + 1);
+        showSection('customerTracking');
+        document.getElementById('trackingCodeInput').value = trackingCodeFromUrl;
+        trackShipment(trackingCodeFromUrl);
+    } else {
+        showSection('home');
+    }
+});
@@ -0,0 +1,15 @@
+tailwind.config = {
+    theme: {
+        extend: {
+            colors: {
+                'brako-blue': '#1e40af',
+                'brako-yellow': '#fbbf24',
+                'brako-teal': '#14b8a6',
+                'brako-dark': '#0f172a'
+            },
+            fontFamily: {
+                sans: ['Cairo', 'sans-serif'],
+            },
+        },
+    },
+};
@@ -0,0 +1,9 @@
+"""
+نقطة دخول WSGI للإنتاج: تهيئ قاعدة البيانات مرة واحدة عند الاستيراد وتعرض التطبيق باسم application.
+
+الاستخدام:
+    gunicorn -c gunicorn.conf.py
+"""
+from app import create_app
+
+application = create_app()